@@ -3,12 +3,13 @@ FastAPI application for Sathik AI Direction Mode
 """
 
 import asyncio
+import json
 import logging
 from typing import Dict, Any, Optional
 import os
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 
 from api.models import *
@@ -167,6 +168,27 @@ async def process_query(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/query/stream")
+async def stream_query(
+    request: QueryRequest,
+    sathik: SathikAI = Depends(get_sathik_ai)
+):
+    """Stream a Trained Mode answer token by token as server-sent events"""
+    if request.mode.value != "trained":
+        raise HTTPException(status_code=400, detail="Streaming is only available in trained mode")
+    
+    logger.info(f"Streaming query: {request.query[:50]}...")
+    
+    def event_stream():
+        # Sync generator: Starlette iterates it in a worker thread
+        for event in sathik.stream_trained_mode_query(
+            request.query, user_id=request.user_id, submode=request.submode.value
+        ):
+            yield f"data: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/modes", response_model=ModesResponse)
 async def get_available_modes(sathik: SathikAI = Depends(get_sathik_ai)):
     """Get available modes, sub-modes, and formats"""
@@ -60,8 +60,11 @@ class NeuralCoreBenchmarks:
     
     def __init__(self, config: Dict[str, Any]):
         from neural_core.quantum_inspired_neural_core import QuantumInspiredNeuralCore
+        from neural_core.advanced_neural_core import resolve_autocast_dtype
         
         self.device = torch.device('cpu')
+        self.precision = config.get('precision', 'fp32')
+        self.autocast_dtype = resolve_autocast_dtype(self.precision, self.device.type)
         self.neural_core = QuantumInspiredNeuralCore(
             vocab_size=config['vocab_size'],
             d_model=config['d_model'],
@@ -76,22 +79,25 @@ class NeuralCoreBenchmarks:
     def benchmark_forward_pass(self, batch_size: int, seq_len: int, iterations: int = 100) -> Dict[str, Any]:
         """Benchmark forward pass speed"""
         import torch
+        from neural_core.advanced_neural_core import autocast_context
         input_ids = torch.randint(0, 1000, (batch_size, seq_len))
         
-        # Warmup
-        for _ in range(10):
-            _ = self.neural_core(input_ids)
-        
-        # Benchmark
-        start_time = time.time()
-        for _ in range(iterations):
-            output = self.neural_core(input_ids)
-        end_time = time.time()
+        with autocast_context(self.device.type, self.autocast_dtype):
+            # Warmup
+            for _ in range(10):
+                _ = self.neural_core(input_ids)
+            
+            # Benchmark
+            start_time = time.time()
+            for _ in range(iterations):
+                output = self.neural_core(input_ids)
+            end_time = time.time()
         
         duration = end_time - start_time
         tokens_per_second = (batch_size * seq_len * iterations) / duration
         
         return {
+            'precision': self.precision,
             'batch_size': batch_size,
             'seq_len': seq_len,
             'iterations': iterations,
@@ -113,7 +119,8 @@ class NeuralCoreBenchmarks:
                 max_length=output_len,
                 temperature=0.8,
                 top_k=10,
-                top_p=0.9
+                top_p=0.9,
+                autocast_dtype=self.autocast_dtype
             )
         
         # Benchmark
@@ -124,7 +131,8 @@ class NeuralCoreBenchmarks:
                 max_length=output_len,
                 temperature=0.8,
                 top_k=10,
-                top_p=0.9
+                top_p=0.9,
+                autocast_dtype=self.autocast_dtype
             )
         end_time = time.time()
         
@@ -132,6 +140,7 @@ class NeuralCoreBenchmarks:
         tokens_per_second = (batch_size * output_len * iterations) / duration
         
         return {
+            'precision': self.precision,
             'batch_size': batch_size,
             'input_len': input_len,
             'output_len': output_len,
@@ -145,18 +154,21 @@ class NeuralCoreBenchmarks:
         """Benchmark memory usage"""
         import torch
         import tracemalloc
+        from neural_core.advanced_neural_core import autocast_context
         
         tracemalloc.start()
         
         input_ids = torch.randint(0, 1000, (batch_size, seq_len))
         
         # Forward pass
-        output = self.neural_core(input_ids)
+        with autocast_context(self.device.type, self.autocast_dtype):
+            output = self.neural_core(input_ids)
         
         current, peak = tracemalloc.get_traced_memory()
         tracemalloc.stop()
         
         return {
+            'precision': self.precision,
             'batch_size': batch_size,
             'seq_len': seq_len,
             'current_memory_mb': current / 1024 / 1024,
@@ -164,6 +176,68 @@ class NeuralCoreBenchmarks:
         }
 
 
+    def benchmark_int8_quantization(self, batch_size: int, seq_len: int,
+                                    output_len: int, iterations: int = 20) -> Dict[str, Any]:
+        """Compare fp32 and int8 dynamic-quantized cores: size, speed, and logit agreement"""
+        import copy
+        import io
+        import torch
+        from neural_core.quantization import quantize_dynamic_int8
+        
+        def model_size_mb(model):
+            buffer = io.BytesIO()
+            torch.save(model.state_dict(), buffer)
+            return buffer.getbuffer().nbytes / 1024 / 1024
+        
+        def time_forward(model, input_ids):
+            with torch.no_grad():
+                model(input_ids, inference_mode=True)
+                start_time = time.time()
+                for _ in range(iterations):
+                    model(input_ids, inference_mode=True)
+            return time.time() - start_time
+        
+        def time_generation(model, input_ids):
+            model.generate(input_ids, max_length=seq_len + output_len, do_sample=False, eos_token_id=-1)
+            start_time = time.time()
+            for _ in range(iterations):
+                model.generate(input_ids, max_length=seq_len + output_len, do_sample=False, eos_token_id=-1)
+            return time.time() - start_time
+        
+        quantized_core = quantize_dynamic_int8(copy.deepcopy(self.neural_core))
+        input_ids = torch.randint(0, 1000, (batch_size, seq_len))
+        
+        # Accuracy: full-sequence language-modeling logits
+        with torch.no_grad():
+            reference = self.neural_core(input_ids)['outputs']['language_modeling']
+            quantized = quantized_core(input_ids)['outputs']['language_modeling']
+        cosine = torch.nn.functional.cosine_similarity(reference, quantized, dim=-1)
+        top1_agreement = (reference.argmax(dim=-1) == quantized.argmax(dim=-1)).float().mean()
+        
+        fp32_forward = time_forward(self.neural_core, input_ids)
+        int8_forward = time_forward(quantized_core, input_ids)
+        fp32_generation = time_generation(self.neural_core, input_ids)
+        int8_generation = time_generation(quantized_core, input_ids)
+        generated_tokens = batch_size * output_len * iterations
+        
+        return {
+            'batch_size': batch_size,
+            'seq_len': seq_len,
+            'output_len': output_len,
+            'iterations': iterations,
+            'duration_seconds': fp32_forward + int8_forward + fp32_generation + int8_generation,
+            'fp32_size_mb': model_size_mb(self.neural_core),
+            'int8_size_mb': model_size_mb(quantized_core),
+            'fp32_forward_ms': (fp32_forward / iterations) * 1000,
+            'int8_forward_ms': (int8_forward / iterations) * 1000,
+            'fp32_decode_tokens_per_second': generated_tokens / fp32_generation,
+            'int8_decode_tokens_per_second': generated_tokens / int8_generation,
+            'logits_max_abs_error': (reference - quantized).abs().max().item(),
+            'logits_mean_cosine': cosine.mean().item(),
+            'top1_agreement': top1_agreement.item()
+        }
+
+
 class MemorySystemBenchmarks:
     """Benchmarks for Memory System"""
     
@@ -436,6 +510,16 @@ def run_performance_benchmarks(config: Dict[str, Any]):
                   nc_benchmarks.benchmark_memory_usage(batch_size=8, seq_len=512),
                   {'peak_memory_mb': nc_benchmarks.benchmark_memory_usage(8, 512)['peak_memory_mb']})
     
+    quantization_result = nc_benchmarks.benchmark_int8_quantization(batch_size=2, seq_len=64, output_len=32)
+    metrics.record("Neural Core int8 Quantization", quantization_result['duration_seconds'], quantization_result)
+    print("\n=== int8 Dynamic Quantization (accuracy vs speed) ===")
+    print(f"Size: {quantization_result['fp32_size_mb']:.1f}MB -> {quantization_result['int8_size_mb']:.1f}MB")
+    print(f"Forward: {quantization_result['fp32_forward_ms']:.1f}ms -> {quantization_result['int8_forward_ms']:.1f}ms")
+    print(f"Decode: {quantization_result['fp32_decode_tokens_per_second']:.1f} -> "
+          f"{quantization_result['int8_decode_tokens_per_second']:.1f} tokens/s")
+    print(f"Top-1 agreement: {quantization_result['top1_agreement']:.3f}, "
+          f"mean logit cosine: {quantization_result['logits_mean_cosine']:.4f}")
+    
     # Memory System benchmarks
     ms_benchmarks = MemorySystemBenchmarks(config)
     
@@ -484,6 +568,7 @@ if __name__ == '__main__':
         'num_experts': 8,
         'top_k': 4,
         'max_position_embeddings': 1024,
+        'precision': 'auto',  # bf16 autocast where the CPU supports it
         'ustm_capacity': 50,
         'awm_capacity': 100,
         'ltkb_path': '/tmp/benchmark_ltkb.json'
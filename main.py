@@ -11,12 +11,27 @@ import argparse
 import logging
 import json
 import sys
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import torch
 
 # Import all Sathik AI components
 from neural_core.quantum_inspired_neural_core import QuantumInspiredNeuralCore
+from neural_core.quantization import (
+    QUANTIZED_FORMAT,
+    build_quantized_skeleton,
+    is_quantized_state_dict,
+    quantize_dynamic_int8
+)
+from neural_core.inference_engine import ContinuousBatchingEngine
+from neural_core.prefix_cache import PrefixKVCache
+from neural_core.neural_core import SathikNeuralCore
+from neural_core.speculative import SpeculativeDecoder
+from neural_core.advanced_neural_core import materialize_from_state_dict, resolve_autocast_dtype
+from neural_core.sharded_checkpoint import (
+    is_sharded_checkpoint, load_shard, load_sharded_state_dict, save_shard, save_sharded_state_dict
+)
 from web_crawler.web_crawler_unit import BasicSpider
 from web_crawler.raw_data_processor import RawDataProcessor
 from web_crawler.tokenizer import BPETokenizer
@@ -40,6 +55,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Prompt files (in config[\'prompts_dir\']) prepended to trained-mode queries
+SYSTEM_PROMPT_FILE = \'matrix_system_prompt.md\'
+SUBMODE_PROMPT_FILES = {
+    \'sugarcotted\': \'matrix_sugarcotted_mode_prompt.md\',
+    \'unhinged\': \'matrix_unhinged_mode_prompt.md\',
+    \'reaper\': \'matrix_reaper_mode_prompt.md\',
+    \'666\': \'matrix_hexagon_mode_prompt.md\'
+}
+
 class SathikAI:
     """
     🔥 SATHIK AI - SUPER NEURAL INTELLIGENCE SYSTEM 🔥
@@ -72,6 +96,17 @@ class SathikAI:
         self.is_training = False
         self.device = torch.device(\'cuda\' if torch.cuda.is_available() else \'cpu\')
         
+        # Heavy models are built on first use (see the neural_core / training_loop properties)
+        self._neural_core = None
+        self._training_loop = None
+        self._inference_engine = None
+        self._speculative_decoder = None
+        self._model_lock = threading.Lock()
+        
+        # Prompt prefixes are tokenized once per submode and their K/V shared across queries
+        self._prompt_prefix_tokens = {}
+        self.prefix_cache = PrefixKVCache(max_bytes=self.config[\'prefix_cache_max_mb\'] * 1024 ** 2)
+        
         # Initialize all components
         self._initialize_all_components()
         
@@ -89,12 +124,26 @@ class SathikAI:
             \'num_experts\': 128,
             \'top_k\': 16,
             \'max_position_embeddings\': 16384,
+            \'int8_inference\': False,  # int8 dynamic quantization for CPU serving
+            \'inference_precision\': \'fp32\',  # \'fp32\', \'bf16\', \'fp16\' or \'auto\'
+            \'lazy_model_init\': True,  # build the neural core on first trained-mode use
+            \'neural_core_checkpoint\': None,  # sharded checkpoint dir (or state dict file) to materialize the core from
+            \'continuous_batching\': False,  # serve trained-mode queries from one shared decode batch
+            \'max_batch_size\': 16,  # concurrent sequences in the continuous batch
+            \'prepend_system_prompts\': False,  # prefix trained-mode queries with the system + submode prompt
+            \'prompts_dir\': \'prompts\',
+            \'prefix_cache_max_mb\': 1024,  # K/V memory for cached prompt prefixes (LRU beyond this)
+            \'speculative_decoding\': False,  # draft with the small SathikNeuralCore, verify with the quantum core
+            \'num_draft_tokens\': 4,
+            \'draft_model_config\': {\'d_model\': 512, \'num_heads\': 8, \'num_layers\': 4, \'num_experts\': 4, \'top_k\': 2},
+            \'draft_model_checkpoint\': None,  # state dict of the draft core (same tokenizer/vocabulary)
             
             # Training Configuration
             \'learning_rate\': 1e-4,
             \'weight_decay\': 0.01,
             \'batch_size\': 8,
             \'gradient_accumulation_steps\': 4,
+            \'training_precision\': \'fp32\',
             
             # Memory Configuration
             \'ustm_capacity\': 10,
@@ -163,17 +212,10 @@ class SathikAI:
         logger.info("Initializing BPE Tokenizer...")
         self.tokenizer = BPETokenizer(vocab_size=self.config[\'vocab_size\'])
         
-        # 2. Initialize Quantum-Inspired Neural Core
-        logger.info("Initializing Quantum-Inspired Neural Core...")
-        self.neural_core = QuantumInspiredNeuralCore(
-            vocab_size=self.config[\'vocab_size\'],
-            d_model=self.config[\'d_model\'],
-            num_heads=self.config[\'num_heads\'],
-            num_layers=self.config[\'num_layers\'],
-            num_experts=self.config[\'num_experts\'],
-            top_k=self.config[\'top_k\'],
-            max_position_embeddings=self.config[\'max_position_embeddings\']
-        ).to(self.device)
+        # 2. Quantum-Inspired Neural Core (deferred to first trained-mode use unless lazy_model_init is off)
+        if not self.config[\'lazy_model_init\']:
+            _ = self.neural_core
+        self.autocast_dtype = resolve_autocast_dtype(self.config[\'inference_precision\'], self.device.type)
         
         # 3. Initialize Infinite Adaptive Memory System
         logger.info("Initializing Infinite Adaptive Memory System...")
@@ -204,22 +246,9 @@ class SathikAI:
         self.output_engine = OutputEngine()
         self.output_engine.set_mode(self.config[\'default_output_mode\'])
         
-        # 7. Initialize Training Loop
-        logger.info("Initializing Live Training Loop...")
-        training_config = TRAINING_CONFIG.copy()
-        training_config.update({
-            \'vocab_size\': self.config[\'vocab_size\'],
-            \'d_model\': self.config[\'d_model\'],
-            \'num_heads\': self.config[\'num_heads\'],
-            \'num_layers\': self.config[\'num_layers\'],
-            \'num_experts\': self.config[\'num_experts\'],
-            \'top_k\': self.config[\'top_k\'],
-            \'learning_rate\': self.config[\'learning_rate\'],
-            \'weight_decay\': self.config[\'weight_decay\'],
-            \'batch_size\': self.config[\'batch_size\']
-        })
-        
-        self.training_loop = LiveTrainingLoop(training_config)
+        # 7. Live Training Loop (built on first use, it owns a second full model)
+        if not self.config[\'lazy_model_init\']:
+            _ = self.training_loop
         
         # 8. Initialize Self-Evolving Learning Algorithms
         if self.config[\'enable_sela\']:
@@ -245,6 +274,127 @@ class SathikAI:
         
         logger.info("All components initialized successfully!")
     
+    @property
+    def neural_core(self) -> QuantumInspiredNeuralCore:
+        """The Quantum-Inspired Neural Core, built on first access"""
+        if self._neural_core is None:
+            with self._model_lock:
+                if self._neural_core is None:
+                    self._neural_core = self._build_neural_core(self._load_neural_core_checkpoint())
+        return self._neural_core
+    
+    @property
+    def inference_engine(self) -> ContinuousBatchingEngine:
+        """Continuous-batching decoder in front of the neural core, started on first access"""
+        if self._inference_engine is None:
+            neural_core = self.neural_core
+            with self._model_lock:
+                if self._inference_engine is None:
+                    engine = ContinuousBatchingEngine(
+                        neural_core,
+                        max_batch_size=self.config[\'max_batch_size\'],
+                        autocast_dtype=self.autocast_dtype
+                    )
+                    engine.start()
+                    self._inference_engine = engine
+        return self._inference_engine
+    
+    @property
+    def speculative_decoder(self) -> SpeculativeDecoder:
+        """Draft/target pairing for speculative decoding, built on first access"""
+        if self._speculative_decoder is None:
+            neural_core = self.neural_core
+            with self._model_lock:
+                if self._speculative_decoder is None:
+                    logger.info("Initializing draft neural core for speculative decoding...")
+                    draft_model = SathikNeuralCore(vocab_size=self.config[\'vocab_size\'], **self.config[\'draft_model_config\'])
+                    checkpoint_path = self.config[\'draft_model_checkpoint\']
+                    if checkpoint_path and Path(checkpoint_path).exists():
+                        draft_model.load_state_dict(
+                            torch.load(checkpoint_path, map_location=\'cpu\', mmap=True, weights_only=True)
+                        )
+                    self._speculative_decoder = SpeculativeDecoder(
+                        neural_core, draft_model.to(self.device).eval(), self.config[\'num_draft_tokens\']
+                    )
+        return self._speculative_decoder
+    
+    @property
+    def training_loop(self) -> LiveTrainingLoop:
+        """The Live Training Loop, built on first access"""
+        if self._training_loop is None:
+            with self._model_lock:
+                if self._training_loop is None:
+                    logger.info("Initializing Live Training Loop...")
+                    training_config = TRAINING_CONFIG.copy()
+                    training_config.update({
+                        \'vocab_size\': self.config[\'vocab_size\'],
+                        \'d_model\': self.config[\'d_model\'],
+                        \'num_heads\': self.config[\'num_heads\'],
+                        \'num_layers\': self.config[\'num_layers\'],
+                        \'num_experts\': self.config[\'num_experts\'],
+                        \'top_k\': self.config[\'top_k\'],
+                        \'learning_rate\': self.config[\'learning_rate\'],
+                        \'weight_decay\': self.config[\'weight_decay\'],
+                        \'batch_size\': self.config[\'batch_size\'],
+                        \'precision\': self.config[\'training_precision\']
+                    })
+                    self._training_loop = LiveTrainingLoop(training_config)
+        return self._training_loop
+    
+    def _load_neural_core_checkpoint(self) -> Optional[Dict[str, torch.Tensor]]:
+        """Memory-map the configured neural core state dict, if there is one"""
+        checkpoint_path = self.config[\'neural_core_checkpoint\']
+        if not checkpoint_path or not Path(checkpoint_path).exists():
+            return None
+        logger.info(f"Loading neural core weights from {checkpoint_path}")
+        if is_sharded_checkpoint(checkpoint_path):
+            return load_sharded_state_dict(checkpoint_path)
+        checkpoint = torch.load(checkpoint_path, map_location=\'cpu\', mmap=True, weights_only=True)
+        if checkpoint.get(\'format\') == QUANTIZED_FORMAT:
+            # Written by save_quantized_model: the state dict sits under its metadata
+            return checkpoint[\'state_dict\']
+        return checkpoint
+    
+    def _build_neural_core(self, state_dict: Optional[Dict[str, torch.Tensor]] = None) -> QuantumInspiredNeuralCore:
+        """
+        Build the neural core. With a state dict the model is constructed on
+        the meta device and materialized from the checkpoint, skipping random
+        initialization entirely. An int8 state dict is loaded into a quantized
+        skeleton whatever int8_inference says; a float one is quantized after
+        loading when int8_inference is on.
+        """
+        logger.info("Initializing Quantum-Inspired Neural Core...")
+        model_config = {
+            \'vocab_size\': self.config[\'vocab_size\'],
+            \'d_model\': self.config[\'d_model\'],
+            \'num_heads\': self.config[\'num_heads\'],
+            \'num_layers\': self.config[\'num_layers\'],
+            \'num_experts\': self.config[\'num_experts\'],
+            \'top_k\': self.config[\'top_k\'],
+            \'max_position_embeddings\': self.config[\'max_position_embeddings\']
+        }
+        quantize = self.config[\'int8_inference\'] and self.device.type == \'cpu\'
+        
+        if state_dict is not None and is_quantized_state_dict(state_dict):
+            if self.device.type != \'cpu\':
+                raise ValueError("int8 neural core checkpoints run on CPU only")
+            logger.info("Loading int8 neural core checkpoint...")
+            with torch.device(\'meta\'):
+                neural_core = QuantumInspiredNeuralCore(**model_config)
+            return materialize_from_state_dict(build_quantized_skeleton(neural_core), state_dict, self.device)
+        
+        if state_dict is not None:
+            with torch.device(\'meta\'):
+                neural_core = QuantumInspiredNeuralCore(**model_config)
+            neural_core = materialize_from_state_dict(neural_core, state_dict, self.device)
+        else:
+            neural_core = QuantumInspiredNeuralCore(**model_config).to(self.device)
+        
+        if quantize:
+            logger.info("Quantizing neural core to int8 for CPU inference...")
+            neural_core = quantize_dynamic_int8(neural_core)
+        return neural_core
+    
     def _setup_truth_sources(self):
         """Setup reliability scores for truth comparison"""
         reliable_sources = {
@@ -352,38 +502,52 @@ class SathikAI:
             # 3. Get User Personalization (from IAMS)
             user_profile = self.memory_system.ltkb.get_concept(f"user_profile_{user_id}") # Stored in LTKB now
             
-            # 4. Tokenize Query
-            query_tokens = self.tokenizer.encode(query)
-            query_tensor = torch.tensor([query_tokens], dtype=torch.long).to(self.device)
-            
-            # 5. Get Query Embedding (for memory system)
-            query_embedding = self.memory_system.embedding_model.encode(query)
-            query_embedding_tensor = torch.tensor(query_embedding, dtype=torch.float32).unsqueeze(0).to(self.device)
-            
-            # 6. Retrieve and Fuse Memory from IAMS
-            fused_memory_representation = self.memory_system(query_embedding_tensor, query_text=query)
+            # 4-6. Tokenize Query, embed it and retrieve/fuse memory from IAMS
+            query_tensor, fused_memory_representation = self._encode_trained_mode_inputs(query)
+            input_ids, prefix_length, prefix_key_values = self._with_prompt_prefix(query_tensor, submode)
             
             # 7. Neural Core Processing (Quantum-Inspired)
-            with torch.no_grad():
-                self.neural_core.eval()
-                
-                # Generate response using the Quantum-Inspired Neural Core
-                generated_tokens = self.neural_core.generate(
-                    query_tensor,
-                    max_length=self.config[\'max_generation_length\'],
+            memory_vectors = {
+                \'fused_memory\': fused_memory_representation.unsqueeze(1) # One memory slot
+            }
+            max_new_tokens = self.config[\'max_generation_length\'] - query_tensor.size(1)
+            if self.config[\'continuous_batching\'] and max_new_tokens > 0:
+                # Decoded alongside other in-flight queries in the shared batch
+                request = self.inference_engine.submit(
+                    input_ids[0].tolist(),
+                    max_new_tokens=max_new_tokens,
                     temperature=self.config[\'generation_temperature\'],
                     top_k=self.config[\'generation_top_k\'],
-                    top_p=self.config[\'generation_top_p\']
-                )
-                
-                # Get full neural analysis (pass fused memory as cross_attention_input conceptually)
-                neural_outputs = self.neural_core(
-                    query_tensor,
-                    memory_vectors={
-                        \'fused_memory\': fused_memory_representation.unsqueeze(1) # Add a dummy sequence dim
-                    },
-                    return_dict=True
+                    top_p=self.config[\'generation_top_p\'],
+                    memory_vectors=memory_vectors,
+                    return_prefill_outputs=True,
+                    prefix_key_values=prefix_key_values
                 )
+                new_tokens = request.future.result()
+                generated_tokens = torch.tensor([query_tensor[0].tolist() + new_tokens], dtype=torch.long)
+                neural_outputs = request.prefill_outputs
+            else:
+                with torch.no_grad():
+                    self.neural_core.eval()
+                    
+                    # Generate response using the Quantum-Inspired Neural Core, conditioned on
+                    # the fused memory. The prompt forward doubles as the full neural analysis.
+                    generation_kwargs = {
+                        \'max_length\': prefix_length + self.config[\'max_generation_length\'],
+                        \'temperature\': self.config[\'generation_temperature\'],
+                        \'top_k\': self.config[\'generation_top_k\'],
+                        \'top_p\': self.config[\'generation_top_p\'],
+                        \'memory_vectors\': memory_vectors,
+                        \'return_prefill_outputs\': True,
+                        \'autocast_dtype\': self.autocast_dtype,
+                        \'prefix_key_values\': prefix_key_values
+                    }
+                    if self.config[\'speculative_decoding\']:
+                        # The draft core proposes tokens, the quantum core verifies them in one forward
+                        generated_tokens, neural_outputs = self.speculative_decoder.generate(input_ids, **generation_kwargs)
+                    else:
+                        generated_tokens, neural_outputs = self.neural_core.generate(input_ids, **generation_kwargs)
+                generated_tokens = generated_tokens[:, prefix_length:]  # drop the prompt prefix
             
             # 8. Decode Response
             response_tokens = generated_tokens[0].cpu().tolist()
@@ -453,6 +617,7 @@ class SathikAI:
                     \'load_balancing_loss\': neural_outputs[\'load_balancing_loss\'].item(),
                     \'num_analyses\': len(neural_outputs[\'analyses\'])
                 },
+                \'speculative_decoding\': self.speculative_decoder.get_metrics() if self.config[\'speculative_decoding\'] else None,
                 \'safety_analysis\': final_safety,
                 \'truth_analysis\': truth_analysis,
                 \'status\': \'success\',
@@ -470,6 +635,140 @@ class SathikAI:
                 \'status\': \'error\'
             }
     
+    def _encode_trained_mode_inputs(self, query: str):
+        """Tokenize the query and fuse its memory: (query_tensor [1, seq], fused memory [1, d_model])"""
+        query_tokens = self.tokenizer.encode(query)
+        query_tensor = torch.tensor([query_tokens], dtype=torch.long).to(self.device)
+        
+        query_embedding = self.memory_system.embedding_model.encode(query)
+        query_embedding_tensor = torch.tensor(query_embedding, dtype=torch.float32).unsqueeze(0).to(self.device)
+        
+        fused_memory_representation = self.memory_system(query_embedding_tensor, query_text=query)
+        return query_tensor, fused_memory_representation
+    
+    def _prompt_prefix(self, submode: str) -> List[int]:
+        """Token ids of the system prompt followed by the submode\'s prompt, tokenized once"""
+        if submode not in self._prompt_prefix_tokens:
+            prompts_dir = Path(self.config[\'prompts_dir\'])
+            prompt_files = [SYSTEM_PROMPT_FILE]
+            if submode in SUBMODE_PROMPT_FILES:
+                prompt_files.append(SUBMODE_PROMPT_FILES[submode])
+            text = \'\n\n\'.join(
+                (prompts_dir / name).read_text(encoding=\'utf-8\')
+                for name in prompt_files if (prompts_dir / name).exists()
+            )
+            tokens = self.tokenizer.encode(text)
+            
+            # Leave room for the query and its answer; the end (the submode prompt) is kept
+            budget = self.config[\'max_position_embeddings\'] - self.config[\'max_generation_length\']
+            if len(tokens) > budget:
+                logger.warning(f"Prompt prefix for submode {submode!r} truncated from {len(tokens)} to {budget} tokens")
+                tokens = tokens[-budget:]
+            self._prompt_prefix_tokens[submode] = tokens
+        return self._prompt_prefix_tokens[submode]
+    
+    def _with_prompt_prefix(self, query_tensor: torch.Tensor, submode: str):
+        """
+        Prepend the prompt prefix to a tokenized query. Returns (input_ids,
+        prefix_length, prefix_key_values); the prefix K/V come from the shared
+        prefix cache, so only the query tokens are prefilled.
+        """
+        if not self.config[\'prepend_system_prompts\']:
+            return query_tensor, 0, None
+        prefix_ids = self._prompt_prefix(submode)
+        if not prefix_ids:
+            return query_tensor, 0, None
+        
+        prefix_key_values = self.prefix_cache.get_or_prefill(self.neural_core, prefix_ids, self.autocast_dtype)
+        prefix_tensor = torch.tensor([prefix_ids], dtype=torch.long, device=query_tensor.device)
+        return torch.cat([prefix_tensor, query_tensor], dim=1), len(prefix_ids), prefix_key_values
+    
+    def stream_trained_mode_query(self, query: str, user_id: str = "default", submode: str = "normal") -> Iterator[Dict[str, Any]]:
+        """
+        Stream a trained-mode answer as it is generated.
+        
+        Yields one {\'type\': \'token\', \'token_id\', \'text\'} event per sampled
+        token, where text is the newly decoded text (possibly empty), then a
+        final {\'type\': \'done\', \'raw_response\', \'tokens_generated\',
+        \'time_to_first_token\', \'processing_time\'} event. A query rejected by
+        the content filter or a failure yields a single \'error\' event instead.
+        """
+        start_time = time.time()
+        
+        if not self.is_initialized:
+            yield {\'type\': \'error\', \'error\': \'Sathik AI system not initialized\', \'status\': \'error\'}
+            return
+        
+        if self.config[\'enable_content_filter\']:
+            safety_analysis = self.content_filter.analyze_content(query)
+            if not safety_analysis[\'is_safe\']:
+                yield {
+                    \'type\': \'error\',
+                    \'error\': \'Query contains unsafe content and cannot be processed.\',
+                    \'status\': \'rejected\'
+                }
+                return
+        
+        self.memory_system.ustm.add_entry({
+            \'user_id\': user_id,
+            \'query\': query,
+            \'type\': \'user_query\',
+            \'timestamp\': time.time()
+        })
+        
+        try:
+            with torch.no_grad():
+                query_tensor, fused_memory_representation = self._encode_trained_mode_inputs(query)
+            input_ids, prefix_length, prefix_key_values = self._with_prompt_prefix(query_tensor, submode)
+            
+            decoder = self.tokenizer.stream_decoder()
+            token_ids = []
+            time_to_first_token = None
+            sampling = {
+                \'temperature\': self.config[\'generation_temperature\'],
+                \'top_k\': self.config[\'generation_top_k\'],
+                \'top_p\': self.config[\'generation_top_p\'],
+                \'memory_vectors\': {
+                    \'fused_memory\': fused_memory_representation.unsqueeze(1) # One memory slot
+                }
+            }
+            max_new_tokens = self.config[\'max_generation_length\'] - query_tensor.size(1)
+            if self.config[\'continuous_batching\'] and max_new_tokens > 0:
+                token_stream = self.inference_engine.stream(
+                    input_ids[0].tolist(), max_new_tokens=max_new_tokens,
+                    prefix_key_values=prefix_key_values, **sampling
+                )
+            else:
+                token_stream = (
+                    next_token[0].item()
+                    for next_token in self.neural_core.stream_generate(
+                        input_ids,
+                        max_length=prefix_length + self.config[\'max_generation_length\'],
+                        autocast_dtype=self.autocast_dtype,
+                        prefix_key_values=prefix_key_values,
+                        **sampling
+                    )
+                )
+            
+            for token_id in token_stream:
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                token_ids.append(token_id)
+                yield {\'type\': \'token\', \'token_id\': token_id, \'text\': decoder.step(token_id)}
+            
+            yield {
+                \'type\': \'done\',
+                \'raw_response\': self.tokenizer.decode(token_ids),
+                \'tokens_generated\': len(token_ids),
+                \'time_to_first_token\': time_to_first_token,
+                \'processing_time\': time.time() - start_time,
+                \'status\': \'success\'
+            }
+        
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}", exc_info=True)
+            yield {\'type\': \'error\', \'error\': str(e), \'status\': \'error\'}
+    
     def _prepare_memory_vectors(self, user_id: str, query: str) -> Dict[str, torch.Tensor]:
         """
         This method is now largely handled by InfiniteAdaptiveMemorySystem.
@@ -640,7 +939,12 @@ Current sub-mode: {self.current_submode}
                 print(f"🎯 Training: {\'🔄 In Progress\' if self.sathik.is_training else \'⏸️  Standby\'}")
                 print(f"🧬 Self-Evolution (SELA): {\'✅ Enabled\' if self.sathik.sela else \'❌ Disabled\'}")
                 print(f"🖥️  Device: {self.sathik.device}")
-                print(f"📊 Model Parameters: {sum(p.numel() for p in self.sathik.neural_core.parameters()):,}")
+                # Counting parameters would build the neural core; only count a core that exists
+                neural_core = self.sathik._neural_core
+                if neural_core is not None:
+                    print(f"📊 Model Parameters: {sum(p.numel() for p in neural_core.parameters()):,}")
+                else:
+                    print("📊 Model Parameters: not loaded yet")
             
             def show_memory_status(self):
                 print("\n🧠 MEMORY SYSTEM STATUS:")
@@ -659,31 +963,53 @@ Current sub-mode: {self.current_submode}
         terminal.start()
     
     def save_system_state(self, checkpoint_path: str = None):
-        """Save the complete system state"""
+        """
+        Save the complete system state as a checkpoint directory:
+        neural_core/ (sharded, mmap-loadable weights), ltkb_embeddings.safetensors,
+        system_state.pt (config, tokenizer vocab, knowledge graph) and tokenizer.pkl.
+        A neural core that was never built has no weights worth saving and is skipped.
+        """
         if not checkpoint_path:
-            checkpoint_path = f"sathik_system_beyond_imagination_checkpoint.pt"
+            checkpoint_path = f"sathik_system_beyond_imagination_checkpoint"
         
         logger.info(f"Saving system state to {checkpoint_path}")
         
         try:
+            checkpoint_dir = Path(checkpoint_path)
+            checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Neural core weights: one shard per layer / expert group (int8 packed weights stay pickled)
+            neural_core = self._neural_core
+            if neural_core is not None:
+                neural_core_state = neural_core.state_dict()
+                if any(k.endswith(\'_packed_params\') for k in neural_core_state):
+                    torch.save(neural_core_state, checkpoint_dir / \'neural_core.pt\')
+                else:
+                    save_sharded_state_dict(neural_core_state, checkpoint_dir / \'neural_core\')
+            
+            # LTKB embeddings as raw tensors instead of Python lists
+            save_shard(
+                {k: torch.as_tensor(v) for k, v in self.memory_system.ltkb.concept_embeddings.items()},
+                checkpoint_dir / \'ltkb_embeddings.safetensors\'
+            )
+            
             system_state = {
                 \'config\': self.config,
-                \'neural_core_state\': self.neural_core.state_dict(),
                 \'tokenizer_vocab\': self.tokenizer.vocab,
                 \'tokenizer_merges\': self.tokenizer.merges,
                 \'memory_system_ltkb_graph\': self.memory_system.ltkb.knowledge_graph,
-                \'memory_system_ltkb_embeddings\': {k: v.tolist() for k, v in self.memory_system.ltkb.concept_embeddings.items()},
                 \'system_info\': {
                     \'is_initialized\': self.is_initialized,
                     \'device\': str(self.device),
-                    \'total_parameters\': sum(p.numel() for p in self.neural_core.parameters())
+                    \'total_parameters\': (
+                        sum(p.numel() for p in neural_core.parameters()) if neural_core is not None else None
+                    )
                 }
             }
-            
-            torch.save(system_state, checkpoint_path)
+            torch.save(system_state, checkpoint_dir / \'system_state.pt\')
             
             # Save tokenizer separately
-            self.tokenizer.save(checkpoint_path.replace(\'_checkpoint.pt\', \'_tokenizer.pkl\'))
+            self.tokenizer.save(str(checkpoint_dir / \'tokenizer.pkl\'))
             
             logger.info(f"System state saved successfully to {checkpoint_path}")
             
@@ -695,19 +1021,46 @@ Current sub-mode: {self.current_submode}
         logger.info(f"Loading system state from {checkpoint_path}")
         
         try:
-            system_state = torch.load(checkpoint_path, map_location=self.device)
+            checkpoint_dir = Path(checkpoint_path)
+            if checkpoint_dir.is_dir():
+                system_state = torch.load(checkpoint_dir / \'system_state.pt\', map_location=\'cpu\', weights_only=False)
+                # Shards are memory-mapped: pages are read on first use and shared between processes
+                if is_sharded_checkpoint(checkpoint_dir / \'neural_core\'):
+                    neural_core_state = load_sharded_state_dict(checkpoint_dir / \'neural_core\')
+                elif (checkpoint_dir / \'neural_core.pt\').exists():
+                    neural_core_state = torch.load(checkpoint_dir / \'neural_core.pt\', map_location=\'cpu\', weights_only=False)
+                else:
+                    neural_core_state = None  # saved before the neural core was ever built
+                ltkb_embeddings = {
+                    k: v.numpy().copy() for k, v in load_shard(checkpoint_dir / \'ltkb_embeddings.safetensors\').items()
+                }
+                tokenizer_path = checkpoint_dir / \'tokenizer.pkl\'
+            else:
+                # Legacy single-file checkpoint
+                system_state = torch.load(checkpoint_path, map_location=self.device)
+                neural_core_state = system_state[\'neural_core_state\']
+                ltkb_embeddings = {k: torch.tensor(v) for k, v in system_state[\'memory_system_ltkb_embeddings\'].items()}
+                tokenizer_path = Path(checkpoint_path.replace(\'_checkpoint.pt\', \'_tokenizer.pkl\'))
             
-            # Load neural core state
-            self.neural_core.load_state_dict(system_state[\'neural_core_state\'])
+            # Load neural core state (materialized straight from it if the core is not built yet)
+            if neural_core_state is not None:
+                if self._neural_core is None:
+                    with self._model_lock:
+                        self._neural_core = self._build_neural_core(neural_core_state)
+                else:
+                    self.neural_core.load_state_dict(neural_core_state)
             
             # Load tokenizer
-            tokenizer_path = checkpoint_path.replace(\'_checkpoint.pt\', \'_tokenizer.pkl\')
-            if Path(tokenizer_path).exists():
-                self.tokenizer.load(tokenizer_path)
+            if tokenizer_path.exists():
+                self.tokenizer.load(str(tokenizer_path))
+            
+            # Cached prompt tokens and their K/V belong to the previous weights/tokenizer
+            self._prompt_prefix_tokens.clear()
+            self.prefix_cache.clear()
             
             # Load LTKB state
             self.memory_system.ltkb.knowledge_graph = system_state[\'memory_system_ltkb_graph\']
-            self.memory_system.ltkb.concept_embeddings = {k: torch.tensor(v) for k, v in system_state[\'memory_system_ltkb_embeddings\'].items()}
+            self.memory_system.ltkb.concept_embeddings = ltkb_embeddings
             
             logger.info("System state loaded successfully")
             
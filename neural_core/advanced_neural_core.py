@@ -1,11 +1,26 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
+import contextlib
 import math
 import numpy as np
 from typing import Optional, Tuple, List, Dict, Any
 import json
 
+class FP32LayerNorm(nn.LayerNorm):
+    """LayerNorm that always normalises in fp32 (also under autocast or with bf16 weights)"""
+    def forward(self, x):
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            output = F.layer_norm(
+                x.float(),
+                self.normalized_shape,
+                self.weight.float() if self.weight is not None else None,
+                self.bias.float() if self.bias is not None else None,
+                self.eps
+            )
+        return output.to(x.dtype)
+
 class AdvancedTokenInputLayer(nn.Module):
     """Enhanced token input with multiple embedding types"""
     def __init__(self, vocab_size, d_model, max_position_embeddings=8192):
@@ -14,7 +29,7 @@ class AdvancedTokenInputLayer(nn.Module):
         self.token_embedding = nn.Embedding(vocab_size, d_model)
         self.position_embedding = nn.Embedding(max_position_embeddings, d_model)
         self.token_type_embedding = nn.Embedding(8, d_model)  # Different token types
-        self.layer_norm = nn.LayerNorm(d_model)
+        self.layer_norm = FP32LayerNorm(d_model)
         self.dropout = nn.Dropout(0.1)
         
     def forward(self, input_ids, position_ids=None, token_type_ids=None):
@@ -42,27 +57,41 @@ class RotaryPositionalEncoding(nn.Module):
     def __init__(self, d_model, max_len=8192):
         super().__init__()
         self.d_model = d_model
+        self.max_len = max_len
         
         # Create rotation matrix
         inv_freq = 1.0 / (10000 ** (torch.arange(0, d_model, 2).float() / d_model))
         self.register_buffer('inv_freq', inv_freq)
         
-    def forward(self, x, seq_len=None):
-        if seq_len is None:
-            seq_len = x.shape[1]
-            
-        t = torch.arange(seq_len, device=x.device).type_as(self.inv_freq)
-        freqs = torch.einsum('i,j->ij', t, self.inv_freq)
-        emb = torch.cat((freqs, freqs), dim=-1)
-        
-        cos_cached = emb.cos()[None, :, None, :]
-        sin_cached = emb.sin()[None, :, None, :]
+        # cos/sin for every position, built once and looked up per call.
+        # Not persistent: they are derived from inv_freq and max_len.
+        self.register_buffer('cos_cached', torch.empty(0), persistent=False)
+        self.register_buffer('sin_cached', torch.empty(0), persistent=False)
+        self.build_tables()
+    
+    def build_tables(self):
+        """(Re)compute the [max_len, d_model // 2] cos/sin tables"""
+        t = torch.arange(self.max_len, device=self.inv_freq.device).type_as(self.inv_freq)
+        freqs = torch.outer(t, self.inv_freq)
+        self.cos_cached = freqs.cos()
+        self.sin_cached = freqs.sin()
+        
+    def forward(self, x, seq_len=None, position_ids=None, offset=0):
+        """Return cos/sin of shape [batch, 1, seq_len, d_model // 2] for the given positions"""
+        if position_ids is not None:
+            cos = self.cos_cached[position_ids]
+            sin = self.sin_cached[position_ids]
+        else:
+            if seq_len is None:
+                seq_len = x.shape[1]
+            cos = self.cos_cached[offset:offset + seq_len].unsqueeze(0)
+            sin = self.sin_cached[offset:offset + seq_len].unsqueeze(0)
         
-        return cos_cached, sin_cached
+        return cos.unsqueeze(1), sin.unsqueeze(1)
 
 class SuperMultiHeadAttention(nn.Module):
     """Enhanced multi-head attention with various improvements"""
-    def __init__(self, d_model, num_heads, dropout=0.1, use_rope=True, use_flash_attention=True):
+    def __init__(self, d_model, num_heads, dropout=0.1, use_rope=True, use_flash_attention=True, rope=None):
         super().__init__()
         assert d_model % num_heads == 0
         
@@ -78,9 +107,9 @@ class SuperMultiHeadAttention(nn.Module):
         self.w_v = nn.Linear(d_model, d_model, bias=False)
         self.w_o = nn.Linear(d_model, d_model)
         
-        # Rotary position embedding
+        # Rotary position embedding (a model can pass one table shared by all layers)
         if use_rope:
-            self.rope = RotaryPositionalEncoding(self.d_k)
+            self.rope = rope if rope is not None else RotaryPositionalEncoding(self.d_k)
             
         # Attention dropout
         self.dropout = nn.Dropout(dropout)
@@ -91,21 +120,28 @@ class SuperMultiHeadAttention(nn.Module):
     def apply_rope(self, x, cos, sin):
         """Apply rotary position embedding"""
         x1, x2 = x[..., ::2], x[..., 1::2]
+        cos, sin = cos.to(x.dtype), sin.to(x.dtype)
         return torch.cat([x1 * cos - x2 * sin, x1 * sin + x2 * cos], dim=-1)
         
-    def forward(self, query, key, value, mask=None, past_key_value=None):
+    def forward(self, query, key, value, mask=None, past_key_value=None, position_ids=None, output_attentions=False):
         batch_size, seq_len = query.size(0), query.size(1)
+        past_length = past_key_value[0].size(2) if past_key_value is not None else 0
         
         # Linear projections
         Q = self.w_q(query).view(batch_size, seq_len, self.num_heads, self.d_k).transpose(1, 2)
         K = self.w_k(key).view(batch_size, -1, self.num_heads, self.d_k).transpose(1, 2)
         V = self.w_v(value).view(batch_size, -1, self.num_heads, self.d_k).transpose(1, 2)
         
-        # Apply RoPE if enabled
+        # Apply RoPE if enabled (new tokens continue after the cached ones)
         if self.use_rope:
-            cos, sin = self.rope(query, seq_len)
+            cos, sin = self.rope(query, seq_len, position_ids=position_ids, offset=past_length)
             Q = self.apply_rope(Q, cos, sin)
-            K = self.apply_rope(K, cos, sin)
+            if K.size(2) == seq_len:
+                K = self.apply_rope(K, cos, sin)
+            else:
+                # Cross-attention keys carry their own positions
+                k_cos, k_sin = self.rope(key, K.size(2))
+                K = self.apply_rope(K, k_cos, k_sin)
         
         # Handle past key-value for efficient generation
         if past_key_value is not None:
@@ -113,17 +149,30 @@ class SuperMultiHeadAttention(nn.Module):
             K = torch.cat([past_key, K], dim=2)
             V = torch.cat([past_value, V], dim=2)
         
-        # Scaled dot-product attention with learnable temperature
-        scores = torch.matmul(Q, K.transpose(-2, -1)) * self.temperature
-        
-        if mask is not None:
-            scores = scores.masked_fill(mask == 0, -1e9)
+        if self.use_flash_attention and not output_attentions:
+            # Fused kernel never materialises the [B, H, S, S] score matrix.
+            # The learnable temperature is folded into Q so the kernel scale is 1.
+            if mask is not None and mask.dtype != torch.bool:
+                mask = mask != 0
+            context = F.scaled_dot_product_attention(
+                Q * self.temperature, K, V,
+                attn_mask=mask,
+                dropout_p=self.dropout.p if self.training else 0.0,
+                scale=1.0
+            )
+            attn_weights = None
+        else:
+            # Scaled dot-product attention with learnable temperature
+            scores = torch.matmul(Q, K.transpose(-2, -1)) * self.temperature
             
-        attn_weights = F.softmax(scores, dim=-1)
-        attn_weights = self.dropout(attn_weights)
-        
-        # Apply attention to values
-        context = torch.matmul(attn_weights, V)
+            if mask is not None:
+                scores = scores.masked_fill(mask == 0, -1e9)
+                
+            attn_weights = F.softmax(scores, dim=-1, dtype=torch.float32).to(V.dtype)
+            attn_weights = self.dropout(attn_weights)
+            
+            # Apply attention to values
+            context = torch.matmul(attn_weights, V)
         
         # Reshape and apply output projection
         context = context.transpose(1, 2).contiguous().view(
@@ -134,9 +183,101 @@ class SuperMultiHeadAttention(nn.Module):
         
         return output, attn_weights, (K, V)
 
+class StackedExpertBank(nn.Module):
+    """
+    Expert FFNs stored as stacked [num_experts, ...] weight tensors.
+    Expert-sorted tokens are padded to [num_experts, max_tokens, d_model] and
+    run through every expert with one batched matmul per projection.
+    """
+    def __init__(self, num_experts, d_model, d_hidden, activation='gelu', dropout=0.1, output_dropout=True):
+        super().__init__()
+        self.num_experts = num_experts
+        self.d_model = d_model
+        self.d_hidden = d_hidden
+        self.activation = F.gelu if activation == 'gelu' else F.relu
+        
+        self.w1 = nn.Parameter(torch.empty(num_experts, d_model, d_hidden))
+        self.b1 = nn.Parameter(torch.zeros(num_experts, d_hidden))
+        self.w2 = nn.Parameter(torch.empty(num_experts, d_hidden, d_model))
+        self.b2 = nn.Parameter(torch.zeros(num_experts, d_model))
+        
+        self.dropout = nn.Dropout(dropout)
+        self.output_dropout = nn.Dropout(dropout) if output_dropout else nn.Identity()
+        
+        self.reset_parameters()
+    
+    def reset_parameters(self):
+        """Match the nn.Linear initialisation used by the neural cores"""
+        nn.init.normal_(self.w1, mean=0.0, std=0.02)
+        nn.init.normal_(self.w2, mean=0.0, std=0.02)
+        nn.init.zeros_(self.b1)
+        nn.init.zeros_(self.b2)
+    
+    def forward(self, expert_inputs, tokens_per_expert):
+        """
+        expert_inputs: [num_assignments, d_model] tokens sorted by expert
+        tokens_per_expert: [num_experts] number of rows belonging to each expert
+        """
+        num_assignments = expert_inputs.size(0)
+        if num_assignments == 0:
+            return expert_inputs
+        
+        # Row i of expert e goes to slot (e, i) of the padded batch
+        expert_ids = torch.repeat_interleave(
+            torch.arange(self.num_experts, device=expert_inputs.device), tokens_per_expert
+        )
+        expert_offsets = torch.cumsum(tokens_per_expert, dim=0) - tokens_per_expert
+        positions = torch.arange(num_assignments, device=expert_inputs.device) - expert_offsets[expert_ids]
+        max_tokens = int(tokens_per_expert.max())
+        
+        padded_inputs = expert_inputs.new_zeros(self.num_experts, max_tokens, self.d_model)
+        padded_inputs = padded_inputs.index_put((expert_ids, positions), expert_inputs)
+        
+        hidden = torch.baddbmm(self.b1.unsqueeze(1), padded_inputs, self.w1)
+        hidden = self.dropout(self.activation(hidden))
+        padded_outputs = torch.baddbmm(self.b2.unsqueeze(1), hidden, self.w2)
+        padded_outputs = self.output_dropout(padded_outputs)
+        
+        return padded_outputs[expert_ids, positions]
+
+def convert_expert_state_dict(state_dict):
+    """
+    Convert a state dict with per-expert nn.Linear weights (MegaExpertRouter's
+    experts.{i}.0/3 or ExpertRouter's experts.{i}.w_1/w_2) into the
+    StackedExpertBank layout (experts.w1/b1/w2/b2). Other keys are kept as is.
+    """
+    layer_names = {'0': 'first', '3': 'second', 'w_1': 'first', 'w_2': 'second'}
+    grouped = {}
+    converted = {}
+    
+    for key, value in state_dict.items():
+        parts = key.split('.')
+        if (
+            len(parts) >= 4 and parts[-4] == 'experts' and parts[-3].isdigit()
+            and parts[-2] in layer_names and parts[-1] in ('weight', 'bias')
+        ):
+            prefix = '.'.join(parts[:-3])
+            slot = (layer_names[parts[-2]], parts[-1])
+            grouped.setdefault(prefix, {}).setdefault(slot, {})[int(parts[-3])] = value
+        else:
+            converted[key] = value
+    
+    for prefix, tensors in grouped.items():
+        def stack(slot):
+            by_expert = tensors[slot]
+            return torch.stack([by_expert[i] for i in sorted(by_expert)], dim=0)
+        
+        # nn.Linear stores [out, in]; the bank multiplies by [in, out]
+        converted[f'{prefix}.w1'] = stack(('first', 'weight')).transpose(1, 2).contiguous()
+        converted[f'{prefix}.b1'] = stack(('first', 'bias'))
+        converted[f'{prefix}.w2'] = stack(('second', 'weight')).transpose(1, 2).contiguous()
+        converted[f'{prefix}.b2'] = stack(('second', 'bias'))
+    
+    return converted
+
 class MegaExpertRouter(nn.Module):
     """Massive Mixture of Experts with dynamic routing"""
-    def __init__(self, d_model, num_experts=64, top_k=8, expert_capacity_factor=1.0):
+    def __init__(self, d_model, num_experts=64, top_k=8, expert_capacity_factor=1.0, stacked_experts=False):
         super().__init__()
         self.num_experts = num_experts
         self.top_k = top_k
@@ -151,57 +292,65 @@ class MegaExpertRouter(nn.Module):
         )
         
         # Expert networks - each is a specialized FFN
-        self.experts = nn.ModuleList([
-            nn.Sequential(
-                nn.Linear(d_model, d_model * 4),
-                nn.GELU(),
-                nn.Dropout(0.1),
-                nn.Linear(d_model * 4, d_model),
-                nn.Dropout(0.1)
-            ) for _ in range(num_experts)
-        ])
+        if stacked_experts:
+            # Same FFNs with stacked weights, run as batched matmuls
+            self.experts = StackedExpertBank(num_experts, d_model, d_model * 4)
+        else:
+            self.experts = nn.ModuleList([
+                nn.Sequential(
+                    nn.Linear(d_model, d_model * 4),
+                    nn.GELU(),
+                    nn.Dropout(0.1),
+                    nn.Linear(d_model * 4, d_model),
+                    nn.Dropout(0.1)
+                ) for _ in range(num_experts)
+            ])
         
         # Load balancing
         self.load_balancing_loss_coef = 0.01
         
     def forward(self, x):
         batch_size, seq_len, d_model = x.shape
-        x_flat = x.view(-1, d_model)
+        x_flat = x.reshape(-1, d_model)
         
         # Compute gating scores
         gate_logits = self.gate(x_flat)
-        gate_scores = F.softmax(gate_logits, dim=-1)
+        gate_scores = F.softmax(gate_logits, dim=-1, dtype=torch.float32)
         
         # Select top-k experts
         top_k_scores, top_k_indices = torch.topk(gate_scores, self.top_k, dim=-1)
         top_k_scores = top_k_scores / top_k_scores.sum(dim=-1, keepdim=True)
         
-        # Initialize output
-        output = torch.zeros_like(x_flat)
-        
-        # Route to experts
-        for i in range(self.num_experts):
-            # Find tokens routed to this expert
-            expert_mask = (top_k_indices == i).any(dim=-1)
-            if not expert_mask.any():
-                continue
-                
-            # Get expert input
-            expert_input = x_flat[expert_mask]
-            
-            # Compute expert output
-            expert_output = self.experts[i](expert_input)
-            
-            # Weighted combination based on gating scores
-            expert_weights = top_k_scores[expert_mask]
-            expert_indices = top_k_indices[expert_mask]
-            
-            # Apply weights for this expert
-            weight_mask = (expert_indices == i)
-            weights = expert_weights * weight_mask.float()
-            weights = weights.sum(dim=-1, keepdim=True)
-            
-            output[expert_mask] += expert_output * weights
+        # Sort the (token, expert) assignments by expert so every expert
+        # sees one contiguous slice instead of a boolean-mask gather
+        num_tokens = x_flat.size(0)
+        flat_expert_indices = top_k_indices.reshape(-1)
+        flat_token_indices = torch.arange(num_tokens, device=x.device).repeat_interleave(self.top_k)
+        sorted_expert_indices, order = torch.sort(flat_expert_indices, stable=True)
+        sorted_token_indices = flat_token_indices[order]
+        sorted_scores = top_k_scores.reshape(-1)[order]
+        tokens_per_expert = torch.bincount(sorted_expert_indices, minlength=self.num_experts)
+        
+        # Expert capacity: during training each expert takes at most
+        # capacity_factor * (its fair share of assignments); the overflow is
+        # dropped and those tokens pass through on the residual connection
+        if self.training and self.expert_capacity_factor > 0:
+            capacity = math.ceil(self.expert_capacity_factor * num_tokens * self.top_k / self.num_experts)
+            expert_offsets = torch.cumsum(tokens_per_expert, dim=0) - tokens_per_expert
+            position_in_expert = torch.arange(
+                sorted_expert_indices.size(0), device=x.device
+            ) - expert_offsets[sorted_expert_indices]
+            keep = position_in_expert < capacity
+            sorted_token_indices = sorted_token_indices[keep]
+            sorted_scores = sorted_scores[keep]
+            tokens_per_expert = tokens_per_expert.clamp(max=capacity)
+        
+        # Permute tokens once, run the experts, then un-permute with the gate weights
+        expert_inputs = x_flat[sorted_token_indices]
+        expert_outputs = self._run_experts(expert_inputs, tokens_per_expert)
+        output = torch.zeros_like(x_flat).index_add(
+            0, sorted_token_indices, (expert_outputs * sorted_scores.unsqueeze(-1)).to(x_flat.dtype)
+        )
         
         # Reshape back
         output = output.view(batch_size, seq_len, d_model)
@@ -211,6 +360,23 @@ class MegaExpertRouter(nn.Module):
         
         return output, load_balancing_loss
     
+    def _run_experts(self, expert_inputs, tokens_per_expert):
+        """Run each expert on its contiguous slice of the expert-sorted tokens"""
+        if isinstance(self.experts, StackedExpertBank):
+            return self.experts(expert_inputs, tokens_per_expert)
+        
+        expert_outputs = []
+        start = 0
+        for i, count in enumerate(tokens_per_expert.tolist()):
+            if count == 0:
+                continue
+            expert_outputs.append(self.experts[i](expert_inputs[start:start + count]))
+            start += count
+        
+        if not expert_outputs:
+            return expert_inputs
+        return torch.cat(expert_outputs, dim=0)
+    
     def _compute_load_balancing_loss(self, gate_scores):
         """Compute load balancing loss to encourage expert utilization"""
         # Fraction of tokens routed to each expert
@@ -250,21 +416,20 @@ class AdvancedEmotionNet(nn.Module):
         self.emotion_embeddings = nn.Embedding(num_emotions * emotion_intensity_levels, d_model)
         
         # Contextual emotion modulation
-        self.emotion_modulator = nn.MultiheadAttention(d_model, num_heads=8, dropout=0.1)
+        self.emotion_modulator = nn.MultiheadAttention(d_model, num_heads=8, dropout=0.1, batch_first=True)
         
         # Emotion memory for consistency
         self.emotion_memory = nn.Parameter(torch.randn(1, 100, d_model))
         
-    def forward(self, x, context_emotions=None):
+    def forward(self, x, context_emotions=None, return_analysis=True):
         batch_size, seq_len, d_model = x.shape
         
         # Detect emotions in the input
         emotion_logits = self.emotion_detector(x)
         emotion_logits = emotion_logits.view(batch_size, seq_len, self.num_emotions, self.emotion_intensity_levels)
         
-        # Get dominant emotions
-        emotion_probs = F.softmax(emotion_logits.view(batch_size, seq_len, -1), dim=-1)
-        dominant_emotions = torch.argmax(emotion_probs, dim=-1)
+        # Get dominant emotions (softmax is monotonic, so argmax of the logits is the same)
+        dominant_emotions = torch.argmax(emotion_logits.view(batch_size, seq_len, -1), dim=-1)
         
         # Get emotion embeddings
         emotion_embeds = self.emotion_embeddings(dominant_emotions)
@@ -278,7 +443,11 @@ class AdvancedEmotionNet(nn.Module):
         # Combine with input
         emotional_output = x + modulated_emotions * 0.1  # Subtle emotion injection
         
-        # Return output and emotion analysis
+        if not return_analysis:
+            return emotional_output, None
+        
+        # Return output and emotion analysis (emotion_names syncs with the host)
+        emotion_probs = F.softmax(emotion_logits.view(batch_size, seq_len, -1), dim=-1, dtype=torch.float32)
         emotion_analysis = {
             'dominant_emotions': dominant_emotions,
             'emotion_distribution': emotion_probs,
@@ -299,7 +468,7 @@ class SuperMemoryFusionLayer(nn.Module):
         ])
         
         # Memory attention
-        self.memory_attention = nn.MultiheadAttention(d_model, num_heads=8, dropout=0.1)
+        self.memory_attention = nn.MultiheadAttention(d_model, num_heads=8, dropout=0.1, batch_first=True)
         
         # Memory gating
         self.memory_gate = nn.Sequential(
@@ -316,7 +485,10 @@ class SuperMemoryFusionLayer(nn.Module):
     def forward(self, x, memory_vectors):
         """
         x: input tensor [batch, seq_len, d_model]
-        memory_vectors: dict with different memory types
+        memory_vectors: dict with different memory types, each
+            [batch, d_model] or [batch, memory_len, d_model]
+        Every position fuses memory on its own, so the layer is causal and
+        gives the same result under cached decoding.
         """
         if not memory_vectors:
             return x
@@ -330,9 +502,9 @@ class SuperMemoryFusionLayer(nn.Module):
                 # Project memory
                 projected_memory = self.memory_projections[i](memory_tensor)
                 
-                # Ensure proper shape
+                # A single memory vector is one memory slot
                 if projected_memory.dim() == 2:
-                    projected_memory = projected_memory.unsqueeze(1).expand(-1, seq_len, -1)
+                    projected_memory = projected_memory.unsqueeze(1)
                 
                 processed_memories.append(projected_memory)
         
@@ -340,16 +512,19 @@ class SuperMemoryFusionLayer(nn.Module):
             return x
         
         # Stack memories
-        stacked_memories = torch.stack(processed_memories, dim=0)  # [memory_types, batch, seq_len, d_model]
-        
-        # Adaptive memory selection
-        memory_weights = self.memory_selector(x.mean(dim=1))  # [batch, memory_types]
+        num_memories = len(processed_memories)
+        stacked_memories = torch.stack(processed_memories, dim=0)  # [memory_types, batch, memory_len, d_model]
         
-        # Weighted combination of memories
-        weighted_memory = torch.einsum('mbsd,bm->bsd', stacked_memories, memory_weights)
+        # Attention-based memory fusion, one pass per memory type batched together
+        queries = x.unsqueeze(0).expand(num_memories, -1, -1, -1).reshape(-1, seq_len, d_model)
+        memories = stacked_memories.reshape(num_memories * batch_size, -1, d_model)
+        attended, _ = self.memory_attention(queries, memories, memories, need_weights=False)
+        attended = attended.view(num_memories, batch_size, seq_len, d_model)
         
-        # Attention-based memory fusion
-        fused_memory, _ = self.memory_attention(x, weighted_memory, weighted_memory)
+        # Adaptive per-position memory selection over the memory types present
+        memory_weights = self.memory_selector(x)[..., :num_memories]  # [batch, seq_len, memory_types]
+        memory_weights = memory_weights / memory_weights.sum(dim=-1, keepdim=True)
+        fused_memory = torch.einsum('mbsd,bsm->bsd', attended, memory_weights)
         
         # Gating mechanism
         gate_input = torch.cat([x, fused_memory], dim=-1)
@@ -406,16 +581,10 @@ class UltraKnowledgeFilter(nn.Module):
             nn.Linear(d_model * 2, d_model)
         )
     
-    def forward(self, x):
-        # Classify knowledge types
-        knowledge_types = self.knowledge_classifier(x)
-        
+    def forward(self, x, return_analysis=True):
         # Estimate truth confidence
         truth_confidence = self.truth_estimator(x)
         
-        # Detect bias
-        bias_scores = self.bias_detector(x)
-        
         # Quantify uncertainty
         uncertainty = self.uncertainty_estimator(x)
         
@@ -430,6 +599,13 @@ class UltraKnowledgeFilter(nn.Module):
         confidence_mask = (truth_confidence > 0.7).float()
         output = output * confidence_mask
         
+        if not return_analysis:
+            return output, None
+        
+        # Knowledge types and bias only feed the analysis
+        knowledge_types = self.knowledge_classifier(x)
+        bias_scores = self.bias_detector(x)
+        
         # Return output and analysis
         analysis = {
             'knowledge_types': knowledge_types,
@@ -440,7 +616,490 @@ class UltraKnowledgeFilter(nn.Module):
         
         return output, analysis
 
-class MaxedOutSathikNeuralCore(nn.Module):
+PRECISION_DTYPES = {
+    'fp32': None,
+    'bf16': torch.bfloat16,
+    'fp16': torch.float16,
+}
+
+def bf16_supported(device_type='cpu'):
+    """Whether bfloat16 matmuls are natively supported on this device type"""
+    if device_type == 'cuda':
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+def resolve_autocast_dtype(precision='fp32', device_type='cpu'):
+    """
+    Map a precision name ('fp32', 'bf16', 'fp16' or 'auto') to the autocast
+    dtype, or None for plain fp32. 'auto' picks bf16 where it is supported.
+    """
+    if precision == 'auto':
+        precision = 'bf16' if bf16_supported(device_type) else 'fp32'
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(f"precision must be one of {list(PRECISION_DTYPES) + ['auto']}, got {precision!r}")
+    return PRECISION_DTYPES[precision]
+
+def cast_parameters(model, dtype):
+    """
+    Cast a model's parameters to dtype in place. Unlike model.to(dtype),
+    buffers such as the RoPE cos/sin tables stay in fp32.
+    """
+    for param in model.parameters():
+        param.data = param.data.to(dtype)
+    return model
+
+def autocast_context(device_type, dtype=None):
+    """Autocast region for dtype; a no-op context for None/fp32"""
+    if dtype is None or dtype == torch.float32:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device_type, dtype=dtype)
+
+def build_causal_attention_mask(attention_mask, seq_len, past_length=0, device=None):
+    """
+    Build a [batch, 1, seq_len, past_length + seq_len] self-attention mask (1 = attend).
+    attention_mask may be a [batch, past_length + seq_len] padding mask or an
+    already broadcastable mask; either way it is combined with the causal mask.
+    """
+    if attention_mask is None and seq_len == 1:
+        # A single new token may attend to everything in the cache
+        return None
+    
+    total_length = past_length + seq_len
+    causal_mask = torch.ones(seq_len, total_length, dtype=torch.bool, device=device)
+    causal_mask = torch.tril(causal_mask, diagonal=past_length)[None, None, :, :]
+    
+    if attention_mask is None:
+        return causal_mask
+    if attention_mask.dim() == 2:
+        # Padding rows still attend to themselves, so no row is fully masked
+        # (a fully masked row becomes NaN in the fused attention kernel)
+        self_positions = torch.zeros(seq_len, total_length, dtype=torch.bool, device=device)
+        self_positions[:, past_length:] = torch.eye(seq_len, dtype=torch.bool, device=device)
+        padding_mask = attention_mask[:, None, None, -total_length:].bool()
+        return (causal_mask & padding_mask) | self_positions
+    if attention_mask.dim() == 3:
+        attention_mask = attention_mask.unsqueeze(1)
+    return causal_mask & attention_mask.bool()
+
+def build_position_ids(attention_mask, batch_size, seq_len, past_length=0, device=None):
+    """
+    Position ids for the current tokens. With a 2D padding mask the positions
+    count only real tokens, so left-padded prompts start at position 0.
+    """
+    if attention_mask is not None and attention_mask.dim() == 2:
+        position_ids = (attention_mask.long().cumsum(dim=-1) - 1).clamp(min=0)
+        return position_ids[:, -seq_len:]
+    
+    position_ids = torch.arange(past_length, past_length + seq_len, dtype=torch.long, device=device)
+    return position_ids.unsqueeze(0).expand(batch_size, -1)
+
+def build_document_attention_mask(document_ids):
+    """
+    [batch, 1, seq_len, seq_len] mask for packed rows: each token attends only
+    to tokens of its own document (the causal part is added by the model).
+    document_ids is [batch, seq_len].
+    """
+    return (document_ids.unsqueeze(-1) == document_ids.unsqueeze(-2)).unsqueeze(1)
+
+def left_pad_sequences(sequences, pad_token_id=0, device=None):
+    """Left-pad a list of token id lists into (input_ids, attention_mask) tensors"""
+    max_length = max(len(sequence) for sequence in sequences)
+    input_ids = torch.full((len(sequences), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), max_length), dtype=torch.long)
+    
+    for row, sequence in enumerate(sequences):
+        if sequence:
+            input_ids[row, -len(sequence):] = torch.tensor(sequence, dtype=torch.long)
+            attention_mask[row, -len(sequence):] = 1
+    
+    return input_ids.to(device), attention_mask.to(device)
+
+def materialize_from_state_dict(model, state_dict, device=None):
+    """
+    Load weights into a model constructed under torch.device('meta').
+    Parameters are assigned straight from state_dict (no random init and no
+    copy, so mmap-loaded tensors stay lazily paged), then the non-persistent
+    RoPE tables, which have no data on meta, are rebuilt.
+    """
+    model.load_state_dict(state_dict, assign=True)
+    if device is not None:
+        model.to(device)
+    for module in model.modules():
+        if isinstance(module, RotaryPositionalEncoding):
+            module.build_tables()
+    return model
+
+def apply_output_heads(output_heads, hidden_states, inference_mode=False, num_logits_to_keep=0):
+    """
+    Run the output heads on the final hidden states. The vocabulary-sized
+    language-modeling head only sees the last num_logits_to_keep positions
+    (all of them when 0; the last one by default under inference_mode, which
+    also skips the other heads).
+    """
+    if inference_mode and num_logits_to_keep <= 0:
+        num_logits_to_keep = 1
+    lm_hidden_states = hidden_states[:, -num_logits_to_keep:, :] if num_logits_to_keep > 0 else hidden_states
+    
+    outputs = {'language_modeling': output_heads['language_modeling'](lm_hidden_states)}
+    if not inference_mode:
+        for head_name, head in output_heads.items():
+            if head_name != 'language_modeling':
+                outputs[head_name] = head(hidden_states)
+    return outputs
+
+class LogitsProcessor:
+    """
+    Batched next-token sampling: repetition penalty, temperature, top-k, then
+    top-p within the top-k candidates. Settings are scalars or [batch]
+    tensors (one value per row). Only the [batch, k] candidate set is sorted
+    and filtered, never the whole vocabulary (unless top_k is 0 and top_p is
+    active). top_k <= 0 disables top-k and top_p >= 1 disables top-p.
+    """
+    
+    def __init__(self, temperature=1.0, top_k=50, top_p=0.95, repetition_penalty=1.0, do_sample=True):
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.do_sample = do_sample
+    
+    def _penalizes(self, input_ids):
+        return input_ids is not None and (
+            torch.is_tensor(self.repetition_penalty) or self.repetition_penalty != 1.0
+        )
+    
+    @staticmethod
+    def _column(value, logits):
+        # Per-row settings broadcast against [batch, k]
+        return value.to(logits.device).unsqueeze(-1) if torch.is_tensor(value) else value
+    
+    def candidates(self, logits, input_ids=None):
+        """
+        Filtered candidates of fp32 logits [batch, vocab]: (values, indices),
+        both [batch, k] in descending order, removed candidates set to -inf.
+        input_ids [batch, seq] are the tokens the repetition penalty applies to.
+        """
+        vocab_size = logits.size(-1)
+        
+        if self._penalizes(input_ids):
+            # CTRL-style penalty on tokens already in the sequence: one gather and one scatter
+            penalty = self._column(self.repetition_penalty, logits)
+            seen = logits.gather(-1, input_ids)
+            seen = torch.where(seen > 0, seen / penalty, seen * penalty)
+            logits = logits.scatter(-1, input_ids, seen)
+        
+        logits = logits / self._column(self.temperature, logits)
+        
+        # Top-k via a partial sort: only the largest k logits are kept
+        if torch.is_tensor(self.top_k):
+            row_k = torch.where(self.top_k > 0, self.top_k, torch.full_like(self.top_k, vocab_size))
+            row_k = row_k.clamp(max=vocab_size).to(logits.device)
+            values, indices = torch.topk(logits, int(row_k.max()), dim=-1)
+            positions = torch.arange(values.size(-1), device=logits.device)
+            values = values.masked_fill(positions >= row_k.unsqueeze(-1), -float('inf'))
+        else:
+            k = self.top_k if 0 < self.top_k < vocab_size else vocab_size
+            values, indices = torch.topk(logits, k, dim=-1)
+        
+        # Top-p over the (already sorted) candidates: keep tokens until the mass passes top_p
+        if torch.is_tensor(self.top_p) or self.top_p < 1.0:
+            probs = F.softmax(values, dim=-1)
+            mass_before = probs.cumsum(dim=-1) - probs
+            values = values.masked_fill(mass_before > self._column(self.top_p, logits), -float('inf'))
+        
+        return values, indices
+    
+    def probs(self, logits, input_ids=None):
+        """Full-vocabulary sampling distribution [batch, vocab] after filtering"""
+        values, indices = self.candidates(logits, input_ids)
+        return torch.zeros_like(logits).scatter(-1, indices, F.softmax(values, dim=-1))
+    
+    def __call__(self, logits, input_ids=None):
+        """Next token per row, [batch]"""
+        if not torch.is_tensor(self.do_sample) and not self.do_sample:
+            # Greedy: the penalty can still reorder tokens, temperature and filters cannot
+            if self._penalizes(input_ids):
+                return self.candidates(logits, input_ids)[1][:, 0]
+            return logits.argmax(dim=-1)
+        
+        values, indices = self.candidates(logits, input_ids)
+        choice = torch.multinomial(F.softmax(values, dim=-1), num_samples=1)
+        sampled = indices.gather(-1, choice).squeeze(-1)
+        if torch.is_tensor(self.do_sample):
+            return torch.where(self.do_sample.to(logits.device), sampled, indices[:, 0])
+        return sampled
+
+class NeuralCoreGenerationMixin:
+    """
+    Cached autoregressive generation shared by the neural cores.
+    The host module's forward() must accept past_key_values/use_cache/
+    inference_mode/num_logits_to_keep and return the cache under
+    'past_key_values'.
+    """
+    
+    def _decode_steps(
+        self,
+        input_ids,
+        max_length,
+        temperature,
+        top_k,
+        top_p,
+        do_sample,
+        pad_token_id,
+        eos_token_id,
+        attention_mask,
+        memory_vectors,
+        keep_prefill_outputs,
+        autocast_dtype,
+        prefix_key_values=None,
+        repetition_penalty=1.0
+    ):
+        """
+        Cached decoding loop shared by generate() and stream_generate().
+        Yields (next_token [batch, 1], prefill_outputs) once per sampled token;
+        prefill_outputs is the prompt forward on the first step when
+        keep_prefill_outputs is set, otherwise None.
+        """
+        batch_size = input_ids.size(0)
+        current_length = input_ids.size(1)
+        
+        # Past key values: the prompt is prefilled once, then only the newest token is fed
+        past_key_values = None
+        next_input_ids = input_ids
+        if prefix_key_values is not None:
+            # The leading tokens are already encoded: prefill only the rest (at least one token)
+            prefix_length = min(prefix_key_values[0][0].size(2), current_length - 1)
+            past_key_values = [
+                (k[:, :, :prefix_length].expand(batch_size, -1, -1, -1),
+                 v[:, :, :prefix_length].expand(batch_size, -1, -1, -1))
+                for k, v in prefix_key_values
+            ]
+            next_input_ids = input_ids[:, prefix_length:]
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=input_ids.device)
+        
+        logits_processor = LogitsProcessor(temperature, top_k, top_p, repetition_penalty, do_sample)
+        # The whole sequence is only tracked when the repetition penalty needs it
+        history = input_ids if repetition_penalty != 1.0 else None
+        
+        for step in range(max_length - current_length):
+            # Grad mode is only switched off around the step: the caller runs between yields
+            with torch.no_grad():
+                # Forward pass
+                is_prefill = step == 0
+                with autocast_context(input_ids.device.type, autocast_dtype):
+                    outputs = self.forward(
+                        next_input_ids,
+                        attention_mask=attention_mask,
+                        memory_vectors=memory_vectors,
+                        past_key_values=past_key_values,
+                        use_cache=True,
+                        return_dict=True,
+                        inference_mode=not (is_prefill and keep_prefill_outputs),
+                        num_logits_to_keep=1
+                    )
+                past_key_values = outputs['past_key_values']
+                prefill_outputs = None
+                if is_prefill and keep_prefill_outputs:
+                    prefill_outputs = {k: v for k, v in outputs.items() if k != 'past_key_values'}
+                
+                # Sample from the language modeling logits
+                logits = outputs['outputs']['language_modeling'][:, -1, :].float()
+                next_token = logits_processor(logits, history).unsqueeze(-1)
+                
+                # Rows that already emitted EOS only produce padding
+                next_token = next_token.masked_fill(finished.unsqueeze(-1), pad_token_id)
+            
+            next_input_ids = next_token
+            if history is not None:
+                history = torch.cat([history, next_token], dim=-1)
+            if attention_mask is not None:
+                attention_mask = torch.cat(
+                    [attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1
+                )
+            
+            # Check for EOS token per row
+            finished |= next_token.squeeze(-1) == eos_token_id
+            yield next_token, prefill_outputs
+            if finished.all():
+                break
+    
+    def generate(
+        self,
+        input_ids,
+        max_length=512,
+        temperature=1.0,
+        top_k=50,
+        top_p=0.95,
+        do_sample=True,
+        pad_token_id=0,
+        eos_token_id=1,
+        attention_mask=None,
+        memory_vectors=None,
+        return_prefill_outputs=False,
+        autocast_dtype=None,
+        prefix_key_values=None,
+        repetition_penalty=1.0,
+        draft_model=None,
+        num_draft_tokens=4,
+        speculative_metrics=None
+    ):
+        """
+        Advanced text generation with multiple sampling strategies.
+        Batches are supported: prompts of different lengths are left-padded
+        with an attention_mask (see left_pad_sequences). Each row stops at its
+        own EOS and is filled with pad_token_id until every row has finished.
+        memory_vectors condition every step. With return_prefill_outputs=True
+        the prompt forward keeps its heads and analyses and is returned as
+        (input_ids, prefill_outputs), so callers need no second forward.
+        autocast_dtype (e.g. torch.bfloat16) runs the forwards under autocast;
+        sampling always happens on fp32 logits. prefix_key_values is the
+        cache of the first input_ids tokens (see PrefixKVCache); only the
+        tokens after it are prefilled. repetition_penalty > 1 discourages
+        tokens already in the sequence. With a draft_model (a smaller core
+        sharing the vocabulary) a single sequence is decoded speculatively,
+        num_draft_tokens per target forward (see neural_core.speculative);
+        speculative_metrics, if given, accumulates its acceptance counters.
+        """
+        self.eval()
+        
+        if draft_model is not None:
+            if attention_mask is not None or repetition_penalty != 1.0:
+                raise ValueError("speculative decoding takes neither an attention_mask nor a repetition_penalty")
+            from neural_core.speculative import speculative_generate
+            return speculative_generate(
+                self, draft_model, input_ids,
+                num_draft_tokens=num_draft_tokens,
+                max_length=max_length,
+                temperature=temperature,
+                top_k=top_k,
+                top_p=top_p,
+                do_sample=do_sample,
+                eos_token_id=eos_token_id,
+                memory_vectors=memory_vectors,
+                return_prefill_outputs=return_prefill_outputs,
+                autocast_dtype=autocast_dtype,
+                prefix_key_values=prefix_key_values,
+                metrics=speculative_metrics
+            )
+        
+        prefill_outputs = None
+        steps = self._decode_steps(
+            input_ids, max_length, temperature, top_k, top_p, do_sample,
+            pad_token_id, eos_token_id, attention_mask, memory_vectors,
+            return_prefill_outputs, autocast_dtype, prefix_key_values, repetition_penalty
+        )
+        generated = [input_ids]
+        for next_token, step_prefill_outputs in steps:
+            if step_prefill_outputs is not None:
+                prefill_outputs = step_prefill_outputs
+            generated.append(next_token)
+        input_ids = torch.cat(generated, dim=-1)
+        
+        if return_prefill_outputs:
+            if prefill_outputs is None:
+                # Prompt already at max_length: nothing decoded, still analyse it
+                with torch.no_grad(), autocast_context(input_ids.device.type, autocast_dtype):
+                    prefill_outputs = self.forward(
+                        input_ids, attention_mask=attention_mask, memory_vectors=memory_vectors
+                    )
+            return input_ids, prefill_outputs
+        return input_ids
+    
+    def stream_generate(
+        self,
+        input_ids,
+        max_length=512,
+        temperature=1.0,
+        top_k=50,
+        top_p=0.95,
+        do_sample=True,
+        pad_token_id=0,
+        eos_token_id=1,
+        attention_mask=None,
+        memory_vectors=None,
+        autocast_dtype=None,
+        prefix_key_values=None,
+        repetition_penalty=1.0
+    ):
+        """
+        Streaming variant of generate(): a generator yielding each sampled
+        token as a [batch] tensor as soon as it is chosen, so the first token
+        arrives after the prefill rather than after the whole generation.
+        Rows that have finished yield pad_token_id; the stream ends once every
+        row has produced EOS or max_length is reached. Closing the generator
+        early stops decoding.
+        """
+        self.eval()
+        
+        steps = self._decode_steps(
+            input_ids, max_length, temperature, top_k, top_p, do_sample,
+            pad_token_id, eos_token_id, attention_mask, memory_vectors,
+            False, autocast_dtype, prefix_key_values, repetition_penalty
+        )
+        for next_token, _ in steps:
+            yield next_token.squeeze(-1)
+    
+    def generate_batch(self, prompts, max_new_tokens=64, pad_token_id=0, eos_token_id=1, **generation_kwargs):
+        """
+        Generate continuations for several tokenized prompts in one batch.
+        Returns one list of new token ids per prompt, without padding or EOS.
+        """
+        device = next(self.parameters()).device
+        input_ids, attention_mask = left_pad_sequences(prompts, pad_token_id, device)
+        prompt_length = input_ids.size(1)
+        
+        generated = self.generate(
+            input_ids,
+            max_length=prompt_length + max_new_tokens,
+            pad_token_id=pad_token_id,
+            eos_token_id=eos_token_id,
+            attention_mask=attention_mask,
+            **generation_kwargs
+        )
+        
+        continuations = []
+        for row in generated[:, prompt_length:].tolist():
+            if eos_token_id in row:
+                row = row[:row.index(eos_token_id)]
+            continuations.append(row)
+        
+        return continuations
+
+class GradientCheckpointingMixin:
+    """
+    Activation checkpointing switches shared by the neural cores.
+    'block' recomputes a whole transformer block in backward; 'moe' only
+    recomputes the expert router, which holds most of the activations.
+    """
+    
+    CHECKPOINT_GRANULARITIES = ('block', 'moe')
+    
+    def gradient_checkpointing_enable(self, granularity='block'):
+        """Turn on activation checkpointing at the given granularity"""
+        if granularity not in self.CHECKPOINT_GRANULARITIES:
+            raise ValueError(
+                f"checkpoint granularity must be one of {self.CHECKPOINT_GRANULARITIES}, got {granularity!r}"
+            )
+        self.gradient_checkpointing = True
+        self.checkpoint_granularity = granularity
+    
+    def gradient_checkpointing_disable(self):
+        """Turn off activation checkpointing"""
+        self.gradient_checkpointing = False
+    
+    def _use_gradient_checkpointing(self, granularity):
+        # Only worth it when a backward pass will follow
+        return (
+            self.gradient_checkpointing
+            and self.checkpoint_granularity == granularity
+            and self.training
+            and torch.is_grad_enabled()
+        )
+
+class MaxedOutSathikNeuralCore(NeuralCoreGenerationMixin, GradientCheckpointingMixin, nn.Module):
     """The ultimate maxed-out Sathik AI neural core"""
     def __init__(
         self,
@@ -451,7 +1110,10 @@ class MaxedOutSathikNeuralCore(nn.Module):
         num_experts=128,
         top_k=16,
         max_position_embeddings=16384,
-        dropout=0.1
+        dropout=0.1,
+        stacked_experts=False,
+        gradient_checkpointing=True,
+        checkpoint_granularity='block'
     ):
         super().__init__()
         
@@ -463,12 +1125,17 @@ class MaxedOutSathikNeuralCore(nn.Module):
             vocab_size, d_model, max_position_embeddings
         )
         
+        # One RoPE cos/sin table shared by every attention module
+        rope = RotaryPositionalEncoding(d_model // num_heads, max_position_embeddings)
+        
         # Transformer layers with all enhancements
         self.layers = nn.ModuleList([
             nn.ModuleDict({
-                "self_attn": SuperMultiHeadAttention(d_model, num_heads, dropout),
-                "cross_attn": SuperMultiHeadAttention(d_model, num_heads, dropout),
-                "expert_router": MegaExpertRouter(d_model, num_experts, top_k),
+                "self_attn": SuperMultiHeadAttention(d_model, num_heads, dropout, rope=rope),
+                "cross_attn": SuperMultiHeadAttention(d_model, num_heads, dropout, rope=rope),
+                "expert_router": MegaExpertRouter(
+                    d_model, num_experts, top_k, stacked_experts=stacked_experts
+                ),
                 "emotion_net": AdvancedEmotionNet(d_model),
                 "memory_fusion": SuperMemoryFusionLayer(d_model),
                 "knowledge_filter": UltraKnowledgeFilter(d_model),
@@ -479,13 +1146,13 @@ class MaxedOutSathikNeuralCore(nn.Module):
                     nn.Linear(d_model * 8, d_model),
                     nn.Dropout(dropout)
                 ),
-                "norm1": nn.LayerNorm(d_model),
-                "norm2": nn.LayerNorm(d_model),
-                "norm3": nn.LayerNorm(d_model),
-                "norm4": nn.LayerNorm(d_model),
-                "norm5": nn.LayerNorm(d_model),
-                "norm6": nn.LayerNorm(d_model),
-                "norm7": nn.LayerNorm(d_model),
+                "norm1": FP32LayerNorm(d_model),
+                "norm2": FP32LayerNorm(d_model),
+                "norm3": FP32LayerNorm(d_model),
+                "norm4": FP32LayerNorm(d_model),
+                "norm5": FP32LayerNorm(d_model),
+                "norm6": FP32LayerNorm(d_model),
+                "norm7": FP32LayerNorm(d_model),
                 "dropout": nn.Dropout(dropout),
             })
             for _ in range(num_layers)
@@ -500,8 +1167,11 @@ class MaxedOutSathikNeuralCore(nn.Module):
             "creativity": nn.Linear(d_model, 1)
         })
         
-        # Gradient checkpointing for memory efficiency
-        self.gradient_checkpointing = True
+        # Gradient checkpointing for memory efficiency ('block' or 'moe', training only)
+        self.gradient_checkpointing = gradient_checkpointing
+        self.checkpoint_granularity = checkpoint_granularity
+        if gradient_checkpointing:
+            self.gradient_checkpointing_enable(checkpoint_granularity)
         
         # Initialize weights
         self.apply(self._init_weights)
@@ -518,6 +1188,74 @@ class MaxedOutSathikNeuralCore(nn.Module):
             torch.nn.init.zeros_(module.bias)
             torch.nn.init.ones_(module.weight)
     
+    def _block_forward(
+        self,
+        layer,
+        hidden_states,
+        self_attn_mask,
+        position_ids,
+        past_key_value,
+        cross_attention_input,
+        memory_vectors,
+        output_attentions,
+        inference_mode
+    ):
+        """Run one transformer block; the unit of whole-block checkpointing"""
+        # Self-attention with residual connection
+        attn_output, attn_weights, present_key_value = layer["self_attn"](
+            hidden_states, hidden_states, hidden_states, self_attn_mask,
+            past_key_value=past_key_value,
+            position_ids=position_ids,
+            output_attentions=output_attentions
+        )
+        hidden_states = layer["norm1"](hidden_states + layer["dropout"](attn_output))
+        
+        # Cross-attention (if provided)
+        if cross_attention_input is not None:
+            cross_attn_output, _, _ = layer["cross_attn"](
+                hidden_states, cross_attention_input, cross_attention_input
+            )
+            hidden_states = layer["norm2"](hidden_states + layer["dropout"](cross_attn_output))
+        
+        # Mixture of Experts
+        if self._use_gradient_checkpointing('moe'):
+            expert_output, load_balancing_loss = checkpoint(
+                layer["expert_router"], hidden_states, use_reentrant=False
+            )
+        else:
+            expert_output, load_balancing_loss = layer["expert_router"](hidden_states)
+        hidden_states = layer["norm3"](hidden_states + layer["dropout"](expert_output))
+        
+        # Emotion processing
+        emotion_output, emotion_analysis = layer["emotion_net"](
+            hidden_states, return_analysis=not inference_mode
+        )
+        hidden_states = layer["norm4"](hidden_states + layer["dropout"](emotion_output))
+        
+        # Memory fusion
+        if memory_vectors:
+            memory_output = layer["memory_fusion"](hidden_states, memory_vectors)
+            hidden_states = layer["norm5"](hidden_states + layer["dropout"](memory_output))
+        
+        # Knowledge filtering
+        knowledge_output, knowledge_analysis = layer["knowledge_filter"](
+            hidden_states, return_analysis=not inference_mode
+        )
+        hidden_states = layer["norm6"](hidden_states + layer["dropout"](knowledge_output))
+        
+        # Feed-forward
+        ff_output = layer["feed_forward"](hidden_states)
+        hidden_states = layer["norm7"](hidden_states + layer["dropout"](ff_output))
+        
+        return (
+            hidden_states,
+            attn_weights,
+            present_key_value,
+            load_balancing_loss,
+            emotion_analysis,
+            knowledge_analysis
+        )
+    
     def forward(
         self,
         input_ids,
@@ -528,8 +1266,32 @@ class MaxedOutSathikNeuralCore(nn.Module):
         cross_attention_input=None,
         output_attentions=False,
         output_hidden_states=False,
-        return_dict=True
+        return_dict=True,
+        past_key_values=None,
+        use_cache=False,
+        inference_mode=False,
+        num_logits_to_keep=0
     ):
+        """
+        With inference_mode=True only the language-modeling head is computed,
+        on the last position, and no per-layer analyses are built.
+        num_logits_to_keep > 0 projects only that many trailing positions
+        through the language-modeling head (0 keeps every position).
+        """
+        batch_size, seq_len = input_ids.shape
+        past_length = past_key_values[0][0].size(2) if past_key_values is not None else 0
+        
+        # Positions continue after any cached tokens (and skip left padding)
+        if position_ids is None:
+            position_ids = build_position_ids(
+                attention_mask, batch_size, seq_len, past_length, input_ids.device
+            )
+        
+        # Causal self-attention mask (combined with any padding mask)
+        self_attn_mask = build_causal_attention_mask(
+            attention_mask, seq_len, past_length, input_ids.device
+        )
+        
         # Input embeddings
         hidden_states = self.token_input_layer(
             input_ids, position_ids, token_type_ids
@@ -539,6 +1301,7 @@ class MaxedOutSathikNeuralCore(nn.Module):
         all_hidden_states = [] if output_hidden_states else None
         all_attentions = [] if output_attentions else None
         all_analyses = []
+        next_key_values = [] if use_cache else None
         total_load_balancing_loss = 0
         
         # Process through all layers
@@ -546,59 +1309,52 @@ class MaxedOutSathikNeuralCore(nn.Module):
             if output_hidden_states:
                 all_hidden_states.append(hidden_states)
             
-            # Self-attention with residual connection
-            attn_output, attn_weights, _ = layer["self_attn"](
-                hidden_states, hidden_states, hidden_states, attention_mask
+            block_args = (
+                layer,
+                hidden_states,
+                self_attn_mask,
+                position_ids,
+                past_key_values[i] if past_key_values is not None else None,
+                cross_attention_input,
+                memory_vectors,
+                output_attentions,
+                inference_mode
             )
-            hidden_states = layer["norm1"](hidden_states + layer["dropout"](attn_output))
             
+            # Whole-block checkpointing keeps only the block input and recomputes the rest in backward
+            if self._use_gradient_checkpointing('block'):
+                block_outputs = checkpoint(self._block_forward, *block_args, use_reentrant=False)
+            else:
+                block_outputs = self._block_forward(*block_args)
+            (
+                hidden_states,
+                attn_weights,
+                present_key_value,
+                load_balancing_loss,
+                emotion_analysis,
+                knowledge_analysis
+            ) = block_outputs
+            
+            if use_cache:
+                next_key_values.append(present_key_value)
             if output_attentions:
                 all_attentions.append(attn_weights)
-            
-            # Cross-attention (if provided)
-            if cross_attention_input is not None:
-                cross_attn_output, _, _ = layer["cross_attn"](
-                    hidden_states, cross_attention_input, cross_attention_input
-                )
-                hidden_states = layer["norm2"](hidden_states + layer["dropout"](cross_attn_output))
-            
-            # Mixture of Experts
-            expert_output, load_balancing_loss = layer["expert_router"](hidden_states)
-            hidden_states = layer["norm3"](hidden_states + layer["dropout"](expert_output))
             total_load_balancing_loss += load_balancing_loss
             
-            # Emotion processing
-            emotion_output, emotion_analysis = layer["emotion_net"](hidden_states)
-            hidden_states = layer["norm4"](hidden_states + layer["dropout"](emotion_output))
-            
-            # Memory fusion
-            if memory_vectors:
-                memory_output = layer["memory_fusion"](hidden_states, memory_vectors)
-                hidden_states = layer["norm5"](hidden_states + layer["dropout"](memory_output))
-            
-            # Knowledge filtering
-            knowledge_output, knowledge_analysis = layer["knowledge_filter"](hidden_states)
-            hidden_states = layer["norm6"](hidden_states + layer["dropout"](knowledge_output))
-            
-            # Feed-forward
-            ff_output = layer["feed_forward"](hidden_states)
-            hidden_states = layer["norm7"](hidden_states + layer["dropout"](ff_output))
-            
             # Store analyses
-            all_analyses.append({
-                'layer': i,
-                'emotion_analysis': emotion_analysis,
-                'knowledge_analysis': knowledge_analysis
-            })
+            if not inference_mode:
+                all_analyses.append({
+                    'layer': i,
+                    'emotion_analysis': emotion_analysis,
+                    'knowledge_analysis': knowledge_analysis
+                })
         
         # Final hidden state
         if output_hidden_states:
             all_hidden_states.append(hidden_states)
         
         # Multiple output heads
-        outputs = {}
-        for head_name, head in self.output_heads.items():
-            outputs[head_name] = head(hidden_states)
+        outputs = apply_output_heads(self.output_heads, hidden_states, inference_mode, num_logits_to_keep)
         
         # Prepare return values
         if return_dict:
@@ -608,7 +1364,8 @@ class MaxedOutSathikNeuralCore(nn.Module):
                 'attentions': all_attentions,
                 'outputs': outputs,
                 'analyses': all_analyses,
-                'load_balancing_loss': total_load_balancing_loss
+                'load_balancing_loss': total_load_balancing_loss,
+                'past_key_values': next_key_values
             }
         else:
             return (
@@ -619,74 +1376,6 @@ class MaxedOutSathikNeuralCore(nn.Module):
                 all_analyses,
                 total_load_balancing_loss
             )
-    
-    def generate(
-        self,
-        input_ids,
-        max_length=512,
-        temperature=1.0,
-        top_k=50,
-        top_p=0.95,
-        do_sample=True,
-        pad_token_id=0,
-        eos_token_id=1
-    ):
-        """Advanced text generation with multiple sampling strategies"""
-        self.eval()
-        
-        batch_size = input_ids.size(0)
-        current_length = input_ids.size(1)
-        
-        # Initialize past key values for efficient generation
-        past_key_values = None
-        
-        with torch.no_grad():
-            for _ in range(max_length - current_length):
-                # Forward pass
-                outputs = self.forward(
-                    input_ids[:, -1:] if past_key_values else input_ids,
-                    return_dict=True
-                )
-                
-                # Get language modeling logits
-                logits = outputs['outputs']['language_modeling'][:, -1, :]
-                
-                # Apply temperature
-                logits = logits / temperature
-                
-                # Top-k filtering
-                if top_k > 0:
-                    top_k_logits, _ = torch.topk(logits, top_k)
-                    logits[logits < top_k_logits[:, [-1]]] = -float('inf')
-                
-                # Top-p (nucleus) filtering
-                if top_p < 1.0:
-                    sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-                    cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
-                    
-                    # Remove tokens with cumulative probability above the threshold
-                    sorted_indices_to_remove = cumulative_probs > top_p
-                    sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
-                    sorted_indices_to_remove[..., 0] = 0
-                    
-                    indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
-                    logits[indices_to_remove] = -float('inf')
-                
-                # Sample next token
-                if do_sample:
-                    probs = F.softmax(logits, dim=-1)
-                    next_token = torch.multinomial(probs, num_samples=1)
-                else:
-                    next_token = torch.argmax(logits, dim=-1, keepdim=True)
-                
-                # Append to sequence
-                input_ids = torch.cat([input_ids, next_token], dim=-1)
-                
-                # Check for EOS token
-                if next_token.item() == eos_token_id:
-                    break
-        
-        return input_ids
 
 # Example usage and testing
 if __name__ == "__main__":
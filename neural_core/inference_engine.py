@@ -0,0 +1,322 @@
+"""
+Continuous-batching inference for the neural cores.
+
+One running batch is decoded a token at a time. Between decode steps,
+waiting requests are prefilled and merged into the batch, and finished
+sequences leave it (iteration-level scheduling). Under concurrent load, every
+decode step serves every active request instead of one request at a time.
+
+The batch KV cache is left-padded: each row keeps its own cache length,
+recorded in a [batch, cache_length] attention mask. Rows only need
+re-aligning when a request joins or leaves, not on every step.
+"""
+import collections
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import torch
+import torch.nn.functional as F
+
+from neural_core.advanced_neural_core import LogitsProcessor, autocast_context
+
+logger = logging.getLogger(__name__)
+
+_request_ids = itertools.count()
+
+@dataclass
+class GenerationRequest:
+    """One prompt queued on a ContinuousBatchingEngine"""
+    prompt: List[int]
+    max_new_tokens: int = 64
+    temperature: float = 1.0
+    top_k: int = 50
+    top_p: float = 0.95
+    do_sample: bool = True
+    memory_vectors: Optional[Dict[str, torch.Tensor]] = None
+    return_prefill_outputs: bool = False
+    on_token: Optional[Callable[[int], None]] = None
+    prefix_key_values: Optional[List[Any]] = None  # cache of the leading prompt tokens (PrefixKVCache)
+    request_id: int = field(default_factory=lambda: next(_request_ids))
+    tokens: List[int] = field(default_factory=list)
+    prefill_outputs: Optional[Dict[str, Any]] = None
+    future: Future = field(default_factory=Future)
+
+    def memory_layout(self):
+        """Memory names and slot shapes; only requests with the same layout share a batch"""
+        return tuple(sorted(
+            (name, tuple(vectors.shape[1:])) for name, vectors in (self.memory_vectors or {}).items()
+        ))
+
+def _left_pad_cache(tensor, length):
+    """Left-pad a [batch, heads, time, head_dim] cache tensor to length positions"""
+    missing = length - tensor.size(2)
+    if missing == 0:
+        return tensor
+    return F.pad(tensor, (0, 0, missing, 0))
+
+class ContinuousBatchingEngine:
+    """
+    Iteration-level scheduler in front of a neural core (any model using
+    NeuralCoreGenerationMixin's forward contract). Call submit() from any
+    thread. Decoding runs either on the engine's own thread (start()/stop())
+    or by calling step() / run_until_idle() directly.
+    """
+
+    def __init__(self, model, max_batch_size=16, eos_token_id=1, autocast_dtype=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.eos_token_id = eos_token_id
+        self.autocast_dtype = autocast_dtype
+        self.device = next(model.parameters()).device
+
+        self._waiting = collections.deque()  # append/popleft are thread-safe
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset_batch()
+
+    def _reset_batch(self):
+        self._running: List[GenerationRequest] = []
+        self._past_key_values = None   # per layer (K, V), [batch, heads, cache_length, head_dim]
+        self._attention_mask = None    # [batch, cache_length], 0 = left padding
+        self._memory_vectors = None    # name -> [batch, slots, d_model]
+        self._last_tokens = None       # [batch, 1], fed to the next decode step
+
+    def submit(self, prompt: List[int], **generation_kwargs) -> GenerationRequest:
+        """Queue a tokenized prompt; the returned request's future resolves to its new token ids"""
+        if not prompt:
+            raise ValueError("prompt must contain at least one token")
+        request = GenerationRequest(list(prompt), **generation_kwargs)
+        if request.memory_vectors:
+            request.memory_vectors = {
+                name: (vectors.unsqueeze(1) if vectors.dim() == 2 else vectors).to(self.device)
+                for name, vectors in request.memory_vectors.items()
+            }
+        self._waiting.append(request)
+        self._wakeup.set()
+        return request
+
+    def generate(self, prompt: List[int], timeout: Optional[float] = None, **generation_kwargs) -> List[int]:
+        """Submit a prompt and block until its continuation (without EOS) is ready"""
+        return self.submit(prompt, **generation_kwargs).future.result(timeout)
+
+    def stream(self, prompt: List[int], **generation_kwargs) -> Iterator[int]:
+        """Submit a prompt and yield its new token ids as the engine decodes them"""
+        tokens = queue.Queue()
+        request = self.submit(prompt, on_token=tokens.put, **generation_kwargs)
+        request.future.add_done_callback(lambda _: tokens.put(None))
+        while True:
+            token = tokens.get()
+            if token is None:
+                break
+            yield token
+        request.future.result()  # re-raise a decoding failure
+
+    @property
+    def num_running(self) -> int:
+        return len(self._running)
+
+    def step(self) -> int:
+        """Admit waiting requests, then decode one token for every running one; returns the batch size"""
+        try:
+            with torch.no_grad():
+                self._admit()
+                if self._running:
+                    self._decode()
+        except Exception as e:
+            logger.error(f"Inference engine step failed: {e}", exc_info=True)
+            for request in self._running:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            self._reset_batch()
+        return len(self._running)
+
+    def run_until_idle(self):
+        """Step until no request is waiting or running"""
+        while self._running or self._waiting:
+            self.step()
+
+    def start(self):
+        """Run the scheduling loop on a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='inference-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background loop; requests still queued are left unfinished"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._running and not self._waiting:
+                self._wakeup.wait(timeout=0.1)
+                self._wakeup.clear()
+                continue
+            self.step()
+
+    def _admit(self):
+        """Prefill waiting requests while the batch has room and their memory layout matches"""
+        while len(self._running) < self.max_batch_size:
+            if not self._waiting:
+                break
+            request = self._waiting[0]
+            if self._running and request.memory_layout() != self._running[0].memory_layout():
+                # Requests are admitted in order, so this one waits for the batch to drain
+                break
+            self._waiting.popleft()
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                # A bad prompt fails only its own request
+                logger.error(f"Prefill failed for request {request.request_id}: {e}", exc_info=True)
+                request.future.set_exception(e)
+
+    def _prefill(self, request: GenerationRequest):
+        self.model.eval()
+        input_ids = torch.tensor([request.prompt], dtype=torch.long, device=self.device)
+        past_key_values = None
+        if request.prefix_key_values is not None:
+            # Only the tokens after the cached prefix need prefilling
+            prefix_length = min(request.prefix_key_values[0][0].size(2), len(request.prompt) - 1)
+            past_key_values = [
+                (k[:, :, :prefix_length], v[:, :, :prefix_length]) for k, v in request.prefix_key_values
+            ]
+            input_ids = input_ids[:, prefix_length:]
+        with autocast_context(self.device.type, self.autocast_dtype):
+            outputs = self.model(
+                input_ids,
+                memory_vectors=request.memory_vectors,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+                inference_mode=not request.return_prefill_outputs,
+                num_logits_to_keep=1
+            )
+        if request.return_prefill_outputs:
+            request.prefill_outputs = {k: v for k, v in outputs.items() if k != 'past_key_values'}
+
+        logits = outputs['outputs']['language_modeling'][:, -1, :].float()
+        next_token = self._sample(logits, [request])
+
+        if self._record_token(request, next_token[0].item()):
+            return
+        self._join_batch(request, outputs['past_key_values'], next_token.view(1, 1))
+
+    def _join_batch(self, request, past_key_values, next_token):
+        """Merge a prefilled request's cache into the running batch"""
+        prompt_length = past_key_values[0][0].size(2)
+        row_mask = torch.ones((1, prompt_length), dtype=torch.long, device=self.device)
+        memory_vectors = request.memory_vectors or {}
+
+        if not self._running:
+            self._past_key_values = list(past_key_values)
+            self._attention_mask = row_mask
+            self._memory_vectors = dict(memory_vectors)
+            self._last_tokens = next_token
+        else:
+            cache_length = max(self._attention_mask.size(1), prompt_length)
+            self._past_key_values = [
+                (
+                    torch.cat([_left_pad_cache(k, cache_length), _left_pad_cache(new_k, cache_length)]),
+                    torch.cat([_left_pad_cache(v, cache_length), _left_pad_cache(new_v, cache_length)])
+                )
+                for (k, v), (new_k, new_v) in zip(self._past_key_values, past_key_values)
+            ]
+            self._attention_mask = torch.cat([
+                F.pad(self._attention_mask, (cache_length - self._attention_mask.size(1), 0)),
+                F.pad(row_mask, (cache_length - prompt_length, 0))
+            ])
+            self._memory_vectors = {
+                name: torch.cat([self._memory_vectors[name], vectors]) for name, vectors in memory_vectors.items()
+            }
+            self._last_tokens = torch.cat([self._last_tokens, next_token])
+        self._running.append(request)
+
+    def _decode(self):
+        """One decode step for the whole running batch"""
+        attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._running), 1))], dim=-1
+        )
+        with autocast_context(self.device.type, self.autocast_dtype):
+            outputs = self.model(
+                self._last_tokens,
+                attention_mask=attention_mask,
+                memory_vectors=self._memory_vectors or None,
+                past_key_values=self._past_key_values,
+                use_cache=True,
+                return_dict=True,
+                inference_mode=True
+            )
+        self._past_key_values = outputs['past_key_values']
+        self._attention_mask = attention_mask
+
+        logits = outputs['outputs']['language_modeling'][:, -1, :].float()
+        next_tokens = self._sample(logits, self._running)
+        self._last_tokens = next_tokens.unsqueeze(-1)
+
+        keep = [
+            row for row, (request, token) in enumerate(zip(self._running, next_tokens.tolist()))
+            if not self._record_token(request, token)
+        ]
+        if len(keep) < len(self._running):
+            self._retire(keep)
+
+    def _retire(self, keep: List[int]):
+        """Drop finished rows and the left padding no remaining row needs"""
+        if not keep:
+            self._reset_batch()
+            return
+
+        rows = torch.tensor(keep, dtype=torch.long, device=self.device)
+        attention_mask = self._attention_mask.index_select(0, rows)
+        start = int(attention_mask.any(dim=0).long().argmax())
+
+        self._running = [self._running[row] for row in keep]
+        self._attention_mask = attention_mask[:, start:]
+        self._past_key_values = [
+            (k.index_select(0, rows)[:, :, start:], v.index_select(0, rows)[:, :, start:])
+            for k, v in self._past_key_values
+        ]
+        self._memory_vectors = {
+            name: vectors.index_select(0, rows) for name, vectors in self._memory_vectors.items()
+        }
+        self._last_tokens = self._last_tokens.index_select(0, rows)
+
+    def _sample(self, logits, requests):
+        """One token per row, each with its own request's sampling settings"""
+        def column(values, dtype):
+            return torch.tensor(values, dtype=dtype, device=logits.device)
+        logits_processor = LogitsProcessor(
+            temperature=column([r.temperature for r in requests], logits.dtype),
+            top_k=column([r.top_k for r in requests], torch.long),
+            top_p=column([r.top_p for r in requests], logits.dtype),
+            do_sample=column([r.do_sample for r in requests], torch.bool)
+        )
+        return logits_processor(logits)
+
+    def _record_token(self, request: GenerationRequest, token: int) -> bool:
+        """Append a sampled token to its request; returns True once the request is finished"""
+        if token == self.eos_token_id:
+            request.future.set_result(request.tokens)
+            return True
+
+        request.tokens.append(token)
+        if request.on_token is not None:
+            request.on_token(token)
+        if len(request.tokens) >= request.max_new_tokens:
+            request.future.set_result(request.tokens)
+            return True
+        return False
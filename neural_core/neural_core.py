@@ -3,6 +3,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 import math
 
+from .advanced_neural_core import StackedExpertBank
+
 class TokenInputLayer(nn.Module):
     def __init__(self, vocab_size, d_model):
         super().__init__()
@@ -23,7 +25,8 @@ class PositionalEncoding(nn.Module):
         self.register_buffer("pe", pe)
 
     def forward(self, x):
-        return x + self.pe[:x.size(0), :]
+        # x is [batch, seq, d_model]; pe is stored [max_len, 1, d_model]
+        return x + self.pe[:x.size(1)].transpose(0, 1)
 
 class MultiHeadAttention(nn.Module):
     def __init__(self, d_model, num_heads):
@@ -66,11 +69,16 @@ class PositionwiseFeedForward(nn.Module):
         return self.w_2(self.dropout(F.relu(self.w_1(x))))
 
 class ExpertRouter(nn.Module):
-    def __init__(self, d_model, num_experts, top_k=2):
+    def __init__(self, d_model, num_experts, top_k=2, stacked_experts=False):
         super().__init__()
         self.top_k = top_k
+        self.num_experts = num_experts
         self.gate = nn.Linear(d_model, num_experts)
-        self.experts = nn.ModuleList([PositionwiseFeedForward(d_model, d_model * 2) for _ in range(num_experts)])
+        if stacked_experts:
+            # Same ReLU FFNs with stacked weights (load old checkpoints via convert_expert_state_dict)
+            self.experts = StackedExpertBank(num_experts, d_model, d_model * 2, activation='relu', output_dropout=False)
+        else:
+            self.experts = nn.ModuleList([PositionwiseFeedForward(d_model, d_model * 2) for _ in range(num_experts)])
 
     def forward(self, x):
         logits = self.gate(x)
@@ -79,6 +87,9 @@ class ExpertRouter(nn.Module):
         sparse_logits = zeros.scatter(-1, top_k_indices, top_k_logits)
         expert_weights = F.softmax(sparse_logits, dim=-1)
 
+        if not isinstance(self.experts, nn.ModuleList):
+            return self._forward_stacked(x, top_k_indices, expert_weights)
+
         output = torch.zeros_like(x)
         for i, expert in enumerate(self.experts):
             # Select tokens routed to this expert
@@ -88,6 +99,23 @@ class ExpertRouter(nn.Module):
                 output[idx] += expert_output * expert_weights[idx, i].unsqueeze(-1)
         return output
 
+    def _forward_stacked(self, x, top_k_indices, expert_weights):
+        # Sort (token, expert) pairs by expert and run the bank as batched matmuls
+        x_flat = x.reshape(-1, x.size(-1))
+        flat_experts = top_k_indices.reshape(-1)
+        flat_weights = expert_weights.gather(-1, top_k_indices).reshape(-1)
+        flat_tokens = torch.arange(x_flat.size(0), device=x.device).repeat_interleave(self.top_k)
+
+        sorted_experts, order = torch.sort(flat_experts, stable=True)
+        sorted_tokens = flat_tokens[order]
+        tokens_per_expert = torch.bincount(sorted_experts, minlength=self.num_experts)
+
+        expert_outputs = self.experts(x_flat[sorted_tokens], tokens_per_expert)
+        output = torch.zeros_like(x_flat).index_add(
+            0, sorted_tokens, expert_outputs * flat_weights[order].unsqueeze(-1)
+        )
+        return output.view_as(x)
+
 class EmotionNet(nn.Module):
     def __init__(self, d_model, num_emotions=7):
         super().__init__()
@@ -0,0 +1,145 @@
+"""
+Shared-prefix KV cache.
+
+Many requests start with the same tokens (the system prompt and a submode
+prompt). This cache stores the per-layer (K, V) tensors of such prefixes,
+keyed by a hash of their token ids, so a request that starts with a cached
+prefix only prefills the tokens that follow it. Entries are evicted in
+least-recently-used order once their total size exceeds the memory budget.
+
+Cached tensors are shared between requests and never modified in place; the
+attention layers concatenate new keys/values onto them.
+"""
+import array
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+
+from neural_core.advanced_neural_core import autocast_context
+
+logger = logging.getLogger(__name__)
+
+PastKeyValues = List[Tuple[torch.Tensor, torch.Tensor]]
+
+def cache_nbytes(past_key_values: PastKeyValues) -> int:
+    """Memory held by a per-layer (K, V) cache"""
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for key_value in past_key_values
+        for tensor in key_value
+    )
+
+class PrefixKVCache:
+    """LRU cache of prefix K/V tensors under a byte budget"""
+
+    def __init__(self, max_bytes: int = 1024 ** 3):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[int, PastKeyValues]]' = OrderedDict()  # key -> (length, K/V)
+        self._lengths: Dict[int, int] = {}  # prefix length -> number of entries with it
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def prefix_key(token_ids: Sequence[int]) -> str:
+        """Hash of a token id sequence (length-prefixed, so no two sequences collide by concatenation)"""
+        digest = hashlib.sha256(len(token_ids).to_bytes(8, 'little'))
+        digest.update(array.array('q', token_ids).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token_ids: Sequence[int]) -> Optional[PastKeyValues]:
+        """The cached K/V for exactly these tokens, or None"""
+        key = self.prefix_key(token_ids)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def match(self, token_ids: Sequence[int]) -> Tuple[int, Optional[PastKeyValues]]:
+        """Longest cached prefix of token_ids: (prefix length, K/V), or (0, None)"""
+        with self._lock:
+            lengths = sorted((n for n in self._lengths if n <= len(token_ids)), reverse=True)
+        for length in lengths:
+            key = self.prefix_key(token_ids[:length])
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return length, entry[1]
+        with self._lock:
+            self.stats['misses'] += 1
+        return 0, None
+
+    def put(self, token_ids: Sequence[int], past_key_values: PastKeyValues):
+        """Cache the K/V of a prefix, evicting least recently used entries to stay within budget"""
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            logger.warning(
+                f"Prefix of {len(token_ids)} tokens needs {nbytes} bytes, over the "
+                f"{self.max_bytes}-byte prefix cache budget; not caching it"
+            )
+            return
+
+        key = self.prefix_key(token_ids)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            while self._entries and self._nbytes + nbytes > self.max_bytes:
+                self._evict_oldest()
+            self._entries[key] = (len(token_ids), [(k.detach(), v.detach()) for k, v in past_key_values])
+            self._lengths[len(token_ids)] = self._lengths.get(len(token_ids), 0) + 1
+            self._nbytes += nbytes
+
+    def _evict_oldest(self):
+        _, (length, past_key_values) = self._entries.popitem(last=False)
+        self._lengths[length] -= 1
+        if not self._lengths[length]:
+            del self._lengths[length]
+        self._nbytes -= cache_nbytes(past_key_values)
+        self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lengths.clear()
+            self._nbytes = 0
+
+    def get_or_prefill(self, model, token_ids: Sequence[int], autocast_dtype=None) -> PastKeyValues:
+        """
+        The K/V for a prefix, prefilling it with model on a miss. The prefix is
+        encoded without memory conditioning, so one entry serves every request.
+        """
+        past_key_values = self.get(token_ids)
+        if past_key_values is not None:
+            return past_key_values
+
+        device = next(model.parameters()).device
+        input_ids = torch.tensor([list(token_ids)], dtype=torch.long, device=device)
+        model.eval()
+        with torch.no_grad(), autocast_context(device.type, autocast_dtype):
+            past_key_values = model(
+                input_ids, use_cache=True, return_dict=True, inference_mode=True
+            )['past_key_values']
+        self.put(token_ids, past_key_values)
+        return past_key_values
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries), 'nbytes': self._nbytes, 'max_bytes': self.max_bytes}
@@ -0,0 +1,109 @@
+import torch
+import torch.ao.nn.quantized.dynamic as nnqd
+import torch.nn as nn
+import torch.nn.functional as F
+from typing import Any, Dict, Optional
+
+from neural_core.advanced_neural_core import StackedExpertBank
+
+QUANTIZED_FORMAT = 'sathik-int8-dynamic'
+QUANTIZED_FORMAT_VERSION = 1
+
+def unstack_expert_bank(bank):
+    """
+    Rebuild a StackedExpertBank as a ModuleList of per-expert nn.Sequential
+    FFNs (the MegaExpertRouter layout), so each projection is an nn.Linear
+    that dynamic quantization can swap out.
+    """
+    activation = nn.GELU() if bank.activation is F.gelu else nn.ReLU()
+    experts = nn.ModuleList()
+    for e in range(bank.num_experts):
+        first = nn.Linear(bank.d_model, bank.d_hidden)
+        second = nn.Linear(bank.d_hidden, bank.d_model)
+        with torch.no_grad():
+            first.weight.copy_(bank.w1[e].t())
+            first.bias.copy_(bank.b1[e])
+            second.weight.copy_(bank.w2[e].t())
+            second.bias.copy_(bank.b2[e])
+        experts.append(nn.Sequential(
+            first,
+            activation,
+            nn.Dropout(bank.dropout.p),
+            second,
+            nn.Dropout(bank.dropout.p) if isinstance(bank.output_dropout, nn.Dropout) else nn.Identity()
+        ))
+    return experts
+
+def _unstack_expert_banks(model):
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, StackedExpertBank):
+                setattr(module, name, unstack_expert_bank(child))
+
+def quantize_dynamic_int8(model, dtype=torch.qint8):
+    """
+    Post-training int8 dynamic quantization for CPU inference. Every nn.Linear
+    (attention projections, gates, experts, FFNs and output heads) gets int8
+    weights with activations quantized on the fly. Stacked expert banks are
+    first split into per-expert nn.Linear modules. Modifies model in place.
+    nn.MultiheadAttention keeps its fp32 weights (PyTorch does not quantize
+    its out_proj dynamically).
+    """
+    model.eval()
+    _unstack_expert_banks(model)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=dtype, inplace=True)
+
+def is_quantized_state_dict(state_dict) -> bool:
+    """Whether a state dict holds packed int8 weights (from quantize_dynamic_int8)"""
+    return any(key.endswith('_packed_params._packed_params') for key in state_dict)
+
+def build_quantized_skeleton(model, dtype=torch.qint8):
+    """
+    Give a model built under torch.device('meta') the module structure of
+    quantize_dynamic_int8 without quantizing anything: expert banks are split
+    and every nn.Linear becomes an empty dynamic-quantized Linear. The result
+    is ready for materialize_from_state_dict with a quantized state dict; no
+    fp32 weights are ever allocated or initialized.
+    """
+    model.eval()
+    with torch.device('meta'):
+        _unstack_expert_banks(model)
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            # Exact type: nn.MultiheadAttention's out_proj subclass stays fp32, as in quantize_dynamic
+            if type(child) is nn.Linear:
+                setattr(module, name, nnqd.Linear(
+                    child.in_features, child.out_features, bias_=child.bias is not None, dtype=dtype
+                ))
+    return model
+
+def save_quantized_model(model, path, model_config: Dict[str, Any]):
+    """
+    Save a quantized core with the constructor arguments needed to rebuild it.
+    The packed int8 weights are stored as-is in the state dict.
+    """
+    torch.save({
+        'format': QUANTIZED_FORMAT,
+        'version': QUANTIZED_FORMAT_VERSION,
+        'model_class': type(model).__name__,
+        'model_config': model_config,
+        'state_dict': model.state_dict()
+    }, path)
+
+def load_quantized_model(path, model_cls, model_config: Optional[Dict[str, Any]] = None):
+    """
+    Rebuild a quantized core saved with save_quantized_model: the fp32 model
+    is constructed, converted to the same quantized structure, and the int8
+    weights are loaded into it.
+    """
+    checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+    if checkpoint.get('format') != QUANTIZED_FORMAT:
+        raise ValueError(f"{path} is not a {QUANTIZED_FORMAT} checkpoint")
+    if checkpoint['model_class'] != model_cls.__name__:
+        raise ValueError(
+            f"{path} holds a {checkpoint['model_class']}, not a {model_cls.__name__}"
+        )
+
+    model = quantize_dynamic_int8(model_cls(**(model_config or checkpoint['model_config'])))
+    model.load_state_dict(checkpoint['state_dict'])
+    return model
@@ -1,17 +1,25 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 import math
 from typing import Optional, Tuple, List, Dict, Any
 
 # Import from the existing advanced neural core
 from .advanced_neural_core import (
     AdvancedTokenInputLayer,
+    FP32LayerNorm,
+    RotaryPositionalEncoding,
     SuperMultiHeadAttention,
     MegaExpertRouter,
     AdvancedEmotionNet,
     SuperMemoryFusionLayer,
-    UltraKnowledgeFilter
+    UltraKnowledgeFilter,
+    NeuralCoreGenerationMixin,
+    GradientCheckpointingMixin,
+    apply_output_heads,
+    build_causal_attention_mask,
+    build_position_ids
 )
 
 # --- Quantum-Inspired Components ---
@@ -142,7 +150,7 @@ class QuantumInterferenceLayer(nn.Module):
 
 # --- Quantum-Inspired Neural Core (QINC) --- 
 
-class QuantumInspiredNeuralCore(nn.Module):
+class QuantumInspiredNeuralCore(NeuralCoreGenerationMixin, GradientCheckpointingMixin, nn.Module):
     """Theoretical Quantum-Inspired Neural Core for Sathik AI."""
     def __init__(
         self,
@@ -155,7 +163,10 @@ class QuantumInspiredNeuralCore(nn.Module):
         max_position_embeddings=16384,
         dropout=0.1,
         num_entangled_pairs=4,
-        num_interference_pathways=2
+        num_interference_pathways=2,
+        stacked_experts=False,
+        gradient_checkpointing=True,
+        checkpoint_granularity='block'
     ):
         super().__init__()
         
@@ -170,12 +181,17 @@ class QuantumInspiredNeuralCore(nn.Module):
         # Quantum-inspired initial transformation
         self.quantum_superposition_input = QuantumSuperpositionLayer(d_model)
         
+        # One RoPE cos/sin table shared by every attention module
+        rope = RotaryPositionalEncoding(d_model // num_heads, max_position_embeddings)
+        
         # Transformer layers with all enhancements and quantum inspirations
         self.layers = nn.ModuleList([
             nn.ModuleDict({
-                "self_attn": SuperMultiHeadAttention(d_model, num_heads, dropout),
-                "cross_attn": SuperMultiHeadAttention(d_model, num_heads, dropout),
-                "expert_router": MegaExpertRouter(d_model, num_experts, top_k),
+                "self_attn": SuperMultiHeadAttention(d_model, num_heads, dropout, rope=rope),
+                "cross_attn": SuperMultiHeadAttention(d_model, num_heads, dropout, rope=rope),
+                "expert_router": MegaExpertRouter(
+                    d_model, num_experts, top_k, stacked_experts=stacked_experts
+                ),
                 "emotion_net": AdvancedEmotionNet(d_model),
                 "memory_fusion": SuperMemoryFusionLayer(d_model),
                 "knowledge_filter": UltraKnowledgeFilter(d_model),
@@ -186,13 +202,13 @@ class QuantumInspiredNeuralCore(nn.Module):
                     nn.Linear(d_model * 8, d_model),
                     nn.Dropout(dropout)
                 ),
-                "norm1": nn.LayerNorm(d_model),
-                "norm2": nn.LayerNorm(d_model),
-                "norm3": nn.LayerNorm(d_model),
-                "norm4": nn.LayerNorm(d_model),
-                "norm5": nn.LayerNorm(d_model),
-                "norm6": nn.LayerNorm(d_model),
-                "norm7": nn.LayerNorm(d_model),
+                "norm1": FP32LayerNorm(d_model),
+                "norm2": FP32LayerNorm(d_model),
+                "norm3": FP32LayerNorm(d_model),
+                "norm4": FP32LayerNorm(d_model),
+                "norm5": FP32LayerNorm(d_model),
+                "norm6": FP32LayerNorm(d_model),
+                "norm7": FP32LayerNorm(d_model),
                 "dropout": nn.Dropout(dropout),
                 
                 # New Quantum-Inspired Layers per block
@@ -211,8 +227,11 @@ class QuantumInspiredNeuralCore(nn.Module):
             "creativity": nn.Linear(d_model, 1)
         })
         
-        # Gradient checkpointing for memory efficiency
-        self.gradient_checkpointing = True
+        # Gradient checkpointing for memory efficiency ('block' or 'moe', training only)
+        self.gradient_checkpointing = gradient_checkpointing
+        self.checkpoint_granularity = checkpoint_granularity
+        if gradient_checkpointing:
+            self.gradient_checkpointing_enable(checkpoint_granularity)
         
         # Initialize weights
         self.apply(self._init_weights)
@@ -229,6 +248,84 @@ class QuantumInspiredNeuralCore(nn.Module):
             torch.nn.init.zeros_(module.bias)
             torch.nn.init.ones_(module.weight)
     
+    def _block_forward(
+        self,
+        layer,
+        hidden_states,
+        self_attn_mask,
+        position_ids,
+        past_key_value,
+        cross_attention_input,
+        memory_vectors,
+        output_attentions,
+        inference_mode
+    ):
+        """Run one transformer block; the unit of whole-block checkpointing"""
+        # Self-attention with residual connection. Every other sub-layer
+        # (quantum, MoE, emotion, knowledge, FFN) is position-wise, so only
+        # the attention keys/values need caching for incremental decoding.
+        attn_output, attn_weights, present_key_value = layer["self_attn"](
+            hidden_states, hidden_states, hidden_states, self_attn_mask,
+            past_key_value=past_key_value,
+            position_ids=position_ids,
+            output_attentions=output_attentions
+        )
+        hidden_states = layer["norm1"](hidden_states + layer["dropout"](attn_output))
+        
+        # Cross-attention (if provided)
+        if cross_attention_input is not None:
+            cross_attn_output, _, _ = layer["cross_attn"](
+                hidden_states, cross_attention_input, cross_attention_input
+            )
+            hidden_states = layer["norm2"](hidden_states + layer["dropout"](cross_attn_output))
+        
+        # Apply Quantum Entanglement Layer
+        entanglement_output = layer["quantum_entanglement"](hidden_states)
+        hidden_states = layer["norm3"](hidden_states + layer["dropout"](entanglement_output))
+        
+        # Apply Quantum Interference Layer
+        interference_output = layer["quantum_interference"](hidden_states)
+        hidden_states = layer["norm4"](hidden_states + layer["dropout"](interference_output))
+        
+        # Mixture of Experts
+        if self._use_gradient_checkpointing('moe'):
+            expert_output, load_balancing_loss = checkpoint(
+                layer["expert_router"], hidden_states, use_reentrant=False
+            )
+        else:
+            expert_output, load_balancing_loss = layer["expert_router"](hidden_states)
+        hidden_states = layer["norm5"](hidden_states + layer["dropout"](expert_output))
+        
+        # Emotion processing
+        emotion_output, emotion_analysis = layer["emotion_net"](
+            hidden_states, return_analysis=not inference_mode
+        )
+        hidden_states = layer["norm6"](hidden_states + layer["dropout"](emotion_output))
+        
+        # Memory fusion
+        if memory_vectors:
+            memory_output = layer["memory_fusion"](hidden_states, memory_vectors)
+            hidden_states = layer["norm7"](hidden_states + layer["dropout"](memory_output))
+        
+        # Knowledge filtering
+        knowledge_output, knowledge_analysis = layer["knowledge_filter"](
+            hidden_states, return_analysis=not inference_mode
+        )
+        hidden_states = layer["norm7"](hidden_states + layer["dropout"](knowledge_output))
+        
+        # Feed-forward
+        ff_output = layer["feed_forward"](hidden_states)
+        hidden_states = layer["norm7"](hidden_states + layer["dropout"](ff_output))
+        
+        return (
+            hidden_states,
+            attn_weights,
+            present_key_value,
+            load_balancing_loss,
+            emotion_analysis,
+            knowledge_analysis
+        )
+    
     def forward(
         self,
         input_ids,
@@ -239,8 +336,32 @@ class QuantumInspiredNeuralCore(nn.Module):
         cross_attention_input=None,
         output_attentions=False,
         output_hidden_states=False,
-        return_dict=True
+        return_dict=True,
+        past_key_values=None,
+        use_cache=False,
+        inference_mode=False,
+        num_logits_to_keep=0
     ):
+        """
+        With inference_mode=True only the language-modeling head is computed,
+        on the last position, and no per-layer analyses are built.
+        num_logits_to_keep > 0 projects only that many trailing positions
+        through the language-modeling head (0 keeps every position).
+        """
+        batch_size, seq_len = input_ids.shape
+        past_length = past_key_values[0][0].size(2) if past_key_values is not None else 0
+        
+        # Positions continue after any cached tokens (and skip left padding)
+        if position_ids is None:
+            position_ids = build_position_ids(
+                attention_mask, batch_size, seq_len, past_length, input_ids.device
+            )
+        
+        # Causal self-attention mask (combined with any padding mask)
+        self_attn_mask = build_causal_attention_mask(
+            attention_mask, seq_len, past_length, input_ids.device
+        )
+        
         # Input embeddings
         hidden_states = self.token_input_layer(
             input_ids, position_ids, token_type_ids
@@ -253,6 +374,7 @@ class QuantumInspiredNeuralCore(nn.Module):
         all_hidden_states = [] if output_hidden_states else None
         all_attentions = [] if output_attentions else None
         all_analyses = []
+        next_key_values = [] if use_cache else None
         total_load_balancing_loss = 0
         
         # Process through all layers
@@ -260,67 +382,52 @@ class QuantumInspiredNeuralCore(nn.Module):
             if output_hidden_states:
                 all_hidden_states.append(hidden_states)
             
-            # Self-attention with residual connection
-            attn_output, attn_weights, _ = layer["self_attn"](
-                hidden_states, hidden_states, hidden_states, attention_mask
+            block_args = (
+                layer,
+                hidden_states,
+                self_attn_mask,
+                position_ids,
+                past_key_values[i] if past_key_values is not None else None,
+                cross_attention_input,
+                memory_vectors,
+                output_attentions,
+                inference_mode
             )
-            hidden_states = layer["norm1"](hidden_states + layer["dropout"](attn_output))
             
+            # Whole-block checkpointing keeps only the block input and recomputes the rest in backward
+            if self._use_gradient_checkpointing('block'):
+                block_outputs = checkpoint(self._block_forward, *block_args, use_reentrant=False)
+            else:
+                block_outputs = self._block_forward(*block_args)
+            (
+                hidden_states,
+                attn_weights,
+                present_key_value,
+                load_balancing_loss,
+                emotion_analysis,
+                knowledge_analysis
+            ) = block_outputs
+            
+            if use_cache:
+                next_key_values.append(present_key_value)
             if output_attentions:
                 all_attentions.append(attn_weights)
-            
-            # Cross-attention (if provided)
-            if cross_attention_input is not None:
-                cross_attn_output, _, _ = layer["cross_attn"](
-                    hidden_states, cross_attention_input, cross_attention_input
-                )
-                hidden_states = layer["norm2"](hidden_states + layer["dropout"](cross_attn_output))
-            
-            # Apply Quantum Entanglement Layer
-            entanglement_output = layer["quantum_entanglement"](hidden_states)
-            hidden_states = layer["norm3"](hidden_states + layer["dropout"](entanglement_output))
-            
-            # Apply Quantum Interference Layer
-            interference_output = layer["quantum_interference"](hidden_states)
-            hidden_states = layer["norm4"](hidden_states + layer["dropout"](interference_output))
-            
-            # Mixture of Experts
-            expert_output, load_balancing_loss = layer["expert_router"](hidden_states)
-            hidden_states = layer["norm5"](hidden_states + layer["dropout"](expert_output))
             total_load_balancing_loss += load_balancing_loss
             
-            # Emotion processing
-            emotion_output, emotion_analysis = layer["emotion_net"](hidden_states)
-            hidden_states = layer["norm6"](hidden_states + layer["dropout"](emotion_output))
-            
-            # Memory fusion
-            if memory_vectors:
-                memory_output = layer["memory_fusion"](hidden_states, memory_vectors)
-                hidden_states = layer["norm7"](hidden_states + layer["dropout"](memory_output))
-            
-            # Knowledge filtering
-            knowledge_output, knowledge_analysis = layer["knowledge_filter"](hidden_states)
-            hidden_states = layer["norm7"](hidden_states + layer["dropout"](knowledge_output))
-            
-            # Feed-forward
-            ff_output = layer["feed_forward"](hidden_states)
-            hidden_states = layer["norm7"](hidden_states + layer["dropout"](ff_output))
-            
             # Store analyses
-            all_analyses.append({
-                'layer': i,
-                'emotion_analysis': emotion_analysis,
-                'knowledge_analysis': knowledge_analysis
-            })
+            if not inference_mode:
+                all_analyses.append({
+                    'layer': i,
+                    'emotion_analysis': emotion_analysis,
+                    'knowledge_analysis': knowledge_analysis
+                })
         
         # Final hidden state
         if output_hidden_states:
             all_hidden_states.append(hidden_states)
         
         # Multiple output heads
-        outputs = {}
-        for head_name, head in self.output_heads.items():
-            outputs[head_name] = head(hidden_states)
+        outputs = apply_output_heads(self.output_heads, hidden_states, inference_mode, num_logits_to_keep)
         
         # Prepare return values
         if return_dict:
@@ -330,7 +437,8 @@ class QuantumInspiredNeuralCore(nn.Module):
                 'attentions': all_attentions,
                 'outputs': outputs,
                 'analyses': all_analyses,
-                'load_balancing_loss': total_load_balancing_loss
+                'load_balancing_loss': total_load_balancing_loss,
+                'past_key_values': next_key_values
             }
         else:
             return (
@@ -341,74 +449,6 @@ class QuantumInspiredNeuralCore(nn.Module):
                 all_analyses,
                 total_load_balancing_loss
             )
-    
-    def generate(
-        self,
-        input_ids,
-        max_length=512,
-        temperature=1.0,
-        top_k=50,
-        top_p=0.95,
-        do_sample=True,
-        pad_token_id=0,
-        eos_token_id=1
-    ):
-        """Advanced text generation with multiple sampling strategies"""
-        self.eval()
-        
-        batch_size = input_ids.size(0)
-        current_length = input_ids.size(1)
-        
-        # Initialize past key values for efficient generation
-        past_key_values = None
-        
-        with torch.no_grad():
-            for _ in range(max_length - current_length):
-                # Forward pass
-                outputs = self.forward(
-                    input_ids[:, -1:] if past_key_values else input_ids,
-                    return_dict=True
-                )
-                
-                # Get language modeling logits
-                logits = outputs["outputs"]["language_modeling"][:, -1, :]
-                
-                # Apply temperature
-                logits = logits / temperature
-                
-                # Top-k filtering
-                if top_k > 0:
-                    top_k_logits, _ = torch.topk(logits, top_k)
-                    logits[logits < top_k_logits[:, [-1]]] = -float("inf")
-                
-                # Top-p (nucleus) filtering
-                if top_p < 1.0:
-                    sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-                    cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
-                    
-                    # Remove tokens with cumulative probability above the threshold
-                    sorted_indices_to_remove = cumulative_probs > top_p
-                    sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
-                    sorted_indices_to_remove[..., 0] = 0
-                    
-                    indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
-                    logits[indices_to_remove] = -float("inf")
-                
-                # Sample next token
-                if do_sample:
-                    probs = F.softmax(logits, dim=-1)
-                    next_token = torch.multinomial(probs, num_samples=1)
-                else:
-                    next_token = torch.argmax(logits, dim=-1, keepdim=True)
-                
-                # Append to sequence
-                input_ids = torch.cat([input_ids, next_token], dim=-1)
-                
-                # Check for EOS token
-                if next_token.item() == eos_token_id:
-                    break
-        
-        return input_ids
 
 # Example usage and testing
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Sharded, memory-mapped checkpoint format for neural core weights.
+
+A checkpoint is a directory holding an index plus one shard file per
+transformer layer (large expert banks are split further into expert groups):
+
+    model.index.json              {"metadata": {...}, "weight_map": {name: shard}}
+    base.safetensors              embeddings, output heads, ...
+    layers.0.safetensors          attention, norms, gates, ... of layer 0
+    layers.0.experts.0.safetensors
+    ...
+
+Shards use the safetensors layout: an 8-byte little-endian header length, a
+JSON header mapping each tensor name to its dtype, shape and byte range, then
+the raw tensor bytes. Loading maps every shard with torch.from_file, so
+tensors are views into the page cache: pages are faulted in on first use and
+processes loading the same checkpoint share one copy.
+"""
+import json
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import torch
+
+INDEX_FILE = 'model.index.json'
+SHARD_SUFFIX = '.safetensors'
+
+DTYPE_NAMES = {
+    torch.float64: 'F64',
+    torch.float32: 'F32',
+    torch.float16: 'F16',
+    torch.bfloat16: 'BF16',
+    torch.int64: 'I64',
+    torch.int32: 'I32',
+    torch.int16: 'I16',
+    torch.int8: 'I8',
+    torch.uint8: 'U8',
+    torch.bool: 'BOOL',
+}
+NAME_DTYPES = {name: dtype for dtype, name in DTYPE_NAMES.items()}
+
+_LAYER_KEY = re.compile(r'^layers\.(\d+)\.')
+_EXPERT_KEY = re.compile(r'^layers\.(\d+)\..*\.experts\.(\d+)\.')
+
+def default_shard_name(key: str, experts_per_shard: int = 16) -> str:
+    """Shard for a state dict key: one per layer, per-expert weights in groups of experts_per_shard"""
+    expert_match = _EXPERT_KEY.match(key)
+    if expert_match:
+        layer, expert = int(expert_match.group(1)), int(expert_match.group(2))
+        return f"layers.{layer}.experts.{expert // experts_per_shard}"
+    layer_match = _LAYER_KEY.match(key)
+    if layer_match:
+        return f"layers.{layer_match.group(1)}"
+    return 'base'
+
+def _tensor_bytes(tensor: torch.Tensor) -> memoryview:
+    flat = tensor.detach().cpu().contiguous().reshape(-1)
+    return memoryview(flat.view(torch.uint8).numpy()).cast('B')
+
+def save_shard(tensors: Dict[str, torch.Tensor], path: Union[str, Path], metadata: Optional[Dict[str, str]] = None):
+    """Write one shard file (safetensors layout); the file appears atomically"""
+    for name, tensor in tensors.items():
+        if not isinstance(tensor, torch.Tensor) or tensor.is_quantized or tensor.dtype not in DTYPE_NAMES:
+            raise ValueError(f"Cannot store {name!r} in a sharded checkpoint: unsupported value {type(tensor).__name__}")
+
+    # Widest dtypes first so every tensor starts at an offset aligned to its element size
+    names = sorted(tensors, key=lambda n: -tensors[n].element_size())
+    header = {'__metadata__': metadata} if metadata else {}
+    offset = 0
+    for name in names:
+        nbytes = tensors[name].numel() * tensors[name].element_size()
+        header[name] = {
+            'dtype': DTYPE_NAMES[tensors[name].dtype],
+            'shape': list(tensors[name].shape),
+            'data_offsets': [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            if tensors[name].numel():
+                f.write(_tensor_bytes(tensors[name]))
+    os.replace(tmp_path, path)
+
+def load_shard(path: Union[str, Path]) -> Dict[str, torch.Tensor]:
+    """Memory-map one shard file; returned tensors are views into the mapping"""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        header_length = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_length))
+
+    data_start = 8 + header_length
+    mapped = torch.from_file(str(path), shared=False, size=path.stat().st_size, dtype=torch.uint8)
+
+    tensors = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        start, end = info['data_offsets']
+        tensors[name] = (
+            mapped[data_start + start:data_start + end]
+            .view(NAME_DTYPES[info['dtype']])
+            .view(info['shape'])
+        )
+    return tensors
+
+def save_sharded_state_dict(
+    state_dict: Dict[str, torch.Tensor],
+    directory: Union[str, Path],
+    metadata: Optional[Dict[str, str]] = None,
+    experts_per_shard: int = 16
+):
+    """
+    Save a flat tensor state dict as shards plus an index. The index is
+    written last, so a directory without one is an incomplete checkpoint.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    shards = {}
+    for key, tensor in state_dict.items():
+        shards.setdefault(default_shard_name(key, experts_per_shard), {})[key] = tensor
+
+    weight_map = {}
+    for shard_name, tensors in shards.items():
+        shard_file = shard_name + SHARD_SUFFIX
+        save_shard(tensors, directory / shard_file)
+        weight_map.update({key: shard_file for key in tensors})
+
+    index = {'metadata': metadata or {}, 'weight_map': weight_map}
+    tmp_index = directory / (INDEX_FILE + '.tmp')
+    with open(tmp_index, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_index, directory / INDEX_FILE)
+
+def load_sharded_state_dict(directory: Union[str, Path]) -> Dict[str, torch.Tensor]:
+    """Memory-map every shard listed in the index; tensors keep the saved key order"""
+    directory = Path(directory)
+    with open(directory / INDEX_FILE, 'r', encoding='utf-8') as f:
+        weight_map = json.load(f)['weight_map']
+
+    loaded = {}
+    for shard_file in dict.fromkeys(weight_map.values()):
+        loaded.update(load_shard(directory / shard_file))
+    return {key: loaded[key] for key in weight_map}
+
+def load_sharded_metadata(directory: Union[str, Path]) -> Dict[str, str]:
+    """Read the index metadata without touching the shards"""
+    with open(Path(directory) / INDEX_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)['metadata']
+
+def is_sharded_checkpoint(path: Union[str, Path]) -> bool:
+    """Whether path is a complete sharded checkpoint directory"""
+    return (Path(path) / INDEX_FILE).is_file()
@@ -0,0 +1,223 @@
+"""
+Speculative decoding: a small draft model proposes a few tokens, and the
+large target model checks them all in one cached forward.
+
+Each draft token d is accepted with probability min(1, p(d) / q(d)), where
+p is the target distribution and q the draft distribution, both after the
+same temperature/top-k/top-p warping. At the first rejection, the token is
+resampled from max(0, p - q) normalized. When every draft token is accepted,
+one extra token is sampled from the target's last distribution. This keeps
+the output distribution exactly the target's, so draft quality only affects
+speed. Greedy decoding accepts a draft token iff it is the target argmax.
+
+The draft (e.g. neural_core.SathikNeuralCore) only has to map [batch, seq]
+token ids to [batch, seq, vocab] logits. It has no KV cache, so it is re-run
+for every drafted token over the last max_draft_context tokens; it should be
+much smaller than the target.
+"""
+import time
+from typing import Any, Dict
+
+import torch
+import torch.nn as nn
+
+from neural_core.advanced_neural_core import LogitsProcessor, autocast_context
+
+def _draft_logits(draft_model, sequence):
+    """Last-position logits of the draft for a [1, seq] sequence, under a causal mask"""
+    seq_len = sequence.size(1)
+    causal_mask = torch.tril(torch.ones(seq_len, seq_len, dtype=torch.bool, device=sequence.device))
+    logits = draft_model(sequence, src_mask=causal_mask[None, None])
+    return logits[:, -1, :].float()
+
+def new_speculative_metrics() -> Dict[str, Any]:
+    return {
+        'drafted_tokens': 0,
+        'accepted_tokens': 0,
+        'generated_tokens': 0,
+        'target_forwards': 0,
+        'draft_forwards': 0,
+        'time': 0.0
+    }
+
+def summarize_speculative_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the derived rates: acceptance rate, tokens per target forward, tokens per second"""
+    return {
+        **metrics,
+        'acceptance_rate': metrics['accepted_tokens'] / max(metrics['drafted_tokens'], 1),
+        'tokens_per_target_forward': metrics['generated_tokens'] / max(metrics['target_forwards'], 1),
+        'tokens_per_second': metrics['generated_tokens'] / metrics['time'] if metrics['time'] else 0.0
+    }
+
+def speculative_generate(
+    target_model,
+    draft_model,
+    input_ids,
+    num_draft_tokens=4,
+    max_length=512,
+    temperature=1.0,
+    top_k=50,
+    top_p=0.95,
+    do_sample=True,
+    eos_token_id=1,
+    memory_vectors=None,
+    return_prefill_outputs=False,
+    autocast_dtype=None,
+    prefix_key_values=None,
+    max_draft_context=256,
+    metrics=None
+):
+    """
+    Speculative counterpart of NeuralCoreGenerationMixin.generate for a
+    single sequence ([1, seq] input_ids). memory_vectors and
+    prefix_key_values apply to the target only. Counters are added to
+    metrics (see new_speculative_metrics) when it is given.
+    """
+    if input_ids.size(0) != 1:
+        raise ValueError("speculative decoding handles one sequence at a time")
+
+    metrics = metrics if metrics is not None else new_speculative_metrics()
+    start_time = time.time()
+    device_type = input_ids.device.type
+    target_model.eval()
+    draft_model.eval()
+
+    logits_processor = LogitsProcessor(temperature, top_k, top_p)
+
+    def sample(probs):
+        if do_sample:
+            return torch.multinomial(probs, num_samples=1).squeeze(-1)
+        return probs.argmax(dim=-1)
+
+    with torch.no_grad():
+        # Prefill: the cache covers every token except the last, which is fed
+        # again together with the draft tokens at each verification
+        prefill_ids, past_key_values = input_ids, None
+        if prefix_key_values is not None:
+            prefix_length = min(prefix_key_values[0][0].size(2), input_ids.size(1) - 1)
+            past_key_values = [(k[:, :, :prefix_length], v[:, :, :prefix_length]) for k, v in prefix_key_values]
+            prefill_ids = input_ids[:, prefix_length:]
+        with autocast_context(device_type, autocast_dtype):
+            outputs = target_model(
+                prefill_ids,
+                memory_vectors=memory_vectors,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+                inference_mode=not return_prefill_outputs,
+                num_logits_to_keep=1
+            )
+        metrics['target_forwards'] += 1
+        vocab_size = outputs['outputs']['language_modeling'].size(-1)
+        prefill_outputs = {k: v for k, v in outputs.items() if k != 'past_key_values'}
+        cache_length = input_ids.size(1) - 1
+        past_key_values = [(k[:, :, :cache_length], v[:, :, :cache_length]) for k, v in outputs['past_key_values']]
+
+        sequence = input_ids
+        finished = False
+        while not finished and sequence.size(1) < max_length:
+            num_draft = min(num_draft_tokens, max_length - sequence.size(1) - 1)
+
+            # Draft num_draft tokens autoregressively with the small model
+            draft_tokens, draft_probs = [], []
+            draft_sequence = sequence
+            for _ in range(num_draft):
+                with autocast_context(device_type, autocast_dtype):
+                    logits = _draft_logits(draft_model, draft_sequence[:, -max_draft_context:])
+                metrics['draft_forwards'] += 1
+                if logits.size(-1) != vocab_size:
+                    raise ValueError(
+                        f"draft and target models must share a vocabulary ({logits.size(-1)} != {vocab_size})"
+                    )
+                probs = logits_processor.probs(logits)
+                token = sample(probs)
+                draft_tokens.append(token)
+                draft_probs.append(probs)
+                draft_sequence = torch.cat([draft_sequence, token.view(1, 1)], dim=-1)
+
+            # Verify: one target forward over the last accepted token and the drafts,
+            # with logits for exactly those positions
+            verify_ids = draft_sequence[:, sequence.size(1) - 1:]
+            with autocast_context(device_type, autocast_dtype):
+                outputs = target_model(
+                    verify_ids,
+                    memory_vectors=memory_vectors,
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                    return_dict=True,
+                    inference_mode=True,
+                    num_logits_to_keep=verify_ids.size(1)
+                )
+            metrics['target_forwards'] += 1
+            target_probs = logits_processor.probs(outputs['outputs']['language_modeling'][0].float())
+
+            # Acceptance rule
+            new_tokens = []
+            for i, (token, q) in enumerate(zip(draft_tokens, draft_probs)):
+                p = target_probs[i]
+                token_id = token.item()
+                if do_sample:
+                    accept = torch.rand(()).item() * q[0, token_id].item() <= p[token_id].item()
+                else:
+                    accept = token_id == p.argmax().item()
+                if not accept:
+                    residual = (p - q[0]).clamp(min=0) if do_sample else p
+                    if residual.sum() <= 0:
+                        residual = p
+                    new_tokens.append(sample((residual / residual.sum()).unsqueeze(0)).item())
+                    break
+                new_tokens.append(token_id)
+                metrics['accepted_tokens'] += 1
+            else:
+                # Every draft accepted: the target's next distribution gives one more token
+                new_tokens.append(sample(target_probs[num_draft].unsqueeze(0)).item())
+            metrics['drafted_tokens'] += num_draft
+
+            if eos_token_id in new_tokens:
+                new_tokens = new_tokens[:new_tokens.index(eos_token_id) + 1]
+                finished = True
+            metrics['generated_tokens'] += len(new_tokens)
+
+            # Keep the cache for the previous last token and the accepted drafts
+            cache_length = sequence.size(1) + len(new_tokens) - 1
+            past_key_values = [
+                (k[:, :, :cache_length], v[:, :, :cache_length]) for k, v in outputs['past_key_values']
+            ]
+            sequence = torch.cat(
+                [sequence, torch.tensor([new_tokens], dtype=sequence.dtype, device=sequence.device)], dim=-1
+            )
+
+    metrics['time'] += time.time() - start_time
+    if return_prefill_outputs:
+        return sequence, prefill_outputs
+    return sequence
+
+class SpeculativeDecoder:
+    """
+    A configured draft/target pairing. generate() takes the arguments of
+    speculative_generate; metrics accumulate over every call.
+    """
+
+    def __init__(self, target_model: nn.Module, draft_model: nn.Module, num_draft_tokens: int = 4):
+        if num_draft_tokens < 1:
+            raise ValueError(f"num_draft_tokens must be at least 1, got {num_draft_tokens}")
+        self.target_model = target_model
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.metrics = new_speculative_metrics()
+
+    def generate(self, input_ids, **generation_kwargs):
+        return speculative_generate(
+            self.target_model,
+            self.draft_model,
+            input_ids,
+            num_draft_tokens=self.num_draft_tokens,
+            metrics=self.metrics,
+            **generation_kwargs
+        )
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return summarize_speculative_metrics(self.metrics)
+
+    def reset_metrics(self):
+        self.metrics = new_speculative_metrics()
@@ -60,17 +60,36 @@ def create_mock_attention_mask(seq_len, batch_size=1):
     """Create a mock attention mask"""
     return torch.ones(batch_size, seq_len, seq_len)
 
+SMALL_CORE_CONFIG = {
+    'vocab_size': 1000,
+    'd_model': 64,
+    'num_heads': 4,
+    'num_layers': 2,
+    'num_experts': 4,
+    'top_k': 2,
+    'max_position_embeddings': 128
+}
+
+def create_small_neural_core(core_class, seed=0, **overrides):
+    """Build a small, seeded neural core; overrides replace SMALL_CORE_CONFIG entries"""
+    torch.manual_seed(seed)
+    return core_class(**{**SMALL_CORE_CONFIG, **overrides})
+
 class MockNeuralCore:
     """Mock neural core for testing"""
     def __init__(self, d_model=128):
         self.d_model = d_model
         self.device = torch.device('cpu')
     
-    def generate(self, input_ids, max_length=64, temperature=0.8, top_k=10, top_p=0.9):
+    def generate(self, input_ids, max_length=64, temperature=0.8, top_k=10, top_p=0.9,
+                 memory_vectors=None, return_prefill_outputs=False):
         """Mock generation that returns deterministic output"""
         batch_size, seq_len = input_ids.shape
         # Generate random tokens within vocabulary range
-        return torch.randint(0, 1000, (batch_size, max_length))
+        generated = torch.randint(0, 1000, (batch_size, max_length))
+        if return_prefill_outputs:
+            return generated, self(input_ids, memory_vectors=memory_vectors, return_dict=True)
+        return generated
     
     def __call__(self, input_ids, memory_vectors=None, return_dict=False):
         """Mock forward pass"""
@@ -12,6 +12,22 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+from neural_core.advanced_neural_core import (
+    FP32LayerNorm,
+    LogitsProcessor,
+    MaxedOutSathikNeuralCore,
+    MegaExpertRouter,
+    RotaryPositionalEncoding,
+    StackedExpertBank,
+    SuperMultiHeadAttention,
+    build_causal_attention_mask,
+    build_document_attention_mask,
+    cast_parameters,
+    convert_expert_state_dict,
+    left_pad_sequences,
+    materialize_from_state_dict,
+    resolve_autocast_dtype
+)
 from neural_core.quantum_inspired_neural_core import (
     QuantumInspiredNeuralCore,
     QuantumSuperpositionLayer,
@@ -19,7 +35,31 @@ from neural_core.quantum_inspired_neural_core import (
     QuantumTunnelingLayer,
     QuantumInterferenceLayer
 )
-from tests.fixtures import create_mock_tensor, create_mock_attention_mask
+from neural_core.quantization import (
+    build_quantized_skeleton,
+    is_quantized_state_dict,
+    load_quantized_model,
+    quantize_dynamic_int8,
+    save_quantized_model,
+    unstack_expert_bank
+)
+from neural_core.inference_engine import ContinuousBatchingEngine
+from neural_core.neural_core import ExpertRouter, SathikNeuralCore
+from neural_core.prefix_cache import PrefixKVCache, cache_nbytes
+from neural_core.speculative import SpeculativeDecoder, new_speculative_metrics
+from neural_core.sharded_checkpoint import (
+    INDEX_FILE,
+    default_shard_name,
+    is_sharded_checkpoint,
+    load_sharded_state_dict,
+    save_sharded_state_dict
+)
+from tests.fixtures import (
+    SMALL_CORE_CONFIG,
+    create_mock_attention_mask,
+    create_mock_tensor,
+    create_small_neural_core
+)
 
 
 class TestQuantumSuperpositionLayer:
@@ -166,6 +206,168 @@ class TestQuantumInterferenceLayer:
         assert not torch.isnan(output).any()
 
 
+class TestRotaryPositionalEncoding:
+    """Test the precomputed RoPE tables"""
+    
+    def test_offset_and_position_ids_agree(self):
+        """Test slicing by offset matches gathering by explicit position ids"""
+        rope = RotaryPositionalEncoding(32, max_len=128)
+        x = torch.randn(1, 5, 32)
+        
+        cos_offset, sin_offset = rope(x, 5, offset=10)
+        cos_ids, sin_ids = rope(x, position_ids=torch.arange(10, 15).unsqueeze(0))
+        
+        assert cos_offset.shape == (1, 1, 5, 16)
+        assert torch.allclose(cos_offset, cos_ids)
+        assert torch.allclose(sin_offset, sin_ids)
+        assert torch.allclose(cos_offset[0, 0, 0], torch.cos(10 * rope.inv_freq))
+    
+    def test_table_shared_across_layers(self):
+        """Test every attention module in a core uses the same RoPE table"""
+        model = MaxedOutSathikNeuralCore(
+            vocab_size=100, d_model=64, num_heads=4, num_layers=2,
+            num_experts=2, top_k=1, max_position_embeddings=64
+        )
+        ropes = {id(layer[name].rope) for layer in model.layers for name in ('self_attn', 'cross_attn')}
+        assert len(ropes) == 1
+        assert 'cos_cached' not in ''.join(model.state_dict().keys())
+
+
+class TestSuperMultiHeadAttention:
+    """Test the fused and explicit attention paths"""
+    
+    @pytest.fixture
+    def attention(self):
+        torch.manual_seed(0)
+        module = SuperMultiHeadAttention(64, 4, dropout=0.0)
+        with torch.no_grad():
+            module.temperature.uniform_(0.05, 0.3)
+        return module.eval()
+    
+    def test_fused_matches_explicit(self, attention):
+        """Test scaled_dot_product_attention with folded temperature matches matmul + softmax"""
+        x = torch.randn(2, 7, 64)
+        attention_mask = torch.tensor([[1] * 7, [0, 0] + [1] * 5])
+        mask = build_causal_attention_mask(attention_mask, 7)
+        
+        with torch.no_grad():
+            fused, fused_weights, _ = attention(x, x, x, mask)
+            explicit, explicit_weights, _ = attention(x, x, x, mask, output_attentions=True)
+        
+        assert fused_weights is None
+        assert explicit_weights.shape == (2, 4, 7, 7)
+        assert not torch.isnan(fused).any()
+        assert torch.allclose(fused, explicit, atol=1e-5)
+
+
+class TestMegaExpertRouter:
+    """Test sort-by-expert token dispatch"""
+    
+    @pytest.fixture
+    def router(self):
+        torch.manual_seed(0)
+        return MegaExpertRouter(64, num_experts=8, top_k=2, expert_capacity_factor=1.0)
+    
+    def _reference_output(self, router, x):
+        """Route every token through its top-k experts one at a time"""
+        x_flat = x.reshape(-1, x.size(-1))
+        gate_scores = torch.softmax(router.gate(x_flat), dim=-1)
+        top_k_scores, top_k_indices = torch.topk(gate_scores, router.top_k, dim=-1)
+        top_k_scores = top_k_scores / top_k_scores.sum(dim=-1, keepdim=True)
+        
+        output = torch.zeros_like(x_flat)
+        for token in range(x_flat.size(0)):
+            for slot in range(router.top_k):
+                expert = router.experts[top_k_indices[token, slot]]
+                output[token] += top_k_scores[token, slot] * expert(x_flat[token:token + 1])[0]
+        return output.view_as(x)
+    
+    def test_dispatch_matches_reference(self, router):
+        """Test vectorized dispatch equals per-token routing in eval mode"""
+        router.eval()
+        x = torch.randn(2, 6, 64)
+        with torch.no_grad():
+            output, loss = router(x)
+            expected = self._reference_output(router, x)
+        
+        assert output.shape == x.shape
+        assert torch.allclose(output, expected, atol=1e-5)
+        assert loss.item() >= 0
+    
+    def test_capacity_drops_overflow_in_training(self, router):
+        """Test tokens over an expert's capacity get no expert output"""
+        router.train()
+        router.expert_capacity_factor = 0.25
+        # Identical tokens all pick the same experts, overflowing their capacity
+        x = torch.randn(1, 1, 64).expand(1, 16, 64).contiguous()
+        output, _ = router(x)
+        
+        dropped = (output.abs().sum(dim=-1) == 0).sum().item()
+        assert dropped > 0
+    
+    def test_gradients_flow(self, router):
+        """Test the dispatch is differentiable"""
+        router.train()
+        x = torch.randn(2, 4, 64, requires_grad=True)
+        output, loss = router(x)
+        (output.sum() + loss).backward()
+        assert x.grad is not None
+
+    
+    def test_stacked_bank_matches_module_list(self, router):
+        """Test converted stacked weights reproduce the per-expert modules"""
+        router.eval()
+        stacked = MegaExpertRouter(64, num_experts=8, top_k=2, stacked_experts=True).eval()
+        stacked.load_state_dict(convert_expert_state_dict(router.state_dict()))
+        
+        assert isinstance(stacked.experts, StackedExpertBank)
+        assert stacked.experts.w1.shape == (8, 64, 256)
+        
+        x = torch.randn(2, 6, 64)
+        with torch.no_grad():
+            expected, _ = router(x)
+            output, _ = stacked(x)
+        assert torch.allclose(output, expected, atol=1e-5)
+
+
+class TestExpertRouter:
+    """Test the SathikNeuralCore expert router"""
+    
+    @pytest.fixture
+    def router(self):
+        torch.manual_seed(0)
+        return ExpertRouter(64, num_experts=8, top_k=2).eval()
+    
+    def test_converts_to_stacked_bank(self, router):
+        """Test an old per-expert checkpoint loads into the stacked layout"""
+        stacked = ExpertRouter(64, num_experts=8, top_k=2, stacked_experts=True).eval()
+        stacked.load_state_dict(convert_expert_state_dict(router.state_dict()))
+        
+        assert isinstance(stacked.experts, StackedExpertBank)
+        assert stacked.experts.w1.shape == (8, 64, 128)
+        assert stacked.experts.w2.shape == (8, 128, 64)
+    
+    def test_stacked_bank_matches_module_list(self, router):
+        """Test the stacked forward reproduces the per-expert modules"""
+        stacked = ExpertRouter(64, num_experts=8, top_k=2, stacked_experts=True).eval()
+        stacked.load_state_dict(convert_expert_state_dict(router.state_dict()))
+        
+        x = torch.randn(2, 6, 64)
+        with torch.no_grad():
+            expected = router(x)
+            output = stacked(x)
+        assert output.shape == x.shape
+        assert torch.allclose(output, expected, atol=1e-5)
+    
+    def test_stacked_gradients_flow(self):
+        """Test the stacked dispatch is differentiable"""
+        router = ExpertRouter(64, num_experts=8, top_k=2, stacked_experts=True)
+        x = torch.randn(2, 4, 64, requires_grad=True)
+        router(x).sum().backward()
+        assert x.grad is not None
+        assert router.experts.w1.grad is not None
+
+
 class TestQuantumInspiredNeuralCore:
     """Test Quantum-Inspired Neural Core functionality"""
     
@@ -262,6 +464,672 @@ class TestQuantumInspiredNeuralCore:
         assert output is not None
 
 
+class TestMaxedOutKVCache:
+    """Test cached incremental decoding in the Maxed Out neural core"""
+    
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(MaxedOutSathikNeuralCore, d_model=128, max_position_embeddings=512).eval()
+    
+    def test_cache_shapes(self, neural_core):
+        """Test forward returns one (K, V) pair per layer"""
+        input_ids = torch.randint(0, 1000, (2, 10))
+        with torch.no_grad():
+            output = neural_core(input_ids, use_cache=True)
+        
+        assert len(output['past_key_values']) == neural_core.num_layers
+        key, value = output['past_key_values'][0]
+        assert key.shape == (2, 4, 10, 32)
+        assert value.shape == (2, 4, 10, 32)
+    
+    def test_cached_step_matches_full_forward(self, neural_core):
+        """Test decoding one token from the cache matches re-running the full sequence"""
+        input_ids = torch.randint(0, 1000, (2, 10))
+        with torch.no_grad():
+            full = neural_core(input_ids)
+            prefill = neural_core(input_ids[:, :-1], use_cache=True)
+            step = neural_core(
+                input_ids[:, -1:],
+                past_key_values=prefill['past_key_values'],
+                use_cache=True
+            )
+        
+        assert torch.allclose(
+            step['outputs']['language_modeling'][:, -1],
+            full['outputs']['language_modeling'][:, -1],
+            atol=1e-4
+        )
+        assert step['past_key_values'][0][0].size(2) == 10
+    
+    def test_greedy_generation(self, neural_core):
+        """Test greedy cached generation produces the requested length"""
+        input_ids = torch.randint(2, 1000, (1, 5))
+        generated = neural_core.generate(
+            input_ids, max_length=12, do_sample=False, eos_token_id=-1
+        )
+        assert generated.shape == (1, 12)
+        assert torch.equal(generated[:, :5], input_ids)
+
+    def test_inference_mode_matches_full_forward(self, neural_core):
+        """Test inference mode returns only last-position LM logits and no analyses"""
+        input_ids = torch.randint(0, 1000, (2, 10))
+        with torch.no_grad():
+            full = neural_core(input_ids)
+            fast = neural_core(input_ids, inference_mode=True)
+
+        assert list(fast['outputs'].keys()) == ['language_modeling']
+        assert fast['outputs']['language_modeling'].shape == (2, 1, 1000)
+        assert fast['analyses'] == []
+        assert torch.allclose(
+            fast['outputs']['language_modeling'][:, -1],
+            full['outputs']['language_modeling'][:, -1],
+            atol=1e-5
+        )
+
+    def test_num_logits_to_keep(self, neural_core):
+        """Test the LM head only projects the trailing positions asked for"""
+        input_ids = torch.randint(0, 1000, (2, 10))
+        with torch.no_grad():
+            full = neural_core(input_ids)
+            last = neural_core(input_ids, num_logits_to_keep=3)
+
+        assert last['outputs']['language_modeling'].shape == (2, 3, 1000)
+        assert last['outputs']['sentiment'].shape == full['outputs']['sentiment'].shape
+        assert len(last['analyses']) == len(full['analyses'])
+        assert torch.allclose(
+            last['outputs']['language_modeling'],
+            full['outputs']['language_modeling'][:, -3:],
+            atol=1e-5
+        )
+
+    def test_packed_documents_match_separate_forwards(self, neural_core):
+        """Test a packed row with document masks and positions equals each document on its own"""
+        first, second = torch.randint(0, 1000, (1, 4)), torch.randint(0, 1000, (1, 6))
+        document_ids = torch.tensor([[0] * 4 + [1] * 6])
+        position_ids = torch.tensor([list(range(4)) + list(range(6))])
+        with torch.no_grad():
+            packed = neural_core(
+                torch.cat([first, second], dim=-1),
+                attention_mask=build_document_attention_mask(document_ids),
+                position_ids=position_ids
+            )['outputs']['language_modeling']
+            separate = torch.cat([
+                neural_core(first)['outputs']['language_modeling'],
+                neural_core(second)['outputs']['language_modeling']
+            ], dim=1)
+        assert torch.allclose(packed, separate, atol=1e-4)
+
+    def test_memory_conditioned_cached_step(self, neural_core):
+        """Test memory fusion stays per-position, so cached decoding matches the full forward"""
+        input_ids = torch.randint(0, 1000, (2, 10))
+        memory_vectors = {'short_term': torch.randn(2, 128), 'long_term': torch.randn(2, 128)}
+        with torch.no_grad():
+            full = neural_core(input_ids, memory_vectors=memory_vectors)
+            prefill = neural_core(input_ids[:, :-1], memory_vectors=memory_vectors, use_cache=True)
+            step = neural_core(
+                input_ids[:, -1:],
+                memory_vectors=memory_vectors,
+                past_key_values=prefill['past_key_values'],
+                use_cache=True
+            )
+
+        assert torch.allclose(
+            step['outputs']['language_modeling'][:, -1],
+            full['outputs']['language_modeling'][:, -1],
+            atol=1e-4
+        )
+
+    def test_generate_returns_prefill_outputs(self, neural_core):
+        """Test generation hands back the prompt forward's heads and analyses"""
+        input_ids = torch.randint(2, 1000, (1, 5))
+        memory_vectors = {'fused_memory': torch.randn(1, 1, 128)}
+        generated, prefill = neural_core.generate(
+            input_ids, max_length=9, do_sample=False, eos_token_id=-1,
+            memory_vectors=memory_vectors, return_prefill_outputs=True
+        )
+
+        assert generated.shape == (1, 9)
+        assert len(prefill['analyses']) == neural_core.num_layers
+        assert 'sentiment' in prefill['outputs']
+        assert 'past_key_values' not in prefill
+
+    def test_stream_generate_matches_generate(self, neural_core):
+        """Test streamed tokens are the tokens generate() appends"""
+        input_ids = torch.randint(2, 1000, (2, 5))
+        generated = neural_core.generate(input_ids, max_length=11, do_sample=False, eos_token_id=-1)
+        streamed = list(neural_core.stream_generate(input_ids, max_length=11, do_sample=False, eos_token_id=-1))
+
+        assert len(streamed) == 6
+        assert all(token.shape == (2,) for token in streamed)
+        assert torch.equal(torch.stack(streamed, dim=1), generated[:, 5:])
+        assert torch.is_grad_enabled()
+
+
+class TestQuantumKVCache:
+    """Test cached incremental decoding through the quantum-inspired blocks"""
+    
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(QuantumInspiredNeuralCore, d_model=128, max_position_embeddings=512).eval()
+    
+    def test_cached_decode_matches_full_forward(self, neural_core):
+        """Test several cached decode steps reproduce the full-sequence logits"""
+        input_ids = torch.randint(0, 1000, (1, 12))
+        with torch.no_grad():
+            full = neural_core(input_ids)['outputs']['language_modeling']
+            outputs = neural_core(input_ids[:, :8], use_cache=True)
+            for position in range(8, 12):
+                outputs = neural_core(
+                    input_ids[:, position:position + 1],
+                    past_key_values=outputs['past_key_values'],
+                    use_cache=True
+                )
+                assert torch.allclose(
+                    outputs['outputs']['language_modeling'][:, -1],
+                    full[:, position],
+                    atol=1e-4
+                )
+
+    
+    def test_left_pad_sequences(self):
+        """Test prompts are right-aligned with a matching attention mask"""
+        input_ids, attention_mask = left_pad_sequences([[5, 6, 7], [8]], pad_token_id=0)
+        assert input_ids.tolist() == [[5, 6, 7], [0, 0, 8]]
+        assert attention_mask.tolist() == [[1, 1, 1], [0, 0, 1]]
+    
+    def test_batched_generation_matches_single(self, neural_core):
+        """Test a left-padded batch generates the same greedy tokens as each prompt alone"""
+        prompts = [[11, 12, 13, 14, 15], [21, 22]]
+        batched = neural_core.generate_batch(
+            prompts, max_new_tokens=6, do_sample=False, eos_token_id=-1
+        )
+        
+        for prompt, continuation in zip(prompts, batched):
+            single = neural_core.generate(
+                torch.tensor([prompt]),
+                max_length=len(prompt) + 6,
+                do_sample=False,
+                eos_token_id=-1
+            )
+            assert continuation == single[0, len(prompt):].tolist()
+    
+    def test_finished_rows_are_padded(self, neural_core):
+        """Test rows stop independently at EOS and are padded afterwards"""
+        input_ids = torch.tensor([[11, 12, 13, 14], [101, 202, 303, 404], [500, 600, 700, 800], [31, 41, 59, 26]])
+        reference = neural_core.generate(input_ids, max_length=10, do_sample=False, eos_token_id=-1)[:, 4:]
+        
+        # Row 0's first greedy token as EOS: row 0 finishes at once
+        eos_token_id = reference[0, 0].item()
+        generated = neural_core.generate(
+            input_ids, max_length=10, do_sample=False, pad_token_id=0, eos_token_id=eos_token_id
+        )[:, 4:]
+        
+        unfinished = [row for row in reference.tolist() if eos_token_id not in row]
+        assert unfinished, "every row reached EOS; the rows would not be independent"
+        assert generated.shape == reference.shape
+        assert generated[0].tolist() == [eos_token_id] + [0] * (generated.size(1) - 1)
+        for row, expected in zip(generated.tolist(), reference.tolist()):
+            if eos_token_id in expected:
+                end = expected.index(eos_token_id) + 1
+                expected = expected[:end] + [0] * (len(expected) - end)
+            assert row == expected
+
+
+class TestGradientCheckpointing:
+    """Test activation checkpointing in the training forward"""
+
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(MaxedOutSathikNeuralCore, dropout=0.0).train()
+
+    def _gradients(self, model, input_ids):
+        model.zero_grad()
+        output = model(input_ids)
+        loss = output['outputs']['language_modeling'].logsumexp(-1).mean() + output['load_balancing_loss']
+        loss.backward()
+        return {name: p.grad.clone() for name, p in model.named_parameters() if p.grad is not None}
+
+    @pytest.mark.parametrize("granularity", ["block", "moe"])
+    def test_checkpointed_gradients_match(self, neural_core, granularity):
+        """Test checkpointing recomputes the same gradients as a plain backward"""
+        input_ids = torch.randint(0, 1000, (2, 8))
+
+        neural_core.gradient_checkpointing_disable()
+        expected = self._gradients(neural_core, input_ids)
+        neural_core.gradient_checkpointing_enable(granularity)
+        actual = self._gradients(neural_core, input_ids)
+
+        assert expected.keys() == actual.keys()
+        for name in expected:
+            assert torch.allclose(actual[name], expected[name], atol=1e-5), name
+
+    def test_rejects_unknown_granularity(self, neural_core):
+        """Test an unknown granularity is rejected"""
+        with pytest.raises(ValueError):
+            neural_core.gradient_checkpointing_enable('layer')
+
+
+class TestInt8Quantization:
+    """Test int8 dynamic quantization for CPU inference"""
+
+    @pytest.fixture
+    def model_config(self):
+        return {**SMALL_CORE_CONFIG, 'stacked_experts': True}
+
+    def test_unstacked_bank_matches_stacked(self):
+        """Test per-expert modules rebuilt from a stacked bank give the same outputs"""
+        torch.manual_seed(0)
+        bank = StackedExpertBank(4, 32, 64).eval()
+        experts = unstack_expert_bank(bank).eval()
+        tokens_per_expert = torch.tensor([3, 0, 2, 1])
+        expert_inputs = torch.randn(6, 32)
+
+        with torch.no_grad():
+            expected = bank(expert_inputs, tokens_per_expert)
+            actual = torch.cat([
+                experts[0](expert_inputs[:3]),
+                experts[2](expert_inputs[3:5]),
+                experts[3](expert_inputs[5:])
+            ])
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_quantizes_every_linear(self, model_config):
+        """Test no fp32 nn.Linear is left outside nn.MultiheadAttention"""
+        torch.manual_seed(0)
+        model = quantize_dynamic_int8(QuantumInspiredNeuralCore(**model_config))
+
+        assert not any(type(module) is torch.nn.Linear for module in model.modules())
+        assert not any(isinstance(module, StackedExpertBank) for module in model.modules())
+
+    def test_quantized_logits_close_to_fp32(self, model_config):
+        """Test the quantized core mostly agrees with fp32 on the next token"""
+        torch.manual_seed(0)
+        model = QuantumInspiredNeuralCore(**model_config).eval()
+        input_ids = torch.randint(0, 1000, (2, 16))
+        with torch.no_grad():
+            reference = model(input_ids, inference_mode=True)['outputs']['language_modeling']
+            quantized = quantize_dynamic_int8(model)(input_ids, inference_mode=True)['outputs']['language_modeling']
+
+        cosine = torch.nn.functional.cosine_similarity(reference, quantized, dim=-1)
+        assert cosine.min().item() > 0.9
+
+    def test_save_load_roundtrip(self, model_config, tmp_path):
+        """Test a saved quantized core reloads with identical outputs"""
+        torch.manual_seed(0)
+        model = quantize_dynamic_int8(QuantumInspiredNeuralCore(**model_config))
+        path = tmp_path / 'core_int8.pt'
+        save_quantized_model(model, path, model_config)
+        loaded = load_quantized_model(path, QuantumInspiredNeuralCore)
+
+        input_ids = torch.randint(0, 1000, (1, 8))
+        with torch.no_grad():
+            expected = model(input_ids, inference_mode=True)['outputs']['language_modeling']
+            actual = loaded(input_ids, inference_mode=True)['outputs']['language_modeling']
+        assert torch.equal(actual, expected)
+
+
+    def test_quantized_state_into_meta_skeleton(self, model_config):
+        """Test an int8 state dict loads into a meta-built skeleton with identical outputs"""
+        torch.manual_seed(0)
+        model = quantize_dynamic_int8(QuantumInspiredNeuralCore(**model_config))
+        state_dict = model.state_dict()
+        assert is_quantized_state_dict(state_dict)
+        assert not is_quantized_state_dict(QuantumInspiredNeuralCore(**model_config).state_dict())
+
+        with torch.device('meta'):
+            skeleton = QuantumInspiredNeuralCore(**model_config)
+        loaded = materialize_from_state_dict(build_quantized_skeleton(skeleton), state_dict)
+        assert not any(t.is_meta for t in loaded.state_dict().values() if torch.is_tensor(t))
+
+        input_ids = torch.randint(0, 1000, (1, 8))
+        with torch.no_grad():
+            expected = model(input_ids, inference_mode=True)['outputs']['language_modeling']
+            actual = loaded(input_ids, inference_mode=True)['outputs']['language_modeling']
+        assert torch.equal(actual, expected)
+
+class TestMixedPrecision:
+    """Test bf16 autocast with fp32 LayerNorm and softmax"""
+
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(MaxedOutSathikNeuralCore).eval()
+
+    def test_layer_norm_runs_in_fp32(self):
+        """Test FP32LayerNorm normalises bf16 input in fp32 and returns bf16"""
+        norm = FP32LayerNorm(32)
+        x = torch.randn(2, 4, 32) * 100
+        output = norm(x.to(torch.bfloat16))
+
+        assert output.dtype == torch.bfloat16
+        assert torch.allclose(output.float(), norm(x), atol=5e-2)
+
+    def test_resolve_autocast_dtype(self):
+        """Test precision names map to autocast dtypes"""
+        assert resolve_autocast_dtype('fp32') is None
+        assert resolve_autocast_dtype('bf16') == torch.bfloat16
+        with pytest.raises(ValueError):
+            resolve_autocast_dtype('int4')
+
+    def test_cast_parameters_keeps_fp32_buffers(self, neural_core):
+        """Test bf16 weights leave the RoPE tables in fp32"""
+        cast_parameters(neural_core, torch.bfloat16)
+        assert all(p.dtype == torch.bfloat16 for p in neural_core.parameters())
+        buffers = dict(neural_core.named_buffers())
+        rope_tables = [name for name in buffers if name.endswith(('cos_cached', 'sin_cached'))]
+        assert rope_tables
+        assert all(buffers[name].dtype == torch.float32 for name in rope_tables)
+
+    def test_bf16_autocast_forward(self, neural_core):
+        """Test the bf16 autocast forward stays close to fp32"""
+        input_ids = torch.randint(0, 1000, (2, 8))
+        with torch.no_grad():
+            reference = neural_core(input_ids, inference_mode=True)['outputs']['language_modeling']
+            with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+                mixed = neural_core(input_ids, inference_mode=True)['outputs']['language_modeling']
+
+        assert torch.isfinite(mixed.float()).all()
+        cosine = torch.nn.functional.cosine_similarity(reference, mixed.float(), dim=-1)
+        assert cosine.min().item() > 0.95
+
+    def test_bf16_generation(self, neural_core):
+        """Test generation under bf16 autocast"""
+        input_ids = torch.randint(2, 1000, (1, 5))
+        generated = neural_core.generate(
+            input_ids, max_length=10, do_sample=False, eos_token_id=-1,
+            autocast_dtype=torch.bfloat16
+        )
+        assert generated.shape == (1, 10)
+
+
+class TestMetaMaterialization:
+    """Test building a core on the meta device and materializing it from a checkpoint"""
+
+    def test_materialized_core_matches_source(self, tmp_path):
+        """Test a meta-built core loaded from a state dict reproduces the source model"""
+        config = SMALL_CORE_CONFIG
+        source = create_small_neural_core(QuantumInspiredNeuralCore).eval()
+        path = tmp_path / 'core.pt'
+        torch.save(source.state_dict(), path)
+
+        with torch.device('meta'):
+            model = QuantumInspiredNeuralCore(**config)
+        assert model.token_input_layer.token_embedding.weight.is_meta
+
+        state_dict = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+        model = materialize_from_state_dict(model, state_dict).eval()
+        assert not any(t.is_meta for t in list(model.parameters()) + list(model.buffers()))
+
+        input_ids = torch.randint(0, 1000, (1, 8))
+        with torch.no_grad():
+            expected = source(input_ids, inference_mode=True)['outputs']['language_modeling']
+            actual = model(input_ids, inference_mode=True)['outputs']['language_modeling']
+        assert torch.equal(actual, expected)
+
+
+class TestShardedCheckpoint:
+    """Test the sharded, memory-mapped weights format"""
+
+    def test_roundtrip_dtypes(self, tmp_path):
+        """Test tensors of every supported dtype and shape come back bit-identical"""
+        state_dict = {
+            'base.weight': torch.randn(4, 3),
+            'base.half': torch.randn(5).to(torch.bfloat16),
+            'base.steps': torch.tensor(7),
+            'base.mask': torch.tensor([True, False, True]),
+            'base.empty': torch.zeros(0, 4),
+            'layers.0.scale': torch.randn(3, dtype=torch.float64),
+        }
+        save_sharded_state_dict(state_dict, tmp_path / 'ckpt')
+        loaded = load_sharded_state_dict(tmp_path / 'ckpt')
+
+        assert list(loaded) == list(state_dict)
+        for name, tensor in state_dict.items():
+            assert loaded[name].dtype == tensor.dtype
+            assert torch.equal(loaded[name], tensor), name
+
+    def test_shards_by_layer_and_expert_group(self, tmp_path):
+        """Test each layer and expert group gets its own shard file"""
+        assert default_shard_name('output_heads.language_modeling.weight') == 'base'
+        assert default_shard_name('layers.3.norm1.weight') == 'layers.3'
+        assert default_shard_name('layers.3.expert_router.experts.17.0.weight', 16) == 'layers.3.experts.1'
+
+        model = MaxedOutSathikNeuralCore(
+            vocab_size=100, d_model=32, num_heads=4, num_layers=2,
+            num_experts=4, top_k=2, max_position_embeddings=64
+        )
+        save_sharded_state_dict(model.state_dict(), tmp_path / 'ckpt', experts_per_shard=2)
+
+        shards = sorted(p.name for p in (tmp_path / 'ckpt').glob('*.safetensors'))
+        assert 'base.safetensors' in shards
+        assert 'layers.1.safetensors' in shards
+        assert 'layers.1.experts.1.safetensors' in shards
+        assert is_sharded_checkpoint(tmp_path / 'ckpt')
+
+    def test_model_roundtrip(self, tmp_path):
+        """Test a core reloaded from shards produces the same logits"""
+        config = dict(
+            vocab_size=100, d_model=32, num_heads=4, num_layers=2,
+            num_experts=4, top_k=2, max_position_embeddings=64
+        )
+        torch.manual_seed(0)
+        source = MaxedOutSathikNeuralCore(**config).eval()
+        save_sharded_state_dict(source.state_dict(), tmp_path / 'ckpt')
+
+        torch.manual_seed(1)
+        model = MaxedOutSathikNeuralCore(**config).eval()
+        model.load_state_dict(load_sharded_state_dict(tmp_path / 'ckpt'))
+
+        input_ids = torch.randint(0, 100, (1, 6))
+        with torch.no_grad():
+            expected = source(input_ids, inference_mode=True)['outputs']['language_modeling']
+            actual = model(input_ids, inference_mode=True)['outputs']['language_modeling']
+        assert torch.equal(actual, expected)
+
+    def test_incomplete_checkpoint_has_no_index(self, tmp_path):
+        """Test a directory without the index is not treated as a checkpoint"""
+        (tmp_path / 'partial').mkdir()
+        assert not is_sharded_checkpoint(tmp_path / 'partial')
+        save_sharded_state_dict({'w': torch.ones(2)}, tmp_path / 'partial')
+        assert (tmp_path / 'partial' / INDEX_FILE).exists()
+
+
+class TestContinuousBatching:
+    """Test the continuous-batching inference engine"""
+    
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(QuantumInspiredNeuralCore, d_model=128, max_position_embeddings=512).eval()
+    
+    def test_matches_generate_per_request(self, neural_core):
+        """Test requests joining and leaving the batch decode the same tokens as alone"""
+        prompts = [[5, 6, 7], [10, 11, 12, 13, 14, 15, 16], [20, 21], [30, 31, 32, 33]]
+        lengths = [6, 3, 8, 5]
+        expected = [
+            neural_core.generate_batch([prompt], max_new_tokens=n, do_sample=False, eos_token_id=-1)[0]
+            for prompt, n in zip(prompts, lengths)
+        ]
+        
+        engine = ContinuousBatchingEngine(neural_core, max_batch_size=2, eos_token_id=-1)
+        requests = [
+            engine.submit(prompt, max_new_tokens=n, do_sample=False)
+            for prompt, n in zip(prompts, lengths)
+        ]
+        engine.run_until_idle()
+        
+        assert [request.future.result() for request in requests] == expected
+        assert engine.num_running == 0
+    
+    def test_batch_never_exceeds_limit(self, neural_core):
+        """Test admission stops at max_batch_size and resumes as rows retire"""
+        engine = ContinuousBatchingEngine(neural_core, max_batch_size=2, eos_token_id=-1)
+        for prompt in ([1, 2], [3, 4], [5, 6]):
+            engine.submit(prompt, max_new_tokens=3, do_sample=False)
+        
+        sizes = []
+        while engine.num_running or engine._waiting:
+            sizes.append(engine.step())
+        assert max(sizes) == 2
+    
+    def test_background_thread_streams_tokens(self, neural_core):
+        """Test the engine thread serves submissions and streams each token"""
+        engine = ContinuousBatchingEngine(neural_core, eos_token_id=-1)
+        engine.start()
+        try:
+            streamed = list(engine.stream([7, 8, 9], max_new_tokens=4, do_sample=False))
+            assert streamed == engine.generate([7, 8, 9], timeout=60, max_new_tokens=4, do_sample=False)
+        finally:
+            engine.stop()
+        assert len(streamed) == 4
+
+
+class TestPrefixKVCache:
+    """Test the shared-prefix KV cache"""
+    
+    @pytest.fixture
+    def neural_core(self):
+        return create_small_neural_core(QuantumInspiredNeuralCore, d_model=128, max_position_embeddings=512).eval()
+    
+    def test_generation_from_cached_prefix(self, neural_core):
+        """Test generating from a cached prefix matches prefilling the whole prompt"""
+        prefix = list(range(10, 30))
+        input_ids = torch.tensor([prefix + [40, 41, 42]])
+        cache = PrefixKVCache()
+        
+        expected = neural_core.generate(input_ids, max_length=30, do_sample=False, eos_token_id=-1)
+        prefix_key_values = cache.get_or_prefill(neural_core, prefix)
+        generated = neural_core.generate(
+            input_ids, max_length=30, do_sample=False, eos_token_id=-1,
+            prefix_key_values=prefix_key_values
+        )
+        
+        assert torch.equal(generated, expected)
+        assert cache.get_or_prefill(neural_core, prefix) is prefix_key_values
+        assert cache.stats['hits'] == 1
+    
+    def test_match_returns_longest_prefix(self):
+        """Test lookup finds the longest cached prefix of a token sequence"""
+        cache = PrefixKVCache()
+        short = [(torch.zeros(1, 2, 2, 4), torch.zeros(1, 2, 2, 4))]
+        long = [(torch.zeros(1, 2, 4, 4), torch.zeros(1, 2, 4, 4))]
+        cache.put([1, 2], short)
+        cache.put([1, 2, 3, 4], long)
+        
+        length, past_key_values = cache.match([1, 2, 3, 4, 5])
+        assert length == 4
+        assert past_key_values[0][0].shape == long[0][0].shape
+        assert cache.match([1, 2, 9])[0] == 2
+        assert cache.match([7]) == (0, None)
+    
+    def test_lru_eviction_by_budget(self):
+        """Test least recently used prefixes are evicted to stay within the byte budget"""
+        entry = lambda: [(torch.zeros(1, 2, 4, 4), torch.zeros(1, 2, 4, 4))]
+        cache = PrefixKVCache(max_bytes=2 * cache_nbytes(entry()))
+        cache.put([1], entry())
+        cache.put([2], entry())
+        cache.get([1])
+        cache.put([3], entry())
+        
+        assert cache.get([2]) is None
+        assert cache.get([1]) is not None
+        assert cache.get([3]) is not None
+        assert cache.nbytes <= cache.max_bytes
+        assert cache.stats['evictions'] == 1
+
+
+class TestLogitsProcessor:
+    """Test the batched top-k / top-p sampling pipeline"""
+    
+    @staticmethod
+    def full_sort_filter(logits, temperature, top_k, top_p):
+        """Reference: top-k then top-p over the whole sorted vocabulary"""
+        logits = logits / temperature
+        kth = torch.topk(logits, top_k).values[:, [-1]]
+        logits = logits.masked_fill(logits < kth, -float('inf'))
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+        cumulative_probs = torch.cumsum(torch.softmax(sorted_logits, dim=-1), dim=-1)
+        remove = cumulative_probs > top_p
+        remove[..., 1:] = remove[..., :-1].clone()
+        remove[..., 0] = False
+        logits = logits.masked_fill(remove.scatter(1, sorted_indices, remove), -float('inf'))
+        return torch.softmax(logits, dim=-1)
+    
+    def test_matches_full_vocabulary_filtering(self):
+        """Test filtering only the top-k candidates gives the full-sort distribution"""
+        logits = torch.randn(4, 1000)
+        processor = LogitsProcessor(temperature=0.7, top_k=40, top_p=0.8)
+        assert torch.allclose(processor.probs(logits), self.full_sort_filter(logits, 0.7, 40, 0.8), atol=1e-6)
+    
+    def test_per_row_settings(self):
+        """Test per-row tensors apply each row's own top-k and greedy choice"""
+        logits = torch.randn(2, 100)
+        processor = LogitsProcessor(
+            temperature=torch.tensor([1.0, 1.0]),
+            top_k=torch.tensor([1, 5]),
+            top_p=torch.tensor([1.0, 1.0]),
+            do_sample=torch.tensor([True, False])
+        )
+        probs = processor.probs(logits)
+        assert (probs[0] > 0).sum() == 1
+        assert (probs[1] > 0).sum() == 5
+        assert torch.equal(processor(logits), logits.argmax(dim=-1))
+    
+    def test_repetition_penalty(self):
+        """Test tokens already in the sequence lose probability"""
+        logits = torch.zeros(1, 10)
+        logits[0, 3] = 2.0
+        logits[0, 4] = 1.9
+        processor = LogitsProcessor(top_k=0, top_p=1.0, repetition_penalty=2.0, do_sample=False)
+        assert processor(logits).item() == 3
+        assert processor(logits, input_ids=torch.tensor([[3, 3]])).item() == 4
+        assert torch.equal(logits[0, 3], torch.tensor(2.0))  # caller's logits untouched
+
+
+class TestSpeculativeDecoding:
+    """Test speculative decoding with the small core as draft model"""
+    
+    @pytest.fixture
+    def target_model(self):
+        return create_small_neural_core(QuantumInspiredNeuralCore, d_model=128, max_position_embeddings=512).eval()
+    
+    @pytest.fixture
+    def draft_model(self):
+        torch.manual_seed(1)
+        return SathikNeuralCore(1000, d_model=64, num_heads=4, num_layers=1, num_experts=2, top_k=1).eval()
+    
+    def test_greedy_matches_target(self, target_model, draft_model):
+        """Test greedy speculative decoding reproduces the target's greedy output"""
+        input_ids = torch.randint(2, 1000, (1, 6))
+        expected = target_model.generate(input_ids, max_length=20, do_sample=False, eos_token_id=-1)
+        
+        decoder = SpeculativeDecoder(target_model, draft_model, num_draft_tokens=3)
+        generated = decoder.generate(input_ids, max_length=20, do_sample=False, eos_token_id=-1)
+        
+        assert torch.equal(generated, expected)
+        metrics = decoder.get_metrics()
+        assert metrics['generated_tokens'] == 14
+        assert 0.0 <= metrics['acceptance_rate'] <= 1.0
+        assert metrics['target_forwards'] <= 1 + metrics['generated_tokens']
+    
+    def test_generate_routes_to_draft_model(self, target_model, draft_model):
+        """Test generate() with a draft model returns prefill outputs and fills the metrics"""
+        input_ids = torch.randint(2, 1000, (1, 5))
+        metrics = new_speculative_metrics()
+        generated, prefill = target_model.generate(
+            input_ids, max_length=12, eos_token_id=-1, draft_model=draft_model,
+            return_prefill_outputs=True, speculative_metrics=metrics
+        )
+        
+        assert generated.shape == (1, 12)
+        assert len(prefill['analyses']) == target_model.num_layers
+        assert metrics['generated_tokens'] == 7
+    
+    def test_vocabulary_mismatch_rejected(self, target_model):
+        """Test a draft with a different vocabulary is refused"""
+        draft_model = SathikNeuralCore(500, d_model=64, num_heads=4, num_layers=1, num_experts=2, top_k=1)
+        with pytest.raises(ValueError):
+            SpeculativeDecoder(target_model, draft_model).generate(torch.randint(2, 500, (1, 4)), max_length=8)
+
+
 class TestNeuralCorePerformance:
     """Performance tests for neural core"""
     
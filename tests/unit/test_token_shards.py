@@ -0,0 +1,127 @@
+"""
+Unit tests for pre-tokenized token shards
+Tests for writing, reading and pickling memory-mapped shards
+"""
+import pytest
+import numpy as np
+import pickle
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from web_crawler.token_shards import (
+    INDEX_FILE,
+    TokenShard,
+    is_token_shard,
+    pretokenize_json,
+    token_dtype,
+    write_token_shard
+)
+
+
+class WordTokenizer:
+    """Tokenizer stand-in mapping whitespace-separated words to ids"""
+
+    def __init__(self, vocab_size=100):
+        self.vocab = {f"w{i}": i for i in range(vocab_size)}
+
+    def encode(self, text):
+        return [self.vocab[word] for word in text.split()]
+
+
+DOCUMENTS = ['w5 w6 w7', '', 'w9', 'w1 w2 w3 w4 w99']
+
+
+class TestTokenDtype:
+    """Test choosing the token dtype"""
+
+    def test_sixteen_bit_boundary(self):
+        """Test uint16 holds ids up to 2**16 - 1 and uint32 takes over after"""
+        assert token_dtype(2) == np.uint16
+        assert token_dtype(2 ** 16) == np.uint16
+        assert token_dtype(2 ** 16 + 1) == np.uint32
+
+
+class TestWriteTokenShard:
+    """Test writing and reading shards back"""
+
+    def test_round_trip(self, tmp_path):
+        """Test every document, including an empty one, reads back unchanged"""
+        index = write_token_shard(DOCUMENTS, WordTokenizer(), tmp_path)
+        shard = TokenShard(tmp_path)
+
+        assert index == {'dtype': 'uint16', 'num_documents': 4, 'num_tokens': 9, 'vocab_size': 100}
+        assert is_token_shard(tmp_path)
+        assert len(shard) == 4 and shard.num_tokens == 9
+        assert [shard[i].tolist() for i in range(len(shard))] == [[5, 6, 7], [], [9], [1, 2, 3, 4, 99]]
+        assert shard.lengths().tolist() == [3, 0, 1, 5]
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['offsets.bin', 'shard.json', 'tokens.bin']
+
+    def test_empty_shard(self, tmp_path):
+        """Test a shard without documents or without tokens can be read"""
+        write_token_shard([], WordTokenizer(), tmp_path / 'none')
+        write_token_shard(['', ''], WordTokenizer(), tmp_path / 'blank')
+
+        assert len(TokenShard(tmp_path / 'none')) == 0
+        assert TokenShard(tmp_path / 'none').tokens.size == 0
+        blank = TokenShard(tmp_path / 'blank')
+        assert len(blank) == 2 and blank.num_tokens == 0
+        assert blank[1].tolist() == []
+
+    def test_large_vocabulary_uses_uint32(self, tmp_path):
+        """Test ids beyond 16 bits are stored as uint32 without truncation"""
+        tokenizer = WordTokenizer(vocab_size=2 ** 16 + 10)
+        index = write_token_shard(['w65540 w3'], tokenizer, tmp_path)
+        shard = TokenShard(tmp_path)
+
+        assert index['dtype'] == 'uint32'
+        assert shard.tokens.dtype == np.uint32
+        assert shard[0].tolist() == [65540, 3]
+
+    def test_pretokenize_json(self, tmp_path):
+        """Test sharding the content of processed-data JSON items"""
+        data_path = tmp_path / 'data.json'
+        data_path.write_text('[{"content": "w1 w2"}, {"metadata": {}}, {"content": "w3"}]')
+        pretokenize_json(data_path, WordTokenizer(), tmp_path / 'shard')
+
+        shard = TokenShard(tmp_path / 'shard')
+        assert [shard[i].tolist() for i in range(len(shard))] == [[1, 2], [], [3]]
+
+    def test_incomplete_shard_is_not_a_shard(self, tmp_path):
+        """Test a directory without its index is not treated as a shard"""
+        write_token_shard(DOCUMENTS, WordTokenizer(), tmp_path)
+        (tmp_path / INDEX_FILE).unlink()
+        assert not is_token_shard(tmp_path)
+
+
+class TestTokenShard:
+    """Test the mapped shard view"""
+
+    @pytest.fixture
+    def shard(self, tmp_path):
+        write_token_shard(DOCUMENTS, WordTokenizer(), tmp_path)
+        return TokenShard(tmp_path)
+
+    @pytest.mark.parametrize('idx', [-1, 4, 100])
+    def test_index_out_of_range(self, shard, idx):
+        """Test indices outside the shard raise IndexError"""
+        with pytest.raises(IndexError):
+            shard[idx]
+
+    def test_documents_are_views(self, shard):
+        """Test documents are slices of the mapping rather than copies"""
+        assert isinstance(shard.tokens, np.memmap)
+        assert np.shares_memory(shard[0], shard.tokens)
+
+    def test_pickle_drops_mappings(self, shard):
+        """Test pickled shards carry no mapped data and remap on access"""
+        shard[0]  # map the files
+        restored = pickle.loads(pickle.dumps(shard))
+
+        assert restored._tokens is None and restored._offsets is None
+        assert len(pickle.dumps(shard)) < 1000
+        assert [restored[i].tolist() for i in range(len(restored))] == [[5, 6, 7], [], [9], [1, 2, 3, 4, 99]]
+        assert isinstance(restored._tokens, np.memmap)
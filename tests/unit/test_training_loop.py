@@ -0,0 +1,495 @@
+"""
+Unit tests for the live training loop
+Tests for checkpointing, datasets, samplers and collation
+"""
+import pytest
+import torch
+import json
+import itertools
+import logging
+import threading
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from web_crawler.token_shards import write_token_shard
+from training_loop import (
+    IGNORE_INDEX,
+    AsyncCheckpointer,
+    LengthBucketedBatchSampler,
+    LiveDataWriter,
+    LiveTrainingLoop,
+    PackedWebDataset,
+    StreamingWebDataset,
+    make_lm_example,
+    pad_collate
+)
+
+PAD, EOS = 0, 3
+
+
+class DigitTokenizer:
+    """Tokenizer stand-in reading whitespace-separated token ids"""
+    special_tokens = {'<PAD>': PAD, '<UNK>': 1, '<BOS>': 2, '<EOS>': EOS, '<MASK>': 4}
+    vocab = {str(i): i for i in range(1000)}
+
+    def encode(self, text):
+        return [int(word) for word in text.split()]
+
+
+def write_json_data(path, contents):
+    path.write_text(json.dumps([{'content': content, 'metadata': {}} for content in contents]))
+    return str(path)
+
+
+class StubTokenizer:
+    """Tokenizer stand-in that only needs to save itself"""
+
+    def save(self, path):
+        Path(path).write_bytes(b'tokenizer')
+
+
+class BlockingTokenizer(StubTokenizer):
+    """Holds the checkpoint writer inside the write until released"""
+    entered = threading.Event()
+    release = threading.Event()
+
+    def save(self, path):
+        BlockingTokenizer.entered.set()
+        BlockingTokenizer.release.wait(timeout=10)
+        super().save(path)
+
+
+class FailingTokenizer:
+    def save(self, path):
+        raise RuntimeError("disk full")
+
+
+def small_state():
+    return {'weight': torch.randn(4, 4), 'bias': torch.zeros(4)}
+
+
+class TestAsyncCheckpointer:
+    """Test the background checkpoint writer"""
+
+    def test_write_is_atomic(self, tmp_path):
+        """Test a checkpoint only appears once it is complete"""
+        checkpointer = AsyncCheckpointer(tmp_path, keep_last=3)
+        BlockingTokenizer.entered.clear()
+        BlockingTokenizer.release.clear()
+        try:
+            checkpointer.save(7, small_state(), {'training_step': 7}, BlockingTokenizer())
+            assert BlockingTokenizer.entered.wait(timeout=10)
+
+            # Mid-write: only the temporary directory exists
+            assert checkpointer.checkpoints() == []
+            assert not (tmp_path / 'sathik_checkpoint_7').exists()
+            assert (tmp_path / '.sathik_checkpoint_7.tmp').is_dir()
+        finally:
+            BlockingTokenizer.release.set()
+
+        final_path = checkpointer.wait()
+        checkpointer.close()
+
+        assert final_path == tmp_path / 'sathik_checkpoint_7'
+        assert checkpointer.checkpoints() == [final_path]
+        assert not (tmp_path / '.sathik_checkpoint_7.tmp').exists()
+        for name in ('model', 'training_state.pt', 'tokenizer.pkl'):
+            assert (final_path / name).exists()
+
+    def test_keep_last_prunes_oldest(self, tmp_path):
+        """Test only the newest keep_last checkpoints are kept"""
+        checkpointer = AsyncCheckpointer(tmp_path, keep_last=2)
+        for step in (10, 2, 30, 4):
+            checkpointer.save(step, small_state(), {'training_step': step}, StubTokenizer())
+        checkpointer.close()
+
+        assert [path.name for path in checkpointer.checkpoints()] == [
+            'sathik_checkpoint_10', 'sathik_checkpoint_30'
+        ]
+
+    def test_wait_raises_worker_error(self, tmp_path):
+        """Test a failed write is raised from wait() and leaves nothing behind"""
+        checkpointer = AsyncCheckpointer(tmp_path)
+        checkpointer.save(1, small_state(), {}, FailingTokenizer())
+
+        with pytest.raises(RuntimeError, match="disk full"):
+            checkpointer.wait()
+        assert list(tmp_path.iterdir()) == []
+
+        # The writer keeps working after a failure
+        future = checkpointer.save(2, small_state(), {}, StubTokenizer())
+        assert future.result() == tmp_path / 'sathik_checkpoint_2'
+        checkpointer.close()
+
+    def test_failed_write_does_not_block_next_save(self, tmp_path, caplog):
+        """Test save() reports an unobserved failed write and proceeds"""
+        checkpointer = AsyncCheckpointer(tmp_path)
+        checkpointer.save(1, small_state(), {}, FailingTokenizer())
+        with caplog.at_level(logging.WARNING, logger='training_loop'):
+            checkpointer.save(2, small_state(), {}, StubTokenizer())
+        checkpointer.close()
+
+        assert [path.name for path in checkpointer.checkpoints()] == ['sathik_checkpoint_2']
+        assert "Checkpoint for step 1 failed (disk full); step 2 supersedes it" in caplog.text
+
+    def test_save_after_close(self, tmp_path):
+        """Test a closed checkpointer starts a new writer for the next save"""
+        checkpointer = AsyncCheckpointer(tmp_path)
+        checkpointer.save(1, small_state(), {}, StubTokenizer())
+        checkpointer.close()
+        checkpointer.save(2, small_state(), {}, StubTokenizer())
+        checkpointer.close()
+
+        assert [path.name for path in checkpointer.checkpoints()] == [
+            'sathik_checkpoint_1', 'sathik_checkpoint_2'
+        ]
+
+    def test_host_buffers_are_snapshots(self, tmp_path):
+        """Test later in-place updates do not leak into a queued checkpoint"""
+        checkpointer = AsyncCheckpointer(tmp_path)
+        state = small_state()
+        expected = state['weight'].clone()
+        checkpointer.save(1, state, {}, StubTokenizer())
+        state['weight'].add_(1.0)
+        checkpointer.close()
+
+        from neural_core.sharded_checkpoint import load_sharded_state_dict
+        saved = load_sharded_state_dict(tmp_path / 'sathik_checkpoint_1' / 'model')
+        assert torch.equal(saved['weight'], expected)
+
+
+class TestPackedWebDataset:
+    """Test packing documents into full rows"""
+
+    @pytest.fixture
+    def dataset(self, tmp_path):
+        # Stream: 10 11 12 EOS | 20 .. 25 EOS | 30 EOS (the empty document is dropped)
+        data_path = write_json_data(tmp_path / 'data.json', ['10 11 12', '', '20 21 22 23 24 25', '30'])
+        return PackedWebDataset(data_path, DigitTokenizer(), max_length=5)
+
+    def test_rows(self, dataset):
+        """Test rows are cut from the stream with the last one padded"""
+        assert len(dataset) == 3
+        assert [dataset[i]['input_ids'].tolist() for i in range(3)] == [
+            [10, 11, 12, EOS], [21, 22, 23, 24], [EOS, 30, EOS, PAD]
+        ]
+
+    def test_targets_shift_within_documents(self, dataset):
+        """Test targets are the next token, ignored across documents and on padding"""
+        assert dataset[0]['target_ids'].tolist() == [11, 12, EOS, IGNORE_INDEX]
+        assert dataset[1]['target_ids'].tolist() == [22, 23, 24, 25]
+        assert dataset[2]['target_ids'].tolist() == [IGNORE_INDEX, EOS, IGNORE_INDEX, IGNORE_INDEX]
+
+    def test_document_ids(self, dataset):
+        """Test document ids follow the source items, with -1 for padding"""
+        assert dataset[0]['document_ids'].tolist() == [0, 0, 0, 0]
+        assert dataset[1]['document_ids'].tolist() == [2, 2, 2, 2]
+        assert dataset[2]['document_ids'].tolist() == [2, 3, 3, -1]
+
+    def test_positions_reset(self, dataset):
+        """Test positions restart at every document start and row boundary"""
+        assert dataset[0]['position_ids'].tolist() == [0, 1, 2, 3]
+        assert dataset[1]['position_ids'].tolist() == [0, 1, 2, 3]
+        assert dataset[2]['position_ids'].tolist() == [0, 0, 1, 0]
+
+    def test_positions_bounded_by_row(self, tmp_path):
+        """Test a document far longer than a row never exceeds row positions"""
+        long_document = ' '.join(['7'] * 1000)
+        dataset = PackedWebDataset(write_json_data(tmp_path / 'data.json', [long_document]), DigitTokenizer(), max_length=16)
+        assert max(dataset[i]['position_ids'].max().item() for i in range(len(dataset))) < 16
+
+    def test_shard_rows_match_json(self, tmp_path):
+        """Test rows read lazily from a token shard equal the tokenized JSON rows"""
+        contents = ['10 11 12', '', '20 21 22 23 24 25', '30', ' '.join(['7'] * 23), '', '40 41']
+        json_dataset = PackedWebDataset(write_json_data(tmp_path / 'data.json', contents), DigitTokenizer(), max_length=6)
+        write_token_shard(contents, DigitTokenizer(), tmp_path / 'shard')
+        shard_dataset = PackedWebDataset(str(tmp_path / 'shard'), DigitTokenizer(), max_length=6)
+
+        assert len(shard_dataset) == len(json_dataset)
+        for idx in range(len(json_dataset)):
+            for key, value in json_dataset[idx].items():
+                assert torch.equal(shard_dataset[idx][key], value), (idx, key)
+
+    def test_empty_shard(self, tmp_path):
+        """Test a shard of empty documents packs into no rows"""
+        write_token_shard(['', ''], DigitTokenizer(), tmp_path / 'shard')
+        assert len(PackedWebDataset(str(tmp_path / 'shard'), DigitTokenizer(), max_length=6)) == 0
+
+
+class TestLengthBucketedBatchSampler:
+    """Test length-bucketed batching"""
+
+    lengths = [(i * 37) % 100 + 2 for i in range(500)]
+
+    def test_every_index_once(self):
+        """Test an epoch yields every index exactly once"""
+        sampler = LengthBucketedBatchSampler(self.lengths, batch_size=8, bucket_size=40)
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+        assert sorted(idx for batch in batches for idx in batch) == list(range(500))
+
+    def test_batches_are_homogeneous(self):
+        """Test batches from one bucket cover disjoint length ranges"""
+        sampler = LengthBucketedBatchSampler(self.lengths, batch_size=8, bucket_size=len(self.lengths))
+        ranges = sorted(
+            (min(self.lengths[idx] for idx in batch), max(self.lengths[idx] for idx in batch))
+            for batch in sampler
+        )
+        for (_, high), (low, _) in zip(ranges, ranges[1:]):
+            assert high <= low
+
+    def test_epochs_reshuffle(self):
+        """Test successive epochs produce different batch orders"""
+        sampler = LengthBucketedBatchSampler(self.lengths, batch_size=8, bucket_size=40)
+        assert list(sampler) != list(sampler)
+
+    def test_drop_last(self):
+        """Test drop_last only yields full batches"""
+        sampler = LengthBucketedBatchSampler(self.lengths, batch_size=8, bucket_size=40, drop_last=True)
+        batches = list(sampler)
+        assert len(batches) == len(sampler) == 500 // 40 * 5 + 20 // 8
+        assert all(len(batch) == 8 for batch in batches)
+
+    def test_skips_items_without_targets(self):
+        """Test items shorter than two tokens are never batched"""
+        sampler = LengthBucketedBatchSampler([0, 1, 5, 2, 1, 7], batch_size=4)
+        batches = list(sampler)
+        assert len(batches) == len(sampler) == 1
+        assert sorted(batches[0]) == [2, 3, 5]
+
+
+class TestPadCollate:
+    """Test padding batches to their longest item"""
+
+    def test_pads_to_batch_max(self):
+        """Test inputs, targets and masks are padded with their own values"""
+        batch = [
+            make_lm_example([5, 6, 7], 512, PAD, {'id': 0}, dynamic_padding=True),
+            make_lm_example([5, 6, 7, 8, 9, 10], 512, PAD, {'id': 1}, dynamic_padding=True)
+        ]
+        collated = pad_collate(batch, pad_token_id=PAD)
+
+        assert collated['input_ids'].tolist() == [[5, 6, PAD, PAD, PAD], [5, 6, 7, 8, 9]]
+        assert collated['target_ids'].tolist() == [
+            [6, 7, IGNORE_INDEX, IGNORE_INDEX, IGNORE_INDEX], [6, 7, 8, 9, 10]
+        ]
+        assert collated['attention_mask'].tolist() == [[1, 1, 0, 0, 0], [1, 1, 1, 1, 1]]
+        assert collated['metadata'] == [{'id': 0}, {'id': 1}]
+
+    def test_short_item_has_no_targets(self):
+        """Test a one-token item is padded to one ignored target"""
+        item = make_lm_example([5], 512, PAD, dynamic_padding=True)
+        assert item['input_ids'].tolist() == [5]
+        assert item['target_ids'].tolist() == [IGNORE_INDEX]
+
+
+def write_jsonl(path, contents):
+    path.write_text(''.join(json.dumps({'content': content}) + '\n' for content in contents))
+    return str(path)
+
+
+def drain(documents):
+    """Documents a stream yields before it next reports nothing new"""
+    found = []
+    for document in documents:
+        if document is None:
+            return found
+        found.append(document)
+
+
+class TestLiveDataWriter:
+    """Test appending crawled items to live shards"""
+
+    def test_rotates_shards(self, tmp_path):
+        """Test a new shard is started every max_items_per_shard items"""
+        writer = LiveDataWriter(tmp_path, max_items_per_shard=2)
+        for i in range(5):
+            writer.write({'content': f"item {i}"})
+        writer.close()
+
+        shards = sorted(tmp_path.iterdir())
+        assert [path.name for path in shards] == ['web_000000.jsonl', 'web_000001.jsonl', 'web_000002.jsonl']
+        assert [json.loads(line)['content'] for line in shards[1].read_text().splitlines()] == ['item 2', 'item 3']
+
+    def test_continues_after_existing_shards(self, tmp_path):
+        """Test a restarted writer never appends to an earlier shard"""
+        (tmp_path / 'web_000004.jsonl').write_text('')
+        writer = LiveDataWriter(tmp_path)
+        writer.write({'content': 'new'})
+        writer.close()
+        assert (tmp_path / 'web_000005.jsonl').read_text() == '{"content": "new"}\n'
+
+
+class TestStreamingWebDataset:
+    """Test mixing the historical corpus with live data"""
+
+    def test_tails_partial_lines(self, tmp_path):
+        """Test a half-written last line is only read once it is complete"""
+        live_file = tmp_path / 'web_000000.jsonl'
+        live_file.write_text('{"content": "10 11"}\n{"content": "20')
+        dataset = StreamingWebDataset([], DigitTokenizer(), live_dir=str(tmp_path), poll_interval=0)
+        fresh = dataset._fresh_documents(lambda: True)
+
+        assert [tokens for tokens, _ in drain(fresh)] == [[10, 11]]
+        assert drain(fresh) == []
+
+        with open(live_file, 'a') as f:
+            f.write(' 21"}\n{"content": "30 31"}\n')
+        assert [tokens for tokens, _ in drain(fresh)] == [[20, 21], [30, 31]]
+
+    def test_picks_up_new_token_shards(self, tmp_path):
+        """Test a token shard appearing in live_dir is read once"""
+        dataset = StreamingWebDataset([], DigitTokenizer(), live_dir=str(tmp_path), poll_interval=0)
+        fresh = dataset._fresh_documents(lambda: True)
+        assert drain(fresh) == []
+
+        write_token_shard(['40 41 42'], DigitTokenizer(), tmp_path / 'shard_0000')
+        assert [tokens for tokens, _ in drain(fresh)] == [[40, 41, 42]]
+        assert drain(fresh) == []
+
+    def test_falls_back_to_corpus(self, tmp_path):
+        """Test the corpus is used when no fresh data is waiting, even at fresh_ratio 1"""
+        corpus = write_jsonl(tmp_path / 'corpus.jsonl', ['10 11', '20 21'])
+        live_dir = tmp_path / 'live'
+        live_dir.mkdir()
+        dataset = StreamingWebDataset(
+            [corpus], DigitTokenizer(), live_dir=str(live_dir), fresh_ratio=1.0, poll_interval=0, dynamic_padding=True
+        )
+        items = list(itertools.islice(iter(dataset), 3))
+        assert [item['input_ids'].tolist() for item in items] == [[10], [20], [10]]
+
+    def test_prefers_fresh_data(self, tmp_path):
+        """Test waiting fresh data is drawn first at fresh_ratio 1"""
+        corpus = write_jsonl(tmp_path / 'corpus.jsonl', ['10 11'])
+        live_dir = tmp_path / 'live'
+        live_dir.mkdir()
+        write_jsonl(live_dir / 'web_000000.jsonl', ['50 51', '60 61'])
+        dataset = StreamingWebDataset(
+            [corpus], DigitTokenizer(), live_dir=str(live_dir), fresh_ratio=1.0, poll_interval=0, dynamic_padding=True
+        )
+        items = list(itertools.islice(iter(dataset), 3))
+        assert [item['input_ids'].tolist() for item in items] == [[50], [60], [10]]
+
+    def test_skips_documents_without_targets(self, tmp_path):
+        """Test empty and one-token documents are never yielded"""
+        corpus = write_jsonl(tmp_path / 'corpus.jsonl', ['', '10', '20 21'])
+        dataset = StreamingWebDataset([corpus], DigitTokenizer(), fresh_ratio=0.0, dynamic_padding=True)
+        items = list(itertools.islice(iter(dataset), 2))
+        assert [item['input_ids'].tolist() for item in items] == [[20], [20]]
+
+    def test_workers_own_disjoint_shares(self, tmp_path, monkeypatch):
+        """Test DataLoader workers split the corpus without overlap"""
+        contents = [f"{10 * i} {10 * i + 1}" for i in range(1, 7)]
+        corpus = write_jsonl(tmp_path / 'corpus.jsonl', contents)
+        dataset = StreamingWebDataset([corpus], DigitTokenizer(), fresh_ratio=0.0, dynamic_padding=True)
+
+        shares = []
+        for worker_id in range(2):
+            worker = SimpleNamespace(id=worker_id, num_workers=2)
+            monkeypatch.setattr('training_loop.get_worker_info', lambda: worker)
+            items = itertools.islice(iter(dataset), 3)
+            shares.append({item['input_ids'].item() for item in items})
+
+        assert shares[0].isdisjoint(shares[1])
+        assert shares[0] | shares[1] == {10 * i for i in range(1, 7)}
+
+
+@pytest.fixture
+def small_config(tmp_path, monkeypatch):
+    # LongTermMemory and the live data writer write relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return {
+        'vocab_size': 1000,
+        'd_model': 64,
+        'num_heads': 4,
+        'num_layers': 2,
+        'num_experts': 4,
+        'top_k': 2,
+        'gradient_checkpointing': False,
+        'checkpoint_dir': str(tmp_path / 'checkpoints'),
+        'live_data_dir': str(tmp_path / 'live_data')
+    }
+
+
+class TestCheckpointRoundTrip:
+    """Test resuming LiveTrainingLoop from its own checkpoints"""
+
+    def test_load_checkpoint_restores_state(self, small_config):
+        """Test model, optimizer and step survive a save/load round trip"""
+        torch.manual_seed(0)
+        loop = LiveTrainingLoop(small_config)
+        batch = {
+            'input_ids': torch.randint(5, 1000, (2, 8)),
+            'target_ids': torch.randint(5, 1000, (2, 8)),
+            'attention_mask': torch.ones(2, 8, dtype=torch.long)
+        }
+        loop.train_step(batch)
+        loop._save_checkpoint(wait=True)
+        loop.checkpointer.close()
+        checkpoint_path = loop.checkpointer.checkpoints()[-1]
+        assert checkpoint_path.name == 'sathik_checkpoint_1'
+
+        resumed = LiveTrainingLoop(small_config)
+        resumed.load_checkpoint(checkpoint_path)
+        resumed.checkpointer.close()
+
+        assert resumed.training_step == 1
+        for name, tensor in loop.model.state_dict().items():
+            assert torch.equal(resumed.model.state_dict()[name], tensor), name
+
+        original = loop.optimizer.state_dict()
+        restored = resumed.optimizer.state_dict()
+        assert restored['state'].keys() == original['state'].keys()
+        for key, state in original['state'].items():
+            assert torch.equal(restored['state'][key]['exp_avg'], state['exp_avg'])
+            assert torch.equal(restored['state'][key]['exp_avg_sq'], state['exp_avg_sq'])
+        assert resumed.scheduler.state_dict() == loop.scheduler.state_dict()
+
+
+class TestTrainStep:
+    """Test single training steps"""
+
+    def test_skips_batch_without_targets(self, small_config):
+        """Test a batch with every target ignored leaves the weights untouched"""
+        loop = LiveTrainingLoop(small_config)
+        loop.checkpointer.close()
+        weights = {name: tensor.clone() for name, tensor in loop.model.state_dict().items()}
+        batch = pad_collate([make_lm_example([5], 512, PAD, dynamic_padding=True)] * 2)
+
+        assert loop.train_step(batch) is None
+        assert loop.training_step == 0
+        for name, tensor in loop.model.state_dict().items():
+            assert torch.equal(tensor, weights[name]), name
+
+
+class TestQueuedWebData:
+    """Test handing crawled items to training"""
+
+    item = {'content': 'fresh page', 'metadata': {'url': 'https://example.com'}, 'quality_score': 0.8}
+
+    def test_not_written_without_streaming(self, small_config, tmp_path):
+        """Test crawled items are not kept on disk when nothing streams them"""
+        loop = LiveTrainingLoop(small_config)
+        loop.checkpointer.close()
+        loop.data_queue.put(self.item)
+        loop._process_queued_data()
+
+        assert loop.live_data_writer is None
+        assert not (tmp_path / 'live_data').exists()
+        assert loop.data_queue.empty()
+
+    def test_written_when_streaming(self, small_config, tmp_path):
+        """Test crawled items reach the live shards when streaming is on"""
+        loop = LiveTrainingLoop({**small_config, 'stream_live_data': True})
+        loop.checkpointer.close()
+        loop.data_queue.put(self.item)
+        loop._process_queued_data()
+        loop.live_data_writer.close()
+
+        lines = (tmp_path / 'live_data' / 'web_000000.jsonl').read_text().splitlines()
+        assert [json.loads(line)['content'] for line in lines] == ['fresh page']
@@ -1,7 +1,8 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, IterableDataset, Sampler, get_worker_info
 import asyncio
 import aiohttp
 import schedule
@@ -15,12 +16,28 @@ from pathlib import Path
 import threading
 import queue
 import pickle
+import copy
+import functools
+import itertools
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Import our components
-from neural_core.advanced_neural_core import MaxedOutSathikNeuralCore
+from neural_core.advanced_neural_core import (
+    MaxedOutSathikNeuralCore,
+    autocast_context,
+    build_document_attention_mask,
+    cast_parameters,
+    resolve_autocast_dtype
+)
+from neural_core.sharded_checkpoint import load_sharded_state_dict, save_sharded_state_dict
 from web_crawler.web_crawler_unit import BasicSpider
 from web_crawler.raw_data_processor import RawDataProcessor
 from web_crawler.tokenizer import BPETokenizer
+from web_crawler.token_shards import TokenShard, is_token_shard
 from memory_system.memory_system import ShortTermMemory, LongTermMemory, SelfHealingLayer
 from memory_system.safety_modules import TruthComparator, ContentFilter, Obfuscator
 
@@ -28,12 +45,44 @@ from memory_system.safety_modules import TruthComparator, ContentFilter, Obfusca
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+IGNORE_INDEX = -100  # target id skipped by the loss (padding, document boundaries)
+
+def make_lm_example(tokens: List[int], max_length: int, pad_token_id: int, metadata=None, dynamic_padding: bool = False):
+    """
+    Language-modeling item from truncated token ids: padded to max_length, or
+    with dynamic_padding only to the two tokens one input/target pair needs
+    """
+    length = len(tokens)
+    padded_length = max(length, 2) if dynamic_padding else max_length
+    tokens = tokens + [pad_token_id] * (padded_length - length)
+    
+    # Create input and target (shifted by 1 for language modeling); padding is not predicted
+    input_ids = torch.tensor(tokens[:-1], dtype=torch.long)
+    target_ids = torch.tensor(tokens[1:], dtype=torch.long)
+    target_ids[max(length - 1, 0):] = IGNORE_INDEX
+    attention_mask = (torch.arange(padded_length - 1) < length).long()
+    
+    return {
+        'input_ids': input_ids,
+        'target_ids': target_ids,
+        'attention_mask': attention_mask,
+        'metadata': metadata if metadata is not None else {}
+    }
+
 class WebDataset(Dataset):
-    """Dataset for web-crawled data"""
-    def __init__(self, data_path: str, tokenizer: BPETokenizer, max_length: int = 512):
+    """
+    Dataset for web-crawled data: a processed-data JSON file, or a token
+    shard directory (web_crawler/token_shards.py) read through memory maps
+    with no tokenization at all. Items are padded to max_length, or, with
+    dynamic_padding, left unpadded for pad_collate to pad to the batch max.
+    """
+    def __init__(self, data_path: str, tokenizer: BPETokenizer, max_length: int = 512, dynamic_padding: bool = False):
         self.tokenizer = tokenizer
         self.max_length = max_length
-        self.data = self._load_data(data_path)
+        self.dynamic_padding = dynamic_padding
+        self.shard = TokenShard(data_path) if is_token_shard(data_path) else None
+        self.data = self._load_data(data_path) if self.shard is None else None
+        self._tokens = None  # truncated token ids per item, once item_lengths() has run
     
     def _load_data(self, data_path: str):
         """Load processed web data"""
@@ -45,31 +94,515 @@ class WebDataset(Dataset):
             return []
     
     def __len__(self):
-        return len(self.data)
+        return len(self.shard) if self.shard is not None else len(self.data)
+    
+    def _encode(self, idx) -> List[int]:
+        """Token ids of an item, truncated to max_length"""
+        if self.shard is not None:
+            return self.shard[idx][:self.max_length].tolist()
+        if self._tokens is not None:
+            return list(self._tokens[idx])
+        return self.tokenizer.encode(self.data[idx].get('content', ''))[:self.max_length]
+    
+    def item_lengths(self) -> List[int]:
+        """Token count of every item (without a shard, tokenizes the whole dataset once and keeps the result)"""
+        if self.shard is not None:
+            return np.minimum(self.shard.lengths(), self.max_length).tolist()
+        if self._tokens is None:
+            self._tokens = [self._encode(idx) for idx in range(len(self.data))]
+        return [len(tokens) for tokens in self._tokens]
     
     def __getitem__(self, idx):
-        item = self.data[idx]
-        content = item.get('content', '')
+        metadata = self.data[idx].get('metadata', {}) if self.data is not None else {}
+        
+        return make_lm_example(
+            self._encode(idx),
+            self.max_length,
+            self.tokenizer.special_tokens['<PAD>'],
+            metadata,
+            self.dynamic_padding
+        )
+
+def pad_collate(batch, pad_token_id: int = 0):
+    """Collate unpadded WebDataset items, padding each batch only to its longest item"""
+    max_length = max(item['input_ids'].numel() for item in batch)
+    
+    def pad(key, value):
+        return torch.stack([F.pad(item[key], (0, max_length - item[key].numel()), value=value) for item in batch])
+    
+    return {
+        'input_ids': pad('input_ids', pad_token_id),
+        'target_ids': pad('target_ids', IGNORE_INDEX),
+        'attention_mask': pad('attention_mask', 0),
+        'metadata': [item['metadata'] for item in batch]
+    }
+
+class LengthBucketedBatchSampler(Sampler):
+    """
+    Batches of similar-length items. Each epoch shuffles the indices, sorts
+    them by length within buckets of bucket_size items, cuts the buckets into
+    batches and shuffles the batch order. With pad_collate, a batch is only
+    padded to its longest item, so little compute goes to padding while the
+    order stays random at the bucket scale. Items shorter than min_length
+    have no target to train on and are skipped (a bucket of them would make
+    the loss NaN).
+    """
+    def __init__(
+        self,
+        lengths: List[int],
+        batch_size: int,
+        bucket_size: Optional[int] = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 0,
+        min_length: int = 2
+    ):
+        self.lengths = lengths
+        self.indices = [idx for idx, length in enumerate(lengths) if length >= min_length]
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size or batch_size * 50
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = torch.Generator().manual_seed(seed)
+    
+    def __iter__(self):
+        num_items = len(self.indices)
+        if self.shuffle:
+            order = [self.indices[i] for i in torch.randperm(num_items, generator=self.generator).tolist()]
+        else:
+            order = list(self.indices)
         
-        # Tokenize content
-        tokens = self.tokenizer.encode(content)
+        batches = []
+        for start in range(0, num_items, self.bucket_size):
+            bucket = sorted(order[start:start + self.bucket_size], key=self.lengths.__getitem__)
+            for batch_start in range(0, len(bucket), self.batch_size):
+                batch = bucket[batch_start:batch_start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
         
-        # Truncate or pad to max_length
-        if len(tokens) > self.max_length:
-            tokens = tokens[:self.max_length]
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=self.generator).tolist()]
+        return iter(batches)
+    
+    def __len__(self):
+        bucket_sizes = [
+            min(self.bucket_size, len(self.indices) - start) for start in range(0, len(self.indices), self.bucket_size)
+        ]
+        if self.drop_last:
+            return sum(size // self.batch_size for size in bucket_sizes)
+        return sum(-(-size // self.batch_size) for size in bucket_sizes)
+
+class PackedWebDataset(WebDataset):
+    """
+    Web data packed into full rows: documents, each closed with <EOS>, are
+    concatenated and cut into max_length-token rows, so only the last row
+    carries padding. Items hold per-token document ids (for the document
+    boundary mask) and positions; a document cut at a row boundary carries
+    on in the next row with its positions restarting at 0, so no position
+    reaches max_length. A token shard is never copied: each row is read from
+    the mapping when it is requested.
+    """
+    def __init__(self, data_path: str, tokenizer: BPETokenizer, max_length: int = 512):
+        super().__init__(data_path, tokenizer, max_length)
+        self.eos_id = self.tokenizer.special_tokens['<EOS>']
+        if self.shard is not None:
+            self._index_shard()
+        else:
+            self.tokens, self.document_ids = self._pack()
+            self.num_tokens = self.tokens.numel()
+    
+    def _pack(self):
+        """Tokenize every document into one flat stream of (token, document)"""
+        tokens, document_ids = [], []
+        for document, item in enumerate(self.data):
+            document_tokens = self.tokenizer.encode(item.get('content', ''))
+            if not document_tokens:
+                continue
+            document_tokens.append(self.eos_id)
+            tokens.extend(document_tokens)
+            document_ids.extend([document] * len(document_tokens))
+        return torch.tensor(tokens, dtype=torch.long), torch.tensor(document_ids, dtype=torch.long)
+    
+    def _index_shard(self):
+        """Where each non-empty shard document, closed with <EOS>, starts in the stream"""
+        lengths = self.shard.lengths()
+        self.stream_documents = np.flatnonzero(lengths)
+        self.stream_lengths = lengths[self.stream_documents]
+        spans = self.stream_lengths + 1
+        self.stream_starts = np.cumsum(spans) - spans
+        self.num_tokens = int(spans.sum())
+    
+    def _shard_row(self, start: int, end: int):
+        """Tokens and document ids of stream[start:end], gathered from the shard mapping"""
+        stream = np.arange(start, end)
+        document = np.searchsorted(self.stream_starts, stream, side='right') - 1
+        within = stream - self.stream_starts[document]
+        lengths = self.stream_lengths[document]
+        offsets = self.shard.offsets[self.stream_documents[document]]
+        tokens = np.where(
+            within < lengths,
+            self.shard.tokens[offsets + np.minimum(within, lengths - 1)],
+            self.eos_id
+        )
+        return (
+            torch.from_numpy(tokens.astype(np.int64)),
+            torch.from_numpy(self.stream_documents[document].astype(np.int64))
+        )
+    
+    def __len__(self):
+        return -(-self.num_tokens // self.max_length)
+    
+    def __getitem__(self, idx):
+        start = idx * self.max_length
+        end = min(start + self.max_length, self.num_tokens)
+        if self.shard is not None:
+            tokens, document_ids = self._shard_row(start, end)
         else:
-            tokens.extend([0] * (self.max_length - len(tokens)))  # Pad with 0
+            tokens, document_ids = self.tokens[start:end], self.document_ids[start:end]
+        
+        # Pad the last row; padding forms its own document (id -1)
+        missing = self.max_length - tokens.numel()
+        if missing:
+            tokens = F.pad(tokens, (0, missing), value=self.tokenizer.special_tokens['<PAD>'])
+            document_ids = F.pad(document_ids, (0, missing), value=-1)
+        
+        # Positions count from each document start, and from the row start
+        boundaries = document_ids[1:] != document_ids[:-1]
+        offsets = torch.arange(self.max_length)
+        starts = torch.where(torch.cat([torch.ones(1, dtype=torch.bool), boundaries]), offsets, 0)
+        position_ids = offsets - starts.cummax(0).values
+        position_ids[document_ids < 0] = 0
         
-        # Create input and target (shifted by 1 for language modeling)
-        input_ids = torch.tensor(tokens[:-1], dtype=torch.long)
-        target_ids = torch.tensor(tokens[1:], dtype=torch.long)
+        # No target crosses a document boundary or lands on padding
+        target_ids = tokens[1:].clone()
+        target_ids[boundaries | (document_ids[1:] < 0)] = IGNORE_INDEX
         
         return {
-            'input_ids': input_ids,
+            'input_ids': tokens[:-1],
             'target_ids': target_ids,
-            'metadata': item.get('metadata', {})
+            'document_ids': document_ids[:-1],
+            'position_ids': position_ids[:-1]
         }
 
+class LiveDataWriter:
+    """
+    Appends freshly crawled items to JSONL shards in live_dir for
+    StreamingWebDataset to tail. Each line is written whole and flushed, and
+    a new shard file is started every max_items_per_shard items.
+    """
+    def __init__(self, live_dir: str = 'live_data', max_items_per_shard: int = 10000, prefix: str = 'web_'):
+        self.live_dir = Path(live_dir)
+        self.live_dir.mkdir(parents=True, exist_ok=True)
+        self.max_items_per_shard = max_items_per_shard
+        self.prefix = prefix
+        self._pattern = re.compile(rf'^{re.escape(prefix)}(\d+)\.jsonl$')
+        existing = [int(m.group(1)) for m in map(self._pattern.match, os.listdir(self.live_dir)) if m]
+        self._shard_index = max(existing, default=-1)
+        self._file = None
+        self._items_in_shard = 0
+    
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        self._shard_index += 1
+        self._file = open(self.live_dir / f"{self.prefix}{self._shard_index:06d}.jsonl", 'a', encoding='utf-8')
+        self._items_in_shard = 0
+    
+    def write(self, item: Dict[str, Any]):
+        if self._file is None or self._items_in_shard >= self.max_items_per_shard:
+            self._next_shard()
+        self._file.write(json.dumps(item, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._items_in_shard += 1
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class StreamingWebDataset(IterableDataset):
+    """
+    Endless stream mixing a historical corpus with freshly crawled data.
+    
+    historical_paths are JSONL files, processed-data JSON files or token shard
+    directories; they are cycled through one document at a time (a plain JSON
+    file has to be loaded whole, the others are not). live_dir is tailed:
+    complete new lines of its JSONL files (see LiveDataWriter) and new token
+    shard directories are picked up as they appear, checked every
+    poll_interval seconds. Each item comes from the fresh data with
+    probability fresh_ratio while any is waiting, otherwise from the
+    historical corpus. Only the documents in flight are held in memory.
+    Documents under two tokens have no target and are skipped.
+    
+    Items are WebDataset items; with several DataLoader workers each worker
+    reads every source but keeps only its share of the documents.
+    """
+    def __init__(
+        self,
+        historical_paths: List[str],
+        tokenizer: BPETokenizer,
+        live_dir: Optional[str] = None,
+        max_length: int = 512,
+        fresh_ratio: float = 0.25,
+        poll_interval: float = 5.0,
+        dynamic_padding: bool = False,
+        seed: int = 0
+    ):
+        self.historical_paths = [Path(path) for path in historical_paths]
+        self.tokenizer = tokenizer
+        self.live_dir = Path(live_dir) if live_dir else None
+        self.max_length = max_length
+        self.fresh_ratio = fresh_ratio
+        self.poll_interval = poll_interval
+        self.dynamic_padding = dynamic_padding
+        self.seed = seed
+    
+    def _encode_item(self, item: Dict[str, Any]):
+        return self.tokenizer.encode(item.get('content', ''))[:self.max_length], item.get('metadata', {})
+    
+    def _read_source(self, path: Path, owned):
+        """(tokens, metadata) of each document in one historical source that this worker owns"""
+        if is_token_shard(path):
+            shard = TokenShard(path)
+            for idx in range(len(shard)):
+                if owned():
+                    yield shard[idx][:self.max_length].tolist(), {}
+        elif path.suffix == '.jsonl':
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip() and owned():
+                        yield self._encode_item(json.loads(line))
+        elif path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data:
+                if owned():
+                    yield self._encode_item(item)
+        else:
+            logger.warning(f"Data source {path} not found, skipping it")
+    
+    def _historical_documents(self, owned):
+        """Cycle over the historical corpus; yields None when it is empty"""
+        while True:
+            found = False
+            for path in self.historical_paths:
+                for document in self._read_source(path, owned):
+                    found = True
+                    yield document
+            if not found:
+                yield None
+    
+    def _fresh_documents(self, owned):
+        """Tail live_dir; yields None after each scan and whenever no scan is due"""
+        offsets = {}  # JSONL file -> bytes already consumed
+        seen_shards = set()
+        last_scan = 0.0
+        while True:
+            if self.live_dir is None or time.time() - last_scan < self.poll_interval:
+                yield None
+                continue
+            last_scan = time.time()
+            if self.live_dir.is_dir():
+                for path in sorted(self.live_dir.iterdir()):
+                    if path.suffix == '.jsonl':
+                        with open(path, 'rb') as f:
+                            f.seek(offsets.get(path, 0))
+                            for line in f:
+                                if not line.endswith(b'\n'):
+                                    break  # the writer is mid-line; read it on a later scan
+                                offsets[path] = offsets.get(path, 0) + len(line)
+                                if line.strip() and owned():
+                                    yield self._encode_item(json.loads(line))
+                    elif path not in seen_shards and is_token_shard(path):
+                        seen_shards.add(path)
+                        yield from self._read_source(path, owned)
+            # Caught up; without this a zero poll_interval would rescan forever
+            yield None
+    
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        
+        def ownership():
+            # Documents are dealt round-robin to the workers, separately per stream
+            counter = itertools.count()
+            return lambda: next(counter) % num_workers == worker_id
+        
+        historical = self._historical_documents(ownership())
+        fresh = self._fresh_documents(ownership())
+        rng = random.Random(self.seed + worker_id)
+        pad_token_id = self.tokenizer.special_tokens['<PAD>']
+        
+        while True:
+            streams = (fresh, historical) if rng.random() < self.fresh_ratio else (historical, fresh)
+            document = next(streams[0]) or next(streams[1])
+            if document is None:
+                time.sleep(self.poll_interval)
+                continue
+            tokens, metadata = document
+            if len(tokens) < 2:
+                continue
+            yield make_lm_example(tokens, self.max_length, pad_token_id, metadata, self.dynamic_padding)
+
+class MasterWeights:
+    """
+    fp32 master copies of low-precision (bf16) model parameters.
+    The optimizer steps the master copies; the model keeps the bf16 weights
+    that forward and backward read.
+    """
+    def __init__(self, named_parameters):
+        named_parameters = [(name, p) for name, p in named_parameters if p.requires_grad]
+        self.names = [name for name, _ in named_parameters]
+        self.model_params = [p for _, p in named_parameters]
+        self.master_params = [
+            p.detach().float().clone().requires_grad_(True) for p in self.model_params
+        ]
+    
+    def copy_grads_to_master(self):
+        """Hand the bf16 gradients to the fp32 master copies"""
+        for model_param, master_param in zip(self.model_params, self.master_params):
+            master_param.grad = model_param.grad.float() if model_param.grad is not None else None
+            model_param.grad = None
+    
+    def state_dict(self):
+        """fp32 master weights keyed by parameter name"""
+        return dict(zip(self.names, self.master_params))
+    
+    def load_state_dict(self, state_dict):
+        """Restore the master weights and the bf16 model weights from them"""
+        with torch.no_grad():
+            for name, master_param in zip(self.names, self.master_params):
+                master_param.copy_(state_dict[name])
+        self.copy_master_to_model()
+    
+    def copy_master_to_model(self):
+        """Write the updated master weights back into the model"""
+        with torch.no_grad():
+            for model_param, master_param in zip(self.model_params, self.master_params):
+                model_param.copy_(master_param)
+
+class AsyncCheckpointer:
+    """
+    Snapshot-then-write checkpointing. save() copies the training state into
+    reusable host buffers (pinned when it lives on the GPU) and returns; a
+    worker thread writes the checkpoint into a temporary directory, renames
+    it into place and deletes all but the newest keep_last checkpoints.
+    A failed write is logged and raised from wait() (or the returned Future).
+    close() stops the worker thread; a later save() starts a new one.
+    """
+    def __init__(self, checkpoint_dir='checkpoints', keep_last: int = 3, prefix: str = 'sathik_checkpoint_'):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.keep_last = keep_last
+        self.prefix = prefix
+        self._host_buffers = {}
+        self._worker = None
+        self._pending = None
+        self._pending_step = None
+    
+    def _to_host(self, value, key=()):
+        """Copy tensors in a nested state into host buffers reused across saves"""
+        if isinstance(value, torch.Tensor):
+            buffer = self._host_buffers.get(key)
+            if buffer is None or buffer.shape != value.shape or buffer.dtype != value.dtype:
+                buffer = torch.empty(
+                    value.shape, dtype=value.dtype, device='cpu',
+                    pin_memory=value.is_cuda
+                )
+                self._host_buffers[key] = buffer
+            buffer.copy_(value.detach(), non_blocking=value.is_cuda)
+            return buffer
+        if isinstance(value, dict):
+            return {k: self._to_host(v, key + (k,)) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._to_host(v, key + (i,)) for i, v in enumerate(value))
+        return copy.deepcopy(value)
+    
+    def save(self, step: int, model_state, training_state, tokenizer, master_state=None, metadata=None):
+        """Snapshot the state and queue the write; returns a Future for the checkpoint path"""
+        # The host buffers are reused, so the previous write has to finish first
+        previous_step = self._pending_step
+        try:
+            self.wait()
+        except Exception as e:
+            logger.warning(f"Checkpoint for step {previous_step} failed ({e}); step {step} supersedes it")
+        
+        snapshot = {
+            'model': self._to_host(model_state, ('model',)),
+            'master_weights': self._to_host(master_state, ('master_weights',)) if master_state else None,
+            'training_state': self._to_host(training_state, ('training_state',)),
+            'tokenizer': copy.deepcopy(tokenizer)
+        }
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()  # non-blocking device-to-host copies must land before the write
+        
+        if self._worker is None:
+            self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint-writer')
+        self._pending = self._worker.submit(self._write, step, snapshot, metadata or {})
+        self._pending_step = step
+        return self._pending
+    
+    def _write(self, step: int, snapshot, metadata):
+        final_path = self.checkpoint_dir / f"{self.prefix}{step}"
+        tmp_path = self.checkpoint_dir / f".{self.prefix}{step}.tmp"
+        
+        try:
+            if tmp_path.exists():
+                shutil.rmtree(tmp_path)
+            tmp_path.mkdir(parents=True)
+            
+            save_sharded_state_dict(snapshot['model'], tmp_path / 'model', metadata)
+            if snapshot['master_weights'] is not None:
+                save_sharded_state_dict(snapshot['master_weights'], tmp_path / 'master_weights', metadata)
+            torch.save(snapshot['training_state'], tmp_path / 'training_state.pt')
+            snapshot['tokenizer'].save(str(tmp_path / 'tokenizer.pkl'))
+            
+            # A checkpoint directory only ever appears complete
+            if final_path.exists():
+                shutil.rmtree(final_path)
+            os.replace(tmp_path, final_path)
+            logger.info(f"Checkpoint saved: {final_path}")
+            
+            self._prune()
+            return final_path
+        
+        except Exception as e:
+            logger.error(f"Error saving checkpoint: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+    
+    def checkpoints(self) -> List[Path]:
+        """Completed checkpoint directories, oldest first"""
+        pattern = re.compile(rf'^{re.escape(self.prefix)}(\d+)$')
+        found = []
+        if self.checkpoint_dir.exists():
+            for path in self.checkpoint_dir.iterdir():
+                match = pattern.match(path.name)
+                if match and path.is_dir():
+                    found.append((int(match.group(1)), path))
+        return [path for _, path in sorted(found)]
+    
+    def _prune(self):
+        if self.keep_last <= 0:
+            return
+        for path in self.checkpoints()[:-self.keep_last]:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Removed old checkpoint: {path}")
+    
+    def wait(self):
+        """Block until the in-flight write (if any) has finished; re-raises its error"""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            return pending.result()
+        return None
+    
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self._worker is not None:
+                self._worker.shutdown(wait=True)
+                self._worker = None
+
 class LiveTrainingLoop:
     """Advanced live training loop for Sathik AI"""
     
@@ -98,6 +631,21 @@ class LiveTrainingLoop:
             'self_correction_count': 0
         }
         
+        # Background checkpoint writer; state_lock keeps snapshots off a half-applied step
+        self.state_lock = threading.RLock()
+        self.checkpointer = AsyncCheckpointer(
+            self.config.get('checkpoint_dir', 'checkpoints'),
+            keep_last=self.config.get('keep_last_checkpoints', 3)
+        )
+        
+        # Crawled items are appended here for the streaming dataset to train on (nothing reads them otherwise)
+        self.live_data_writer = None
+        if self.config.get('stream_live_data', False):
+            self.live_data_writer = LiveDataWriter(
+                self.config.get('live_data_dir', 'live_data'),
+                max_items_per_shard=self.config.get('live_shard_max_items', 10000)
+            )
+        
         # Scheduler for periodic tasks
         self._setup_scheduler()
         
@@ -115,12 +663,27 @@ class LiveTrainingLoop:
             num_heads=self.config.get('num_heads', 32),
             num_layers=self.config.get('num_layers', 48),
             num_experts=self.config.get('num_experts', 128),
-            top_k=self.config.get('top_k', 16)
+            top_k=self.config.get('top_k', 16),
+            gradient_checkpointing=self.config.get('gradient_checkpointing', True),
+            checkpoint_granularity=self.config.get('checkpoint_granularity', 'block')
         ).to(self.device)
         
+        # Mixed precision: autocast dtype for forward passes, optional bf16 weights with fp32 masters
+        self.autocast_dtype = resolve_autocast_dtype(self.config.get('precision', 'fp32'), self.device.type)
+        self.master_weights = None
+        if self.config.get('master_weights', False):
+            # Only the weights go to bf16; the RoPE tables and other buffers stay fp32
+            cast_parameters(self.model, torch.bfloat16)
+            self.master_weights = MasterWeights(self.model.named_parameters())
+            # fp32 inputs (memory vectors) still need casting to the bf16 weights
+            self.autocast_dtype = self.autocast_dtype or torch.bfloat16
+        
+        # fp16 gradients underflow without loss scaling; bf16 and fp32 need none
+        self.grad_scaler = torch.amp.GradScaler(self.device.type, enabled=self.autocast_dtype == torch.float16)
+        
         # Initialize optimizer with advanced scheduling
         self.optimizer = optim.AdamW(
-            self.model.parameters(),
+            self.master_weights.master_params if self.master_weights else self.model.parameters(),
             lr=self.config.get('learning_rate', 1e-4),
             weight_decay=self.config.get('weight_decay', 0.01),
             betas=(0.9, 0.95)
@@ -286,34 +849,67 @@ class LiveTrainingLoop:
         except Exception as e:
             logger.error(f"Error during memory consolidation: {e}")
     
-    def _save_checkpoint(self):
-        """Save model checkpoint"""
+    def _save_checkpoint(self, wait: bool = False):
+        """
+        Checkpoint in the background: a directory with model/ (sharded,
+        mmap-loadable weights), master_weights/ (fp32 masters, if used),
+        training_state.pt (optimizer, scheduler, counters) and tokenizer.pkl.
+        Only the snapshot blocks training; pass wait=True to block until the
+        checkpoint is on disk.
+        """
         logger.info("Saving model checkpoint...")
         
         try:
-            checkpoint = {
-                'model_state_dict': self.model.state_dict(),
-                'optimizer_state_dict': self.optimizer.state_dict(),
-                'scheduler_state_dict': self.scheduler.state_dict(),
-                'training_step': self.training_step,
-                'epoch': self.epoch,
-                'best_loss': self.best_loss,
-                'metrics': self.metrics,
-                'config': self.config
-            }
-            
-            checkpoint_path = f"checkpoints/sathik_checkpoint_{self.training_step}.pt"
-            Path("checkpoints").mkdir(exist_ok=True)
-            torch.save(checkpoint, checkpoint_path)
-            
-            # Save tokenizer
-            self.tokenizer.save(f"checkpoints/sathik_tokenizer_{self.training_step}.pkl")
-            
-            logger.info(f"Checkpoint saved: {checkpoint_path}")
+            # Snapshot between optimizer steps (the scheduler thread also calls this)
+            with self.state_lock:
+                training_state = {
+                    'optimizer_state_dict': self.optimizer.state_dict(),
+                    'scheduler_state_dict': self.scheduler.state_dict(),
+                    'grad_scaler_state_dict': self.grad_scaler.state_dict(),
+                    'training_step': self.training_step,
+                    'epoch': self.epoch,
+                    'best_loss': self.best_loss,
+                    'metrics': self.metrics,
+                    'config': self.config
+                }
+                self.checkpointer.save(
+                    self.training_step,
+                    model_state=self.model.state_dict(),
+                    # The model holds bf16 weights; keep the fp32 masters for resuming
+                    master_state=self.master_weights.state_dict() if self.master_weights else None,
+                    training_state=training_state,
+                    tokenizer=self.tokenizer,
+                    metadata={'training_step': str(self.training_step), 'epoch': str(self.epoch)}
+                )
+            if wait:
+                self.checkpointer.wait()
             
         except Exception as e:
             logger.error(f"Error saving checkpoint: {e}")
     
+    def load_checkpoint(self, checkpoint_path: str):
+        """Resume from a checkpoint directory written by _save_checkpoint"""
+        checkpoint_path = Path(checkpoint_path)
+        logger.info(f"Loading checkpoint from {checkpoint_path}")
+        
+        self.model.load_state_dict(load_sharded_state_dict(checkpoint_path / 'model'))
+        if self.master_weights and (checkpoint_path / 'master_weights').exists():
+            self.master_weights.load_state_dict(load_sharded_state_dict(checkpoint_path / 'master_weights'))
+        
+        training_state = torch.load(checkpoint_path / 'training_state.pt', map_location=self.device, weights_only=False)
+        self.optimizer.load_state_dict(training_state['optimizer_state_dict'])
+        self.scheduler.load_state_dict(training_state['scheduler_state_dict'])
+        if training_state.get('grad_scaler_state_dict'):
+            self.grad_scaler.load_state_dict(training_state['grad_scaler_state_dict'])
+        self.training_step = training_state['training_step']
+        self.epoch = training_state['epoch']
+        self.best_loss = training_state['best_loss']
+        self.metrics = training_state['metrics']
+        
+        tokenizer_path = checkpoint_path / 'tokenizer.pkl'
+        if tokenizer_path.exists():
+            self.tokenizer.load(str(tokenizer_path))
+    
     def _evaluate_performance(self):
         """Evaluate model performance"""
         logger.info("Evaluating model performance...")
@@ -330,7 +926,8 @@ class LiveTrainingLoop:
                     max_length=50,
                     temperature=0.8,
                     top_k=40,
-                    top_p=0.9
+                    top_p=0.9,
+                    autocast_dtype=self.autocast_dtype
                 )
                 
                 # Decode generated text
@@ -357,6 +954,19 @@ class LiveTrainingLoop:
         input_ids = batch['input_ids'].to(self.device)
         target_ids = batch['target_ids'].to(self.device)
         
+        # A batch with every target ignored has no loss (cross_entropy would return NaN)
+        if not (target_ids != IGNORE_INDEX).any():
+            logger.warning(f"Skipping step {self.training_step}: batch has no targets")
+            return None
+        
+        # Packed rows attend within their own documents; padded rows mask their padding
+        position_ids = None
+        if 'document_ids' in batch:
+            attention_mask = build_document_attention_mask(batch['document_ids'].to(self.device))
+            position_ids = batch['position_ids'].to(self.device)
+        else:
+            attention_mask = batch['attention_mask'].to(self.device)
+        
         # Prepare memory vectors
         memory_vectors = {
             'short_term': torch.randn(input_ids.size(0), self.config.get('d_model', 2048)).to(self.device),
@@ -364,27 +974,41 @@ class LiveTrainingLoop:
         }
         
         # Forward pass
-        outputs = self.model(
-            input_ids=input_ids,
-            memory_vectors=memory_vectors,
-            return_dict=True
-        )
+        with autocast_context(self.device.type, self.autocast_dtype):
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                memory_vectors=memory_vectors,
+                return_dict=True
+            )
         
-        # Calculate language modeling loss
-        logits = outputs['outputs']['language_modeling']
-        loss = F.cross_entropy(logits.view(-1, logits.size(-1)), target_ids.view(-1))
+        # Calculate language modeling loss (in fp32), skipping padding and document boundaries
+        logits = outputs['outputs']['language_modeling'].float()
+        loss = F.cross_entropy(
+            logits.view(-1, logits.size(-1)), target_ids.view(-1), ignore_index=IGNORE_INDEX
+        )
         
         # Add load balancing loss
         total_loss = loss + outputs['load_balancing_loss']
         
-        # Backward pass
-        total_loss.backward()
+        # Backward pass (loss-scaled under fp16)
+        self.grad_scaler.scale(total_loss).backward()
         
-        # Gradient clipping
-        torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
+        # Gradient clipping (on the fp32 masters when the model holds bf16 weights), after unscaling
+        if self.master_weights:
+            self.master_weights.copy_grads_to_master()
+        self.grad_scaler.unscale_(self.optimizer)
+        if self.master_weights:
+            torch.nn.utils.clip_grad_norm_(self.master_weights.master_params, max_norm=1.0)
+        else:
+            torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
         
-        # Optimizer step
-        self.optimizer.step()
+        # Optimizer step (skipped by the scaler when fp16 gradients overflowed)
+        self.grad_scaler.step(self.optimizer)
+        self.grad_scaler.update()
+        if self.master_weights:
+            self.master_weights.copy_master_to_model()
         self.scheduler.step()
         
         # Update metrics
@@ -413,21 +1037,23 @@ class LiveTrainingLoop:
         
         for batch_idx, batch in enumerate(dataloader):
             # Train step
-            step_results = self.train_step(batch)
-            epoch_losses.append(step_results['loss'])
-            
-            # Log progress
-            if batch_idx % 100 == 0:
-                logger.info(
-                    f"Epoch {self.epoch}, Step {batch_idx}: "
-                    f"Loss = {step_results['loss']:.4f}, "
-                    f"LR = {step_results['learning_rate']:.2e}"
-                )
+            with self.state_lock:
+                step_results = self.train_step(batch)
+            if step_results is not None:
+                epoch_losses.append(step_results['loss'])
+                
+                # Log progress
+                if batch_idx % 100 == 0:
+                    logger.info(
+                        f"Epoch {self.epoch}, Step {batch_idx}: "
+                        f"Loss = {step_results['loss']:.4f}, "
+                        f"LR = {step_results['learning_rate']:.2e}"
+                    )
             
             # Process any new web data
             self._process_queued_data()
         
-        avg_loss = np.mean(epoch_losses)
+        avg_loss = np.mean(epoch_losses) if epoch_losses else float('nan')
         
         # Update best loss
         if avg_loss < self.best_loss:
@@ -452,6 +1078,10 @@ class LiveTrainingLoop:
                     'importance': new_item.get('quality_score', 0.5)
                 })
                 
+                # Hand it to training through the live data shards
+                if self.live_data_writer is not None:
+                    self.live_data_writer.write(new_item)
+                
                 processed_count += 1
                 
             except queue.Empty:
@@ -462,26 +1092,52 @@ class LiveTrainingLoop:
         logger.info("🔥 Starting Sathik AI Live Training Loop 🔥")
         
         # Initialize dataset and dataloader
-        dataset = WebDataset(data_path, self.tokenizer)
-        dataloader = DataLoader(
-            dataset,
-            batch_size=self.config.get('batch_size', 8),
-            shuffle=True,
-            num_workers=2
-        )
+        max_length = self.config.get('max_seq_length', 512)
+        batch_size = self.config.get('batch_size', 8)
+        pad_collate_fn = functools.partial(pad_collate, pad_token_id=self.tokenizer.special_tokens['<PAD>'])
+        if self.config.get('stream_live_data', False):
+            # Endless stream of the corpus mixed with freshly crawled data; epochs are fixed step counts
+            dataset = StreamingWebDataset(
+                [data_path],
+                self.tokenizer,
+                live_dir=self.config.get('live_data_dir', 'live_data'),
+                max_length=max_length,
+                fresh_ratio=self.config.get('fresh_data_ratio', 0.25),
+                dynamic_padding=True
+            )
+            dataloader = DataLoader(dataset, batch_size=batch_size, collate_fn=pad_collate_fn, num_workers=2)
+        elif self.config.get('pack_sequences', False):
+            dataset = PackedWebDataset(data_path, self.tokenizer, max_length=max_length)
+            dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=2)
+        elif self.config.get('bucket_by_length', False):
+            # Similar-length items share a batch, padded only to the batch max
+            dataset = WebDataset(data_path, self.tokenizer, max_length=max_length, dynamic_padding=True)
+            dataloader = DataLoader(
+                dataset,
+                batch_sampler=LengthBucketedBatchSampler(dataset.item_lengths(), batch_size),
+                collate_fn=pad_collate_fn,
+                num_workers=2
+            )
+        else:
+            dataset = WebDataset(data_path, self.tokenizer, max_length=max_length)
+            dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=2)
         
         # Start scheduler thread
         scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
         scheduler_thread.start()
         
         # Main training loop
+        batches = iter(dataloader) if self.config.get('stream_live_data', False) else None
         try:
             for epoch in range(num_epochs):
                 self.epoch = epoch
                 logger.info(f"Starting epoch {epoch + 1}/{num_epochs}")
                 
-                # Train epoch
-                avg_loss = self.train_epoch(dataloader)
+                # Train epoch (the live stream keeps its position from one epoch to the next)
+                if batches is not None:
+                    avg_loss = self.train_epoch(itertools.islice(batches, self.config.get('steps_per_epoch', 1000)))
+                else:
+                    avg_loss = self.train_epoch(dataloader)
                 
                 logger.info(f"Epoch {epoch + 1} completed. Average loss: {avg_loss:.4f}")
                 
@@ -495,7 +1151,9 @@ class LiveTrainingLoop:
             logger.error(f"Training error: {e}")
         finally:
             logger.info("Training loop ended")
-            self._save_checkpoint()  # Final checkpoint
+            self._save_checkpoint(wait=True)  # Final checkpoint; the writer stays up for scheduled saves
+            if self.live_data_writer is not None:
+                self.live_data_writer.close()
     
     def _run_scheduler(self):
         """Run the periodic task scheduler"""
@@ -514,8 +1172,22 @@ TRAINING_CONFIG = {
     'learning_rate': 1e-4,
     'weight_decay': 0.01,
     'batch_size': 8,
+    'max_seq_length': 512,
+    'pack_sequences': True,  # concatenate documents into full rows instead of padding each one
+    'bucket_by_length': True,  # without packing: batch similar-length items, padded to the batch max
+    'stream_live_data': False,  # stream the corpus mixed with crawled data instead of fixed epochs over it
+    'live_data_dir': 'live_data',
+    'live_shard_max_items': 10000,
+    'fresh_data_ratio': 0.25,  # share of streamed items taken from fresh crawled data, when available
+    'steps_per_epoch': 1000,  # epoch length when streaming
     'scheduler_t0': 1000,
-    'min_lr': 1e-6
+    'min_lr': 1e-6,
+    'gradient_checkpointing': True,
+    'checkpoint_granularity': 'block',  # 'block' or 'moe'
+    'precision': 'fp32',  # 'fp32', 'bf16', 'fp16' (with loss scaling) or 'auto' (bf16 where supported)
+    'master_weights': False,  # bf16 model weights with fp32 master copies in the optimizer
+    'checkpoint_dir': 'checkpoints',
+    'keep_last_checkpoints': 3  # older checkpoint directories are deleted
 }
 
 # Example usage
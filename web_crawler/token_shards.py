@@ -0,0 +1,155 @@
+"""
+Pre-tokenized, memory-mapped training shards.
+
+BPETokenizer.encode is pure Python, so tokenizing documents while training
+costs more than the training step itself. The documents are tokenized once,
+offline, into a shard directory:
+
+    tokens.bin     every document's token ids back to back (uint16, or uint32
+                   when the vocabulary does not fit in 16 bits)
+    offsets.bin    int64 start of each document in tokens.bin, plus the end
+    shard.json     {"dtype", "num_documents", "num_tokens", "vocab_size"}
+
+Readers map both files with np.memmap: a document is a zero-copy slice, and
+every DataLoader worker (and every process) reading the shard shares the
+page cache.
+
+    python web_crawler/token_shards.py processed_data.json shards/web_0000 --tokenizer sathik_tokenizer.pkl
+"""
+import argparse
+import array
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+
+import numpy as np
+
+TOKENS_FILE = 'tokens.bin'
+OFFSETS_FILE = 'offsets.bin'
+INDEX_FILE = 'shard.json'
+
+def token_dtype(vocab_size: int) -> np.dtype:
+    """Narrowest unsigned dtype holding every token id"""
+    return np.dtype(np.uint16) if vocab_size <= 2 ** 16 else np.dtype(np.uint32)
+
+def write_token_shard(texts: Iterable[str], tokenizer, directory: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Tokenize texts into a shard directory and return its index. Documents
+    are streamed to disk one at a time; the index is written last, so a
+    directory without one is an incomplete shard.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    vocab_size = max(tokenizer.vocab.values()) + 1
+    dtype = token_dtype(vocab_size)
+
+    offsets = array.array('q', [0])
+    tmp_tokens = directory / (TOKENS_FILE + '.tmp')
+    with open(tmp_tokens, 'wb') as f:
+        for text in texts:
+            tokens = np.asarray(tokenizer.encode(text), dtype=dtype)
+            tokens.tofile(f)
+            offsets.append(offsets[-1] + tokens.size)
+
+    tmp_offsets = directory / (OFFSETS_FILE + '.tmp')
+    with open(tmp_offsets, 'wb') as f:
+        np.frombuffer(offsets, dtype=np.int64).tofile(f)
+    os.replace(tmp_tokens, directory / TOKENS_FILE)
+    os.replace(tmp_offsets, directory / OFFSETS_FILE)
+
+    index = {
+        'dtype': dtype.name,
+        'num_documents': len(offsets) - 1,
+        'num_tokens': offsets[-1],
+        'vocab_size': vocab_size
+    }
+    tmp_index = directory / (INDEX_FILE + '.tmp')
+    with open(tmp_index, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_index, directory / INDEX_FILE)
+    return index
+
+def pretokenize_json(data_path: Union[str, Path], tokenizer, directory: Union[str, Path]) -> Dict[str, Any]:
+    """Shard the 'content' of every item in a processed-data JSON file (RawDataProcessor output)"""
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return write_token_shard((item.get('content', '') for item in data), tokenizer, directory)
+
+def is_token_shard(path: Union[str, Path]) -> bool:
+    """Whether path is a complete token shard directory"""
+    return (Path(path) / INDEX_FILE).is_file()
+
+class TokenShard:
+    """
+    Read-only view of a shard directory. The files are mapped on first
+    access, and the mappings are not pickled, so a shard handed to
+    DataLoader workers maps the files again in each worker instead of
+    copying them.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        with open(self.directory / INDEX_FILE, 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        self._tokens = None
+        self._offsets = None
+
+    def _map(self):
+        if self._tokens is None:
+            self._offsets = np.memmap(self.directory / OFFSETS_FILE, dtype=np.int64, mode='r')
+            # np.memmap cannot map an empty file
+            self._tokens = (
+                np.memmap(self.directory / TOKENS_FILE, dtype=self.index['dtype'], mode='r')
+                if self.index['num_tokens'] else np.empty(0, dtype=self.index['dtype'])
+            )
+
+    def __getstate__(self):
+        return {**self.__dict__, '_tokens': None, '_offsets': None}
+
+    def __len__(self):
+        return self.index['num_documents']
+
+    @property
+    def num_tokens(self) -> int:
+        return self.index['num_tokens']
+
+    @property
+    def tokens(self) -> np.ndarray:
+        """Every token id in the shard, as one flat mapped array"""
+        self._map()
+        return self._tokens
+
+    @property
+    def offsets(self) -> np.ndarray:
+        self._map()
+        return self._offsets
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """Token ids of one document, a view into the mapping"""
+        if not 0 <= idx < len(self):
+            raise IndexError(f"document {idx} out of range for a shard of {len(self)}")
+        return self.tokens[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def lengths(self) -> np.ndarray:
+        """Token count of every document"""
+        return np.diff(self.offsets)
+
+def main(argv: List[str] = None):
+    from web_crawler.tokenizer import BPETokenizer
+
+    parser = argparse.ArgumentParser(description='Pre-tokenize processed web data into a memory-mapped shard')
+    parser.add_argument('data_path', help='Processed data JSON (a list of items with "content")')
+    parser.add_argument('output_dir', help='Shard directory to write')
+    parser.add_argument('--tokenizer', required=True, help='Saved BPETokenizer (.pkl)')
+    args = parser.parse_args(argv)
+
+    tokenizer = BPETokenizer()
+    tokenizer.load(args.tokenizer)
+    index = pretokenize_json(args.data_path, tokenizer, args.output_dir)
+    print(f"Wrote {index['num_documents']} documents, {index['num_tokens']} {index['dtype']} tokens to {args.output_dir}")
+
+if __name__ == '__main__':
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    main()
@@ -150,6 +150,10 @@ class BPETokenizer:
         
         return text
     
+    def stream_decoder(self) -> 'StreamingDecoder':
+        """Incremental decoder for text produced one token at a time"""
+        return StreamingDecoder(self)
+    
     def save(self, filepath: str):
         """Save tokenizer to file"""
         tokenizer_data = {
@@ -182,6 +186,35 @@ class BPETokenizer:
         """Tokenize a batch of texts"""
         return [self.encode(text) for text in texts]
 
+class StreamingDecoder:
+    """
+    Incremental BPETokenizer.decode: feed token ids one at a time and get back
+    only the new text. Concatenating every step() result gives the same
+    string as decode() on the whole sequence.
+    """
+    
+    def __init__(self, tokenizer: BPETokenizer):
+        self.id_to_token = {v: k for k, v in tokenizer.vocab.items()}
+        self._started = False
+        self._pending_space = False
+    
+    def step(self, token_id: int) -> str:
+        """Text added by one more token"""
+        text = self.id_to_token.get(token_id, '<UNK>').replace('</w>', ' ')
+        text = re.sub(r'\s+', ' ', text)
+        
+        body = text.strip()
+        if not body:
+            self._pending_space = self._pending_space or self._started
+            return ''
+        
+        # decode() collapses whitespace and strips the ends, so a word break is
+        # only emitted once more text follows it
+        separator = ' ' if self._started and (self._pending_space or text[0] == ' ') else ''
+        self._started = True
+        self._pending_space = text[-1] == ' '
+        return separator + body
+
 # Example usage and testing
 if __name__ == "__main__":
     # Sample training data
@@ -210,6 +243,10 @@ if __name__ == "__main__":
     print(f"\nOriginal: {test_text}")
     print(f"Encoded: {encoded}")
     print(f"Decoded: {decoded}")
+    
+    # Incremental decoding matches decode()
+    decoder = tokenizer.stream_decoder()
+    assert ''.join(decoder.step(token_id) for token_id in encoded) == decoded
     print(f"Vocabulary size: {tokenizer.get_vocab_size()}")
     
     # Save tokenizer